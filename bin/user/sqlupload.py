@@ -39,10 +39,14 @@ VERSION = "0.4"
 
 import os
 import os.path
-import configobj
+import importlib
 import time
-import html.parser
 import json
+import functools
+import threading
+import re
+import collections
+import itertools
 
 try:
     # Python 3
@@ -62,27 +66,66 @@ if __name__ == '__main__':
     import sys
     sys.path.append('/usr/share/weewx')
 
-try:
-    try:
-        from six.moves import cPickle as pickle
-    except ImportError:
-        import pickle
-    import weeutil.ftpupload
-    has_pickle = True
-except ImportError:
-    has_pickle = False
-
 import weewx
 import weewx.reportengine
 import weewx.restx
 import weewx.manager
 import weeutil.weeutil
 import weeutil.config
-import weedb.mysql
+import weedb
+# Note: `weedb.mysql` including the MySQL driver, the modules to read
+#       the state file of the FTP upload generator, and the modules of
+#       optional features like image optimization, inlining, inotify,
+#       and profiling are imported on first use. So the LOOP upload 
+#       service and the generator load only what they need.
+
+class LazyModule(object):
+    """ module that is imported on first access to one of its attributes
+    
+        Args:
+            name (str): name of the module as for `import`
+    """
+
+    def __init__(self, name):
+        self._lazy_name = name
+        self._lazy_module = None
+
+    def __getattr__(self, attr):
+        if self._lazy_module is None:
+            self._lazy_module = importlib.import_module(self._lazy_name)
+        return getattr(self._lazy_module, attr)
+
+    def __repr__(self):
+        return '<lazy module %r>' % self._lazy_name
+
+# configuration files (the WeeWX modules load configobj anyway, but the
+# module does not rely on that)
+configobj = LazyModule('configobj')
+# HTML parsing, needed by the generator only
+html_parser = LazyModule('html.parser')
+# image optimization and inotify
+struct = LazyModule('struct')
+zlib = LazyModule('zlib')
+# inotify
+select = LazyModule('select')
+ctypes = LazyModule('ctypes')
+ctypes_util = LazyModule('ctypes.util')
+# inlining
+base64 = LazyModule('base64')
+# profiling
+cProfile = LazyModule('cProfile')
+pstats = LazyModule('pstats')
+# reconnecting
+random = LazyModule('random')
+
+# `True` if run by the developer's test setup, see `main()`
+testing = False
+# print debug messages when run from the command line
+cli_debug = True
 
 if __name__ == '__main__':
     def logdbg(msg):
-        print('DEBUG',msg)
+        if cli_debug: print('DEBUG',msg)
     def loginf(msg):
         print('INFO',msg)
     def logerr(msg):
@@ -109,6 +152,200 @@ def get_php_filename(file):
     """
     return '%s.php' % (os.path.splitext(file)[0] if file.endswith('.html') or file.endswith('.htm') else file)
 
+def php_escape(s):
+    """ escape a string to be put into a PHP string literal in double quotes
+    
+        Without that, `"` would end the literal and `$` would start a
+        variable name.
+    """
+    return re.sub(r'([\\"$])',r'\\\1',s)
+
+# PNG chunks that are kept by `optimize_png()`, all the others are removed
+PNG_KEEP_CHUNKS = {b'IHDR',b'PLTE',b'tRNS',b'gAMA',b'cHRM',b'sRGB',b'iCCP',
+                   b'pHYs',b'IEND'}
+
+# results of `optimize_png()` by the hash of the original image
+_png_cache = dict()
+
+def optimize_png(data):
+    """ losslessly recompress a PNG image
+    
+        Ancillary chunks not required to display the image correctly are
+        removed, and the image data is compressed again at maximum 
+        compression level. If the result is not smaller, the original
+        is returned. Animated PNG images are returned unchanged, as
+        their frames are stored in chunks of their own.
+        
+        Args:
+            data (bytes): PNG image
+        
+        Returns:
+            bytes: optimized PNG image
+    """
+    if has_hashlib:
+        key = hashlib.sha256(data).digest()
+        if key in _png_cache: return _png_cache[key]
+    if data[:8]!=b'\x89PNG\r\n\x1a\n': return data
+    chunks = []
+    idat = []
+    pos = 8
+    try:
+        while pos<len(data):
+            length, type = struct.unpack_from('>I4s',data,pos)
+            chunk = data[pos+8:pos+8+length]
+            pos += length+12
+            if type==b'acTL':
+                # animated PNG
+                return data
+            if type==b'IDAT':
+                if not idat: chunks.append((b'IDAT',None))
+                idat.append(chunk)
+            elif type in PNG_KEEP_CHUNKS:
+                chunks.append((type,chunk))
+            if type==b'IEND': break
+        raw = zlib.decompress(b''.join(idat))
+    except (struct.error,zlib.error):
+        return data
+    compressor = zlib.compressobj(9,zlib.DEFLATED,15,9)
+    compressed = compressor.compress(raw)+compressor.flush()
+    result = [data[:8]]
+    for type, chunk in chunks:
+        if chunk is None: chunk = compressed
+        result.append(struct.pack('>I',len(chunk)))
+        result.append(type)
+        result.append(chunk)
+        result.append(struct.pack('>I',zlib.crc32(type+chunk)&0xffffffff))
+    result = b''.join(result)
+    if len(result)>=len(data): result = data
+    if has_hashlib:
+        # limit the size of the cache
+        if len(_png_cache)>=500:
+            del _png_cache[next(iter(_png_cache))]
+        _png_cache[key] = result
+    return result
+
+# parts of HTML that must not be changed by `minify_html()`: elements
+# whose content is whitespace sensitive, comments, and the tags 
+# themselves including attribute values, which may contain `>`
+HTML_PRESERVE_RE = re.compile(
+    r'(<(pre|textarea|script|style)\b.*?</\2\s*>|<!--.*?-->|'
+    r'<[^>"\']*(?:(?:"[^"]*"|\'[^\']*\')[^>"\']*)*>)',re.S|re.I)
+
+def minify_html(text):
+    """ remove indentation and blank lines from HTML
+    
+        Only whitespace between tags that includes a line break is 
+        reduced to that line break. Tags including their attributes,
+        comments, and the content of `<pre>`, `<textarea>`, `<script>`, 
+        and `<style>` are not changed at all.
+    """
+    parts = HTML_PRESERVE_RE.split(text)
+    result = []
+    # `split()` returns the text between the matches, the match, and
+    # the element name (`None` for tags and comments), repeatedly.
+    for idx, part in enumerate(parts):
+        if idx%3==0:
+            result.append(re.sub(r'[ \t\r\f\v]*\n\s*','\n',part))
+        elif idx%3==1:
+            result.append(part)
+    return ''.join(result)
+
+def minify_css(text):
+    """ remove comments and unnecessary whitespace from CSS
+    
+        Strings are preserved as they are, as well as comments starting
+        with `/*!`.
+    """
+    result = []
+    space = False
+    pos = 0
+    length = len(text)
+    while pos<length:
+        c = text[pos]
+        if c.isspace() or (text.startswith('/*',pos) and 
+                                         not text.startswith('/*!',pos)):
+            # whitespace or comment
+            if c.isspace():
+                pos += 1
+            else:
+                end = text.find('*/',pos+2)
+                pos = length if end<0 else end+2
+            space = True
+            continue
+        if c in '"\'':
+            # string
+            end = pos+1
+            while end<length and text[end]!=c:
+                if text[end]=='\\': end += 1
+                end += 1
+            token = text[pos:end+1]
+        elif text.startswith('/*!',pos):
+            # comment to preserve
+            end = text.find('*/',pos+3)
+            end = length if end<0 else end+2
+            token = text[pos:end]
+        else:
+            token = c
+        if space and result and result[-1][-1] not in '{};,' and c not in '{};,':
+            result.append(' ')
+        space = False
+        result.append(token)
+        pos += len(token)
+    return ''.join(result)
+
+def minify_js(text):
+    """ remove indentation, trailing whitespace, and blank lines from JavaScript
+    
+        Line breaks are preserved because of automatic semicolon
+        insertion. Comments are not touched because regular expression
+        literals cannot be told apart from them without a full parser.
+        If there are template literals or line continuations within the
+        code, the text is returned unchanged.
+    """
+    if '`' in text or '\\\n' in text: return text
+    return '\n'.join(line.strip() for line in text.splitlines() if line.strip())
+
+# results of `minify()` by the hash of the original data
+_minify_cache = dict()
+
+def minify(data, content_type):
+    """ minify HTML, JavaScript, CSS, and JSON 
+    
+        Args:
+            data (bytes): content of the file
+            content_type (str): MIME type, possibly including charset
+        
+        Returns:
+            bytes: minified data or the original data if the content
+                type is not supported or the data is not valid
+    """
+    mime = content_type.split(';')[0].strip().lower()
+    if has_hashlib:
+        key = hashlib.sha256(mime.encode('ascii','ignore')+b'\n'+data).digest()
+        if key in _minify_cache: return _minify_cache[key]
+    try:
+        text = data.decode('utf-8')
+        if mime=='text/html':
+            result = minify_html(text)
+        elif mime in ('text/javascript','application/javascript'):
+            result = minify_js(text)
+        elif mime=='text/css':
+            result = minify_css(text)
+        elif mime=='application/json':
+            result = json.dumps(json.loads(text),ensure_ascii=False,
+                                                        separators=(',',':'))
+        else:
+            return data
+        result = result.encode('utf-8')
+    except (UnicodeError,ValueError):
+        return data
+    if has_hashlib:
+        # limit the size of the cache
+        if len(_minify_cache)>=500:
+            del _minify_cache[next(iter(_minify_cache))]
+        _minify_cache[key] = result
+    return result
+
 def simpleHTMLdivide(file, php, divide_tag):
     """ simple HTML parser if no link replacement is requested """
     file_data = ''
@@ -139,31 +376,133 @@ def simpleHTMLdivide(file, php, divide_tag):
     return file_data, db_data.encode('utf-8','ignore'), 'text/html'
 
 
-class HTMLdivide(html.parser.HTMLParser):
+def parse_region_selector(selector):
+    """ parse the selector of a dynamic region of an HTML page
+    
+        Possible selectors are `tag`, `#id`, `tag#id`, `.class`, 
+        `tag.class`, and `comment:name`. The latter marks the part
+        between the comments `<!-- name -->` and `<!-- /name -->`.
+        
+        Returns:
+            tuple: tag, id, class, and comment name, `None` if not used
+    """
+    selector = selector.strip()
+    if selector.startswith('comment:'):
+        return None, None, None, selector[8:].strip()
+    if '#' in selector:
+        tag, id = selector.split('#',1)
+        return tag.lower() or None, id, None, None
+    if '.' in selector:
+        tag, cls = selector.split('.',1)
+        return tag.lower() or None, None, cls, None
+    return selector.lower(), None, None, None
+
+
+class HTMLdivideMixin(object):
     """ divide an HTML file into a constant and a variable part and replace URLs
     
+        The parser class is `HTMLdivideMixin` combined with
+        `html.parser.HTMLParser`, see `get_html_divide_class()`.
+
         Args:
             php (str): PHP script to insert into the constant part where the
                 variable part was extracted
             files_list (list): list of URLs to replace
             divide_tag (str): tag which divides the constant part from the
                 variable one (use `none` to have no constant part)
+            regions (list): list of tuples of the record ID, the selector
+                as returned by `parse_region_selector()`, and the PHP 
+                script to insert. If not empty, the page is divided into
+                several variable parts instead of using `divide_tag`.
+            inline_asset (callable): function that returns the content
+                type and the content of a small file to embed into the
+                variable part for a link, or `None`
         
         Returns:
             php_data (str): constant part including PHP to upload as a file
             db_data (str): variable part to upload by SQL
+            region_data (dict): variable parts by record ID if `regions`
+                is used
     """
 
-    def __init__(self, php, files_list, divide_tag='html', convert_charrefs=True):
-        super(HTMLdivide,self).__init__(convert_charrefs=convert_charrefs)
+    def __init__(self, php, files_list, divide_tag='html', convert_charrefs=True, regions=None, inline_asset=None):
+        super(HTMLdivideMixin,self).__init__(convert_charrefs=convert_charrefs)
         self.php_data = ''
         self.db_data = ''
         self.inner = divide_tag=='none'
         self.divide_tag = divide_tag
         self.php_script = php
         self.files = files_list
+        # dynamic regions not found so far
+        self.regions = list(regions) if regions else []
+        self.region_data = dict()
+        # region currently processed: record ID, tag, nesting depth, and
+        # comment name
+        self.region = None
+        if self.regions: self.divide_tag = None
+        self.inline_asset = inline_asset
+
+    def write(self, s):
+        """ append to the constant or the appropriate variable part """
+        if self.region:
+            self.region_data[self.region[0]] += s
+        elif self.inner:
+            self.db_data += s
+        else:
+            self.php_data += s
+
+    def start_region(self, id, tag, comment, php):
+        self.php_data += php
+        self.region_data[id] = ''
+        self.region = [id, tag, 1, comment]
+
+    def match_region(self, tag, attrs):
+        """ find the dynamic region the start tag begins, if any """
+        if self.region or self.inner: return None
+        for region in self.regions:
+            rtag, rid, rcls, rcomment = region[1]
+            if rcomment: continue
+            if rtag and rtag!=tag: continue
+            if rid and dict(attrs).get('id')!=rid: continue
+            if rcls and rcls not in (dict(attrs).get('class') or '').split(): continue
+            self.regions.remove(region)
+            return region
+        return None
+
+    def inline(self, tag, attrs):
+        """ embed small images and style sheets into the variable part
+
+            Images become data URIs. A style sheet link is replaced by
+            a `<style>` element, which is returned.
+        """
+        if not self.inline_asset or not (self.inner or self.region):
+            return None
+        attrs_dict = dict(attrs)
+        rel = (attrs_dict.get('rel') or '').lower().split()
+        if tag=='img':
+            key = 'src'
+        elif tag=='link' and ('stylesheet' in rel or 'icon' in rel):
+            key = 'href'
+        else:
+            return None
+        asset = self.inline_asset(attrs_dict.get(key))
+        if not asset: return None
+        content_type, data = asset
+        if content_type=='text/css':
+            if tag=='link' and 'stylesheet' in rel:
+                return '<style>%s</style>' % data.decode('utf-8','ignore')
+            return None
+        for idx, val in enumerate(attrs):
+            if val[0]==key:
+                attrs[idx] = (key,'data:%s;base64,%s' % (content_type,
+                                      base64.b64encode(data).decode('ascii')))
+        return None
 
     def handle_starttag(self, tag, attrs):
+        style = self.inline(tag, attrs)
+        if style:
+            self.write(style)
+            return
         if tag=='a':
             # replace href to HTML by PHP
             for idx, val in enumerate(attrs):
@@ -174,29 +513,31 @@ class HTMLdivide(html.parser.HTMLParser):
                         href[0] = get_php_filename(href[0])
                         attrs[idx] = ('href',separator.join(href))
         s = '<%s %s>' % (tag,' '.join('%s="%s"' % i for i in attrs))
-        if self.inner:
-            self.db_data += s
-        else:
-            self.php_data += s
+        if self.region and self.region[1]==tag:
+            self.region[2] += 1
+        region = self.match_region(tag, attrs)
+        self.write(s)
+        if region:
+            self.start_region(region[0], tag, None, region[2])
         if tag==self.divide_tag:
             self.inner = True
             self.php_data += '\n%s\n' % self.php_script
     
     def handle_endtag(self, tag):
         if tag==self.divide_tag: self.inner = False
-        s = '</%s>' % tag
-        if self.inner:
-            self.db_data += s
-        else:
-            self.php_data += s
+        if self.region and self.region[1]==tag:
+            self.region[2] -= 1
+            if self.region[2]<=0: self.region = None
+        self.write('</%s>' % tag)
     
     def handle_data(self, data):
-        if self.inner:
-            self.db_data += data
-        else:
-            self.php_data += data
+        self.write(data)
     
     def handle_startendtag(self, tag, attrs):
+        style = self.inline(tag, attrs)
+        if style:
+            self.write(style)
+            return
         if True:
             for idx, val in enumerate(attrs):
                 if val[0]=='src':
@@ -204,35 +545,29 @@ class HTMLdivide(html.parser.HTMLParser):
                     if self.isinfiles(href[0]):
                         href[0] = get_php_filename(href[0])
                         attrs[idx] = ('src','?'.join(href))
-        s = '<%s %s />' % (tag,' '.join('%s="%s"' % i for i in attrs))
-        if self.inner:
-            self.db_data += s
-        else:
-            self.php_data += s
+        self.write('<%s %s />' % (tag,' '.join('%s="%s"' % i for i in attrs)))
     
     def handle_comment(self, data):
-        s = '<!-- %s -->' % data
-        if self.inner:
-            self.db_data += s
-        else:
-            self.php_data += s
+        name = data.strip()
+        if self.region and self.region[3] and name=='/%s' % self.region[3]:
+            # end of a region marked by comments
+            self.region = None
+        self.write('<!-- %s -->' % data)
+        if not self.region and not self.inner:
+            for region in self.regions:
+                if region[1][3] and region[1][3]==name:
+                    self.regions.remove(region)
+                    self.start_region(region[0], None, name, region[2])
+                    break
     
     def handle_decl(self, decl):
         self.php_data += '<!%s>' % decl
     
     def handle_entityref(self, name):
-        s = '&%s;' % name
-        if self.inner:
-            self.db_data += s
-        else:
-            self.php_data += s
+        self.write('&%s;' % name)
     
     def handle_charref(self, name):
-        s = '&#%s;' % name
-        if self.inner:
-            self.db_data += s
-        else:
-            self.php_data += s
+        self.write('&#%s;' % name)
     
     def isinfiles(self, href):
         if not href: return False
@@ -246,6 +581,16 @@ class HTMLdivide(html.parser.HTMLParser):
         return x in self.files
 
 
+@functools.lru_cache(maxsize=None)
+def get_html_divide_class():
+    """ the parser class to divide HTML files, see `HTMLdivideMixin`
+
+        It is created on first use, so that the LOOP upload service does
+        not load the HTML parser.
+    """
+    return type('HTMLdivide',(HTMLdivideMixin,html_parser.HTMLParser),dict())
+
+
 if __name__ == '__main__':
     class ConnTest(object):
         """ print SQL statements for dry run """
@@ -265,44 +610,207 @@ class SQLuploadGenerator(weewx.reportengine.ReportGenerator):
     PHP_START = '<?php\n'
     PHP_END = '?>'
     PHP_INCL = '  $id="%s";\n  include "%s";\n'
-    PHP_PDO = '''  $pdo = new PDO(
-    "mysql:host=localhost;dbname=$dbname%s",
-    $dbuser,
-    $dbpassword
-  );
-  $sql = "SELECT %s FROM %s WHERE `ID`=?";
-  $statement = $pdo->prepare($sql); 
-  $statement->execute([$id]);
-  $text = "";
-  while($row = $statement->fetch()) {
-    $text = $text . $row["TEXT"];
-    header("Last-Modified: " . date("r", $row["MTIME_EPOCH"]));
+    PHP_INCL_IDS = '  $ids=array(%s);\n  include "%s";\n'
+    PHP_ECHO_REGION = '<?php echo isset($texts["%s"]) ? $texts["%s"] : ""; ?>'
+    # The hash and the modification time are queried first. If the
+    # browser already has the current version, `304 Not Modified` is
+    # sent without reading `TEXT` from the database. As the constant
+    # part of HTML pages resides in the PHP script, the modification
+    # time of the script is included in `ETag` and `Last-Modified`.
+    PHP_NOT_MODIFIED = '''    $mtime = max($row["MTIME_EPOCH"],filemtime(get_included_files()[0]));
+    header("Last-Modified: " . gmdate("D, d M Y H:i:s",$mtime) . " GMT");
     header("Content-Type: " . $row["CONTENTTYPE"]);
+    $etag = $row["HASH"] ? '"' . $row["HASH"] . "-" . dechex(filemtime(get_included_files()[0])) . '"' : "";
+    if($etag) header("ETag: " . $etag);
+    if($etag && isset($_SERVER["HTTP_IF_NONE_MATCH"])) {
+      $notmodified = strpos($_SERVER["HTTP_IF_NONE_MATCH"],$etag)!==false;
+    } elseif(isset($_SERVER["HTTP_IF_MODIFIED_SINCE"])) {
+      $notmodified = strtotime($_SERVER["HTTP_IF_MODIFIED_SINCE"])>=$mtime;
+    } else {
+      $notmodified = false;
+    }
+'''
+    # Optional cache of the database records within the web server, 
+    # either in APCu or in files. A cached record is delivered without
+    # database access for `$cachettl` seconds. After that, or if 
+    # `$cachettl` is 0, it is validated by the cheap query for the hash
+    # and the modification time. `TEXT` is read from the database only
+    # if the cached record is outdated.
+    # Pages with several dynamic regions set `$ids` instead of `$id`.
+    # Their records are queried together and get one common hash. The
+    # content is then available in `$texts` by ID.
+    PHP_CACHE_GET = '''  $idlist = isset($ids) ? $ids : array($id);
+  $cache = false;
+  $cachekey = "weewxsqlupload-%s-" . implode(",",$idlist);
+  $cachefile = $cachedir . "/" . md5($cachekey);
+  $cachestore = false;
+  if($cachetype=="files") {
+    // Use a directory of the user PHP runs as only, which others cannot
+    // write to. Otherwise they could plant cache files.
+    $cacheuid = function_exists("posix_geteuid") ? posix_geteuid() : getmyuid();
+    if(!is_dir($cachedir)) @mkdir($cachedir,0700,true);
+    clearstatcache();
+    if(@fileowner($cachedir)!==$cacheuid || (@fileperms($cachedir) & 0022)) $cachetype = "none";
+  }
+  if($cachetype=="apcu" && function_exists("apcu_fetch")) {
+    $cache = apcu_fetch($cachekey);
+  } elseif($cachetype=="files" && is_file($cachefile) && @fileowner($cachefile)===$cacheuid) {
+    $cache = @unserialize(@file_get_contents($cachefile),array("allowed_classes"=>false));
   }
-  $pdo = null;
 '''
-    PHP_MYSQLI = '''  $pdo = new mysqli("localhost",$dbuser,$dbpassword,$dbname);
-  $sql = "SELECT %s FROM %s WHERE `ID`='" . $id . "'";
-  $reply = $pdo->query($sql);
-  $text = "";
-  while($row = $reply->fetch_assoc()) {
-    $text = $text . $row["TEXT"];
-    header("Last-Modified: " . date("r", $row["MTIME_EPOCH"]));
-    header("Content-Type: " . $row["CONTENTTYPE"]);
+    PHP_CACHE_PUT = '''  if($cachestore) {
+    if($cachetype=="apcu" && function_exists("apcu_store")) {
+      apcu_store($cachekey,$row);
+    } elseif($cachetype=="files") {
+      if(@file_put_contents($cachefile . "." . getmypid(),serialize($row))!==false) {
+        @rename($cachefile . "." . getmypid(),$cachefile);
+      }
+    }
+  }
+'''
+    PHP_PDO = '''  $text = "";
+  $texts = array();
+%s  if($cache && $cachettl>0 && time()-$cache["TIME"]<$cachettl) {
+    $row = $cache;
+  } else {
+    $pdo = new PDO(
+      "%s",
+      $dbuser,
+      $dbpassword,
+      array(PDO::ATTR_PERSISTENT => $dbpersistent)
+    );
+%s    $sqlids = implode(",",array_fill(0,count($idlist),"?"));
+    $sql = "SELECT `ID`$sqlgencol,%s FROM %s WHERE `ID` IN ($sqlids)$sqlgen ORDER BY `ID`$sqlgencol";
+    $statement = $pdo->prepare($sql); 
+    $statement->execute($idlist);
+    $row = false;
+    $hashes = array();
+    $gens = array();
+    while($data = $statement->fetch(PDO::FETCH_ASSOC)) {
+      if(!$row || $data["MTIME_EPOCH"]>$row["MTIME_EPOCH"]) $row = $data;
+      $hashes[$data["ID"]] = $data["HASH"];
+      if(isset($data["GEN"])) $gens[$data["ID"]] = $data["GEN"];
+    }
+    if($row) {
+      ksort($hashes);
+      $row["HASH"] = in_array(null,$hashes) ? null : (count($hashes)==1 ? reset($hashes) : md5(implode(",",$hashes)));
+    }
+    if($row && $cache && $cache["HASH"]===$row["HASH"] && $cache["MTIME_EPOCH"]==$row["MTIME_EPOCH"]) {
+      $row = $cache;
+      $row["TIME"] = time();
+      $cachestore = $cachettl>0;
+    }
+  }
+  if($row) {
+%s    if($notmodified) {
+      http_response_code(304);
+      $pdo = null;
+      exit;
+    }
+    if(!isset($row["TEXTS"])) {
+      $row["TEXTS"] = array();
+      $sqlchunks = implode(" OR ",array_fill(0,count($idlist),"`ID` LIKE ?"));
+      $sql = "SELECT `ID`,`TEXT`$sqlgencol FROM %s WHERE (`ID` IN ($sqlids) OR $sqlchunks)$sqlgen ORDER BY `ID`$sqlgencol";
+      $statement = $pdo->prepare($sql);
+      $statement->execute(array_merge($idlist,array_map(function($i) { return addcslashes($i,"%%_\\\\") . "~%%"; },$idlist)));
+      while($data = $statement->fetch()) {
+        $key = preg_replace('/~[0-9]+$/','',$data["ID"]);
+        if(isset($data["GEN"]) && isset($gens[$key]) && $data["GEN"]!=$gens[$key]) continue;
+        $row["TEXTS"][$key] = (isset($row["TEXTS"][$key]) ? $row["TEXTS"][$key] : "") . $data["TEXT"];
+      }
+      $row["TIME"] = time();
+      $cachestore = true;
+    }
+    $texts = $row["TEXTS"];
+    $text = isset($id) && isset($texts[$id]) ? $texts[$id] : "";
+  }
+  $pdo = null;
+%s'''
+    PHP_MYSQLI = '''  $text = "";
+  $texts = array();
+%s  if($cache && $cachettl>0 && time()-$cache["TIME"]<$cachettl) {
+    $row = $cache;
+  } else {
+    $pdo = new mysqli(($dbpersistent ? "p:" : "") . "localhost",$dbuser,$dbpassword,$dbname);
+%s    $sqlids = "'" . implode("','",array_map(array($pdo,"real_escape_string"),$idlist)) . "'";
+    $sql = "SELECT `ID`$sqlgencol,%s FROM %s WHERE `ID` IN ($sqlids)$sqlgen ORDER BY `ID`$sqlgencol";
+    $reply = $pdo->query($sql);
+    $row = false;
+    $hashes = array();
+    $gens = array();
+    while($data = $reply->fetch_assoc()) {
+      if(!$row || $data["MTIME_EPOCH"]>$row["MTIME_EPOCH"]) $row = $data;
+      $hashes[$data["ID"]] = $data["HASH"];
+      if(isset($data["GEN"])) $gens[$data["ID"]] = $data["GEN"];
+    }
+    if($row) {
+      ksort($hashes);
+      $row["HASH"] = in_array(null,$hashes) ? null : (count($hashes)==1 ? reset($hashes) : md5(implode(",",$hashes)));
+    }
+    if($row && $cache && $cache["HASH"]===$row["HASH"] && $cache["MTIME_EPOCH"]==$row["MTIME_EPOCH"]) {
+      $row = $cache;
+      $row["TIME"] = time();
+      $cachestore = $cachettl>0;
+    }
+  }
+  if($row) {
+%s    if($notmodified) {
+      http_response_code(304);
+      if(isset($pdo)) $pdo->close();
+      exit;
+    }
+    if(!isset($row["TEXTS"])) {
+      $row["TEXTS"] = array();
+      $sqlchunks = implode(" OR ",array_map(function($i) use ($pdo) { return "`ID` LIKE '" . $pdo->real_escape_string(addcslashes($i,"%%_\\\\") . "~%%") . "'"; },$idlist));
+      $sql = "SELECT `ID`,`TEXT`$sqlgencol FROM %s WHERE (`ID` IN ($sqlids) OR $sqlchunks)$sqlgen ORDER BY `ID`$sqlgencol";
+      $reply = $pdo->query($sql);
+      while($data = $reply->fetch_assoc()) {
+        $key = preg_replace('/~[0-9]+$/','',$data["ID"]);
+        if(isset($data["GEN"]) && isset($gens[$key]) && $data["GEN"]!=$gens[$key]) continue;
+        $row["TEXTS"][$key] = (isset($row["TEXTS"][$key]) ? $row["TEXTS"][$key] : "") . $data["TEXT"];
+      }
+      $row["TIME"] = time();
+      $cachestore = true;
+    }
+    $texts = $row["TEXTS"];
+    $text = isset($id) && isset($texts[$id]) ? $texts[$id] : "";
   }
-  $pdo->close();'''
+  if(isset($pdo)) $pdo->close();
+%s'''
+    # generation pointer for generational uploads
+    PHP_GEN_PDO = '''    $gen = $pdo->query("SELECT `GEN` FROM %s_gen WHERE `ID`=0")->fetchColumn();
+    $sqlgen = " AND `GEN`<=" . intval($gen);
+    $sqlgencol = ",`GEN`";
+'''
+    PHP_GEN_MYSQLI = '''    $gen = $pdo->query("SELECT `GEN` FROM %s_gen WHERE `ID`=0")->fetch_row()[0];
+    $sqlgen = " AND `GEN`<=" . intval($gen);
+    $sqlgencol = ",`GEN`";
+'''
+    PHP_NO_GEN = '''    $sqlgen = "";
+    $sqlgencol = "";
+'''
     PHP_INI = '''  $dbhost = "%s";
   $dbuser = "%s";
   $dbpassword = "%s";
   $dbname = "%s";
+'''
+    PHP_CACHE_INI = '''  $dbpersistent = %s;
+  $cachetype = "%s";
+  $cachedir = %s;
+  $cachettl = %d;
 '''
     PHP_ECHO = '  echo $text;\n'
     
     # SQL commands
-    SQL_UPDATE = 'UPDATE %s SET `TEXT`=?,`CONTENTTYPE`=?,`MTIME`=FROM_UNIXTIME(?) WHERE `ID`=?'
+    SQL_UPDATE = 'UPDATE %s SET `TEXT`=?,`CONTENTTYPE`=?,`MTIME`=FROM_UNIXTIME(?),`HASH`=? WHERE `ID`=?'
     SQL_INSERT = 'INSERT IGNORE INTO %s(`ID`) VALUES (?)'
-    SQL_CREATE = 'CREATE TABLE IF NOT EXISTS %s(`ID` CHAR(32) PRIMARY KEY, `MTIME` TIMESTAMP NULL DEFAULT NULL, `CONTENTTYPE` VARCHAR(127) NULL, `TEXT` %s NULL)'
-    SQL_SELCOL = '*,UNIX_TIMESTAMP(`MTIME`) AS MTIME_EPOCH'
+    SQL_CREATE = 'CREATE TABLE IF NOT EXISTS %s(`ID` CHAR(32) PRIMARY KEY, `MTIME` TIMESTAMP NULL DEFAULT NULL, `CONTENTTYPE` VARCHAR(127) NULL, `HASH` CHAR(64) NULL, `TEXT` %s NULL)'
+    # add the hash column to tables created by earlier versions
+    SQL_ADD_HASH = 'ALTER TABLE %s ADD COLUMN `HASH` CHAR(64) NULL AFTER `CONTENTTYPE`'
+    # records too large for one statement are split into chunks
+    SQL_CHUNK_INSERT = 'INSERT INTO %s(`ID`,`TEXT`) VALUES (?,?)'
+    SQL_CHUNK_DELETE = 'DELETE FROM %s WHERE `ID` LIKE ?'
+    SQL_SELCOL = '`HASH`,`CONTENTTYPE`,UNIX_TIMESTAMP(`MTIME`) AS MTIME_EPOCH'
 
     # files to process by `process_other()` and their MIME types
     # Note: HTML and JavaScript must not be included here.
@@ -327,8 +835,12 @@ class SQLuploadGenerator(weewx.reportengine.ReportGenerator):
     def __init__(self, config_dict, skin_dict, gen_ts, first_run, stn_info, record=None):
         super(SQLuploadGenerator,self).__init__(config_dict, skin_dict, gen_ts, first_run, stn_info, record)
         self.running = True
+        self.targets = []
+        # bulk upload by the `sync` command, see `SQLsync`
+        self.sync = None
         self.phpuser = ('weewxphpuser','Wcw4nNiQHvvNVAwzFogj')
         if first_run:
+            loginf("%s version %s" % (self.__class__.__name__,VERSION))
             loginf("Report skin name '%s', skin version '%s'" % (
                      skin_dict.get('SKIN_NAME'),skin_dict.get('SKIN_VERSION')))
 
@@ -337,6 +849,10 @@ class SQLuploadGenerator(weewx.reportengine.ReportGenerator):
         loginf('request to shutdown SQLuploadGenerator')
 
     def run(self):
+        """ run the report cycle, profiled if requested """
+        get_profiler(self.config_dict,self.skin_dict).call(self.run_cycle)
+
+    def run_cycle(self):
     
         # determine how much logging is desired
         log_success = weeutil.weeutil.to_bool(weeutil.config.search_up(self.skin_dict, 'log_success', True))
@@ -344,20 +860,15 @@ class SQLuploadGenerator(weewx.reportengine.ReportGenerator):
         log_load = weeutil.weeutil.to_int(weeutil.config.search_up(self.skin_dict, 'load_monitoring', 0))
 
         # where to find the files
-        if self.skin_dict['HTML_ROOT'].startswith('~'):
-            target_path = os.path.expanduser(self.skin_dict['HTML_ROOT'])
-        else:
-            target_path = os.path.join(
-                self.config_dict['WEEWX_ROOT'],
-                self.skin_dict['HTML_ROOT'])
+        target_path = get_target_path(self.config_dict, self.skin_dict)
 
         # configuration section for this generator
         generator_dict = self.skin_dict.get('SQLuploadGenerator',
                                                          configobj.ConfigObj())
         self.dry_run = generator_dict.get('dry_run',False)
         if 'merge_skin' in generator_dict:
-            self.merge_skin(generator_dict)
-        if __name__ == '__main__':
+            self.merge_skin(generator_dict, target_path)
+        if testing:
             print('---- generator_dict ----')
             print(json.dumps(generator_dict,indent=4,ensure_ascii=False))
             print('------------------------')
@@ -373,12 +884,29 @@ class SQLuploadGenerator(weewx.reportengine.ReportGenerator):
         password = self.skin_dict.get('password')
         tablename = generator_dict.get('table_name',
                                               self.skin_dict.get('table_name'))
+        database_type = self.skin_dict.get('database_type','mysql')
+        sqlite_root = get_sqlite_root(self.config_dict,self.skin_dict)
         phpdriver = self.skin_dict.get('php_mysql_driver','PDO').lower()
         blobtype = self.skin_dict.get('sql_data_type','LONGBLOB')
         sqlcharset = self.skin_dict.get('sql_charset')
-        sqlcolumns = SQLuploadGenerator.SQL_SELCOL
-        sql_upd_str = SQLuploadGenerator.SQL_UPDATE % tablename
-        sql_ins_str = SQLuploadGenerator.SQL_INSERT % tablename
+        try:
+            self.database = get_backend(database_type, host=dbhost,
+                port=dbport, username=username, password=password,
+                database_name=dbname, SQLITE_ROOT=sqlite_root)
+        except ValueError as e:
+            logerr(e)
+            return
+        sqlcolumns = self.database.SQL_SELCOL
+        self.tablename = tablename
+        sql_upd_str = self.database.SQL_UPDATE % tablename
+        sql_ins_str = self.database.SQL_INSERT % tablename
+        # Generational uploads write the changed records as a new
+        # generation and make it visible to the PHP scripts at once at
+        # the end of the report cycle.
+        generations = weeutil.weeutil.to_bool(
+                                   generator_dict.get('generations',False))
+        self.generation = None
+        generation_pending = False
         
         # related FTP upload section
         ftp_uploader_section = self.skin_dict.get('file_uploader','FTP')
@@ -392,7 +920,7 @@ class SQLuploadGenerator(weewx.reportengine.ReportGenerator):
                 ftp_target_path
             )
         logdbg("FTP uploader HTML_ROOT=%s" % ftp_target_path)
-        if dbhost!=ftp_uploader_dict.get('server'):
+        if self.database.has_server and dbhost!=ftp_uploader_dict.get('server'):
             loginf(
                 "Warning! Different servers. SQL --> '%s', FTP --> '%s'" % (
                                        dbhost,ftp_uploader_dict.get('server'))
@@ -417,6 +945,35 @@ class SQLuploadGenerator(weewx.reportengine.ReportGenerator):
         # Hashes of the data uploaded during the last run
         sql_last_upload = SQLlastUpload(target_path)
         ftp_last_upload = FTPlastUpload(ftp_target_path)
+
+        # Files written since the last run according to inotify. `None`
+        # means, the information is not available and all the files
+        # have to be checked by their modification time.
+        # inotify reports each change once only. So changes that were not
+        # uploaded by the previous cycles are saved to the state file
+        # and added.
+        use_inotify = weeutil.weeutil.to_bool(
+                                     generator_dict.get('use_inotify',False))
+        if use_inotify:
+            watcher = get_inotify_watcher(target_path)
+            changed_files = watcher.take() if watcher else None
+            logdbg('inotify: %s' % ('%s file(s) changed' % len(changed_files)
+                       if changed_files is not None else 'fall back to stat'))
+            if changed_files is not None:
+                changed_files |= sql_last_upload.get_dirty()
+                if changed_files!=sql_last_upload.get_dirty():
+                    # in case the cycle ends early
+                    sql_last_upload.set_dirty(changed_files)
+                    sql_last_upload.save()
+        else:
+            changed_files = None
+        
+        # If the database server is not reachable, the records are saved
+        # to the spool file and uploaded later on.
+        spool = SQLspool(target_path,
+            weeutil.weeutil.to_int(generator_dict.get('spool_max_size',50000000)),
+            sql_upd_str)
+        is_spooling = False
         
         if self.dry_run:
             conn = ConnTest()
@@ -424,15 +981,13 @@ class SQLuploadGenerator(weewx.reportengine.ReportGenerator):
             # try to create database at first run after start of WeeWX
             if self.first_run:
                 try:
-                    weedb.mysql.create(
-                        host=dbhost,
-                        user=username,
-                        password=password,
-                        database_name=dbname,
-                        port = dbport
-                    )
+                    self.database.create()
                 except weedb.DatabaseExistsError:
                     is_new_database = False
+                except (weedb.CannotConnectError,weedb.DisconnectError) as e:
+                    if log_failure:
+                        logerr('creating database failed: %s %s' % (e.__class__.__name__,e))
+                    is_spooling = True
                 except Exception as e:
                     if log_failure:
                         logerr('creating database failed: %s %s' % (e.__class__.__name__,e))
@@ -443,44 +998,75 @@ class SQLuploadGenerator(weewx.reportengine.ReportGenerator):
                     is_new_database = True
 
             # connect to the database
-            conn = weedb.mysql.connect(
-                host=dbhost,
-                user=username,
-                password=password,
-                database_name=dbname,
-                port=dbport
-            )
+            conn = None
+            if not is_spooling:
+                try:
+                    conn = self.database.connect()
+                except (weedb.CannotConnectError,weedb.DisconnectError) as e:
+                    if log_failure:
+                        logerr('could not connect to database: %s %s' % (e.__class__.__name__,e))
+                    is_spooling = True
+            if is_spooling:
+                loginf("database server '%s' not reachable, saving records to the spool file" % dbhost)
+                conn = spool
             if not conn:
                 if log_failure:
                     logerr('could not connect to database')
                     return
-            if is_new_database:
+            if is_new_database and self.database.has_server:
                 self.create_user(conn, dbname, tablename)
+        # Records larger than the server accepts are uploaded in chunks.
+        self.max_record_size = self.database.get_max_record_size(conn)
         
         # try to create table at first run after the start of WeeWX
         if self.first_run:
+            cache_get = SQLuploadGenerator.PHP_CACHE_GET % php_escape(
+                                                 '%s.%s' % (dbname,tablename))
             if phpdriver=='pdo':
-                _sqlcharset = ';charset=%s' % sqlcharset if sqlcharset else ''
-                base_php = SQLuploadGenerator.PHP_PDO % (_sqlcharset,sqlcolumns,tablename)
-            elif phpdriver=='mysqli':
-                base_php = SQLuploadGenerator.PHP_MYSQLI % (sqlcolumns,tablename)
+                base_php = SQLuploadGenerator.PHP_PDO % (
+                    cache_get,self.database.get_php_dsn(sqlcharset),
+                    SQLuploadGenerator.PHP_GEN_PDO % tablename if generations
+                                          else SQLuploadGenerator.PHP_NO_GEN,
+                    sqlcolumns,tablename,
+                    SQLuploadGenerator.PHP_NOT_MODIFIED,tablename,
+                    SQLuploadGenerator.PHP_CACHE_PUT)
+            elif phpdriver=='mysqli' and self.database.has_server:
+                base_php = SQLuploadGenerator.PHP_MYSQLI % (
+                    cache_get,
+                    SQLuploadGenerator.PHP_GEN_MYSQLI % tablename if generations
+                                          else SQLuploadGenerator.PHP_NO_GEN,
+                    sqlcolumns,tablename,
+                    SQLuploadGenerator.PHP_NOT_MODIFIED,tablename,
+                    SQLuploadGenerator.PHP_CACHE_PUT)
             else:
-                logerr("unknown PHP MySQL driver '%s'" % phpdriver)
+                logerr("PHP MySQL driver '%s' unknown or not applicable to database type '%s'" % (phpdriver,database_type))
                 return
 
             try:
-                conn.execute(SQLuploadGenerator.SQL_CREATE % (tablename,blobtype))
+                if generations and not is_spooling:
+                    self.database.prepare_generations(conn,tablename,blobtype)
+                else:
+                    conn.execute(self.database.SQL_CREATE % (tablename,blobtype))
             except Exception as e:
                 if log_failure:
                     logerr("could not create table '%s': %s %s" % (
                                              tablename,e.__class__.__name__,e))
                 return
+            try:
+                if not is_spooling and self.database.SQL_ADD_HASH:
+                    conn.execute(self.database.SQL_ADD_HASH % tablename)
+                    loginf("added column `HASH` to table '%s'" % tablename)
+            except Exception as e:
+                # The column already exists.
+                logdbg("column `HASH` not added: %s %s" % (e.__class__.__name__,e))
             try:
                 fn = os.path.join(target_path,'weewxsqlupload.php')
                 with open(fn,'wt') as f:
                     f.write(SQLuploadGenerator.PHP_START)
-                    f.write(SQLuploadGenerator.PHP_INI % (
-                                         'localhost',username,password,dbname))
+                    f.write(SQLuploadGenerator.PHP_INI % tuple(
+                        php_escape(i or '') for i in (
+                                       'localhost',username,password,dbname)))
+                    f.write(self.get_php_cache_ini())
                     f.write(base_php)
                     f.write(SQLuploadGenerator.PHP_END)
             except OSError as e:
@@ -488,6 +1074,44 @@ class SQLuploadGenerator(weewx.reportengine.ReportGenerator):
                     logerr("could not write %s: %s %s" % (fn,e.__class__.__name__))
                 return
         
+        # The records of this report cycle become the generation after
+        # the one the PHP scripts currently read.
+        if generations and not is_spooling and not self.dry_run:
+            try:
+                if spool.exists():
+                    # The table may not exist if the first run was offline.
+                    self.database.prepare_generations(conn,tablename,blobtype)
+                generation, generation_pending = self.database.get_generation(
+                                                               conn,tablename)
+            except Exception as e:
+                if log_failure:
+                    logerr("could not read the generation pointer: %s %s" % (
+                                                       e.__class__.__name__,e))
+                return
+            self.generation = generation+1
+            sql_ins_str, sql_upd_str = self.database.get_generation_sql(
+                                                   tablename,self.generation)
+            logdbg("uploading generation %s" % self.generation)
+        if self.sync:
+            self.sync.start(target_path, sql_last_upload, self.database,
+                                               tablename, self.generation)
+
+        # upload the records saved while the database server was not
+        # reachable
+        if not is_spooling and not self.dry_run and spool.exists():
+            if not generations:
+                try:
+                    # The table may not exist if the first run was offline.
+                    conn.execute(self.database.SQL_CREATE % (tablename,blobtype))
+                except Exception as e:
+                    logdbg("could not create table '%s': %s %s" % (
+                                             tablename,e.__class__.__name__,e))
+            if spool.replay(conn, tablename, sql_ins_str, sql_upd_str,
+                weeutil.weeutil.to_int(generator_dict.get('spool_batch_size',50)),
+                self.max_record_size, log_success, log_failure,
+                self.generation):
+                generation_pending = True
+
         # get default actions
         global_actions = generator_dict.get('actions',
                              ['sqlupload','writephp','blockftp','adjustlinks'])
@@ -495,36 +1119,93 @@ class SQLuploadGenerator(weewx.reportengine.ReportGenerator):
         global_preserveext = weeutil.weeutil.to_bool(generator_dict.get(
                                          'preserve_file_name_extension',False))
         global_divide_tag = generator_dict.get('html_divide_tag','html')
+        global_regions = generator_dict.get('html_dynamic_regions')
+        global_optimize_images = generator_dict.get('optimize_images',False)
+        global_minify = generator_dict.get('minify',False)
+        global_inline_below = generator_dict.get('inline_assets_below',0)
         logdbg("global options: actions=%s html_divide_tag='%s'" % (global_actions,global_divide_tag))
-        
+        # time budget for this report cycle
+        cycle_time_budget = weeutil.weeutil.to_float(
+                               generator_dict.get('cycle_time_budget',0) or 0)
+        # size and time budget of one transaction
+        transaction_max_bytes = weeutil.weeutil.to_int(
+                      generator_dict.get('transaction_max_bytes',16777216) or 0)
+        transaction_max_time = weeutil.weeutil.to_float(
+                      generator_dict.get('transaction_max_time',10) or 0)
+
         # list of link targets to replace
         files_list = self.get_links_to_replace(generator_dict,global_actions)
-        if __name__ == '__main__':
+        inline_files = set(os.path.normpath(i) for i in files_list)
+        if testing:
             print('------ files_list ------')
             print(files_list)
             print('------------------------')
         
+        # additional database servers to upload to
+        self.targets = []
+        if not self.dry_run:
+            targets_dict = self.skin_dict.get('SQLuploadTargets',
+                                                        configobj.ConfigObj())
+            for target in targets_dict.sections:
+                if not weeutil.weeutil.to_bool(
+                                   targets_dict[target].get('enable',True)):
+                    continue
+                target_dict = {
+                    'host':dbhost,
+                    'port':dbport,
+                    'username':username,
+                    'password':password,
+                    'database_name':dbname,
+                    'table_name':tablename,
+                    'database_type':database_type,
+                    'SQLITE_ROOT':sqlite_root,
+                    'generations':generations,
+                    'log_success':log_success,
+                    'log_failure':log_failure
+                }
+                target_dict.update(targets_dict[target])
+                target_dict.pop('enable',None)
+                self.targets.append(SQLuploadTarget(target,target_path,
+                                       self.first_run,blobtype,**target_dict))
+            for target in self.targets:
+                target.start()
+
         split_thread_time1 = time.thread_time_ns()
         process_thread_times = []
 
         # begin transaction
         conn.begin()
+        self.transaction_start = time.time()
+        self.transaction_bytes = 0
+        self.transaction_records = 0
+        self.commit_latencies = []
         
         ct = 0
         ctc = 0
         ctr = 0
-        for section in generator_dict.sections:
+        bytes_saved = 0
+        deferred = []
+        # sections processed successfully or with nothing to do
+        done = set()
+        for section in self.schedule_sections(generator_dict, target_path,
+                                              sql_last_upload, changed_files):
             if not self.running: break
             # If `enable` is `False` go to the next entry
             if not weeutil.weeutil.to_bool(
                                    generator_dict[section].get('enable',True)):
                 logdbg("Section '%s' not enabled. Skipped." % section)
+                done.add(section)
                 continue
+            # Sections that were deferred by a previous cycle are due
+            # irrespective of `first_run_only`.
+            was_deferred = sql_last_upload.get_deferred(section)>0
             # If `first_run_only` is set and this is not the first run
             # after restart, go to the next entry.
-            if (not self.first_run and weeutil.weeutil.to_bool(
+            if (not self.first_run and not was_deferred and
+                    weeutil.weeutil.to_bool(
                          generator_dict[section].get('first_run_only',False))):
                 logdbg("Section '%s' first run only. Skipped." % section)
+                done.add(section)
                 continue
             # file name
             file = generator_dict[section].get('file',section)
@@ -532,13 +1213,34 @@ class SQLuploadGenerator(weewx.reportengine.ReportGenerator):
             full_local_path = os.path.join(target_path,file)
             # file name extension
             fext = os.path.splitext(file)[1]
+            # Files of closed periods are not checked anymore after they
+            # were processed once.
+            closed_period = weeutil.weeutil.to_bool(
+                         generator_dict[section].get('closed_period',False))
             # Check if file is updated since the last processing
             try:
-                if os.path.getmtime(full_local_path)<=sql_last_upload.get_timestamp(file):
+                mtime = os.path.getmtime(full_local_path)
+                # Files embedded into the page count as part of it.
+                for asset in sql_last_upload.get_inlined(file):
+                    mtime = max(mtime,
+                            os.path.getmtime(os.path.join(target_path,asset)))
+                if (mtime<=sql_last_upload.get_timestamp(file) and
+                              not self.targets_behind(sql_last_upload,file)):
                     logdbg("Section '%s': File '%s' was not updated. Skipped." % (section,file))
+                    if closed_period: sql_last_upload.add_closed(file)
+                    sql_last_upload.add_checked(section,int(time.time()))
+                    done.add(section)
                     continue
             except (OSError,ArithmeticError,TypeError,ValueError):
                 pass
+            # If the time budget of this report cycle is used up, defer
+            # the section to the next cycle. At least one section is
+            # processed each cycle to make sure there is progress.
+            if (cycle_time_budget>0 and process_thread_times and
+                                time.time()-start_ts>cycle_time_budget):
+                sql_last_upload.add_deferred(section)
+                deferred.append(section)
+                continue
             # debug message
             logdbg("processing section '%s', file '%s'" % (section,file))
             # actions
@@ -558,18 +1260,38 @@ class SQLuploadGenerator(weewx.reportengine.ReportGenerator):
             x = file.split('/')
             inc_file = '/'.join((['..']*(len(x)-1))+['weewxsqlupload.php'])
             logdbg("include file '%s'" % inc_file)
-            php = SQLuploadGenerator.PHP_INCL % (section,inc_file)
+            # HTML pages with several dynamic regions use one database
+            # record for each region.
+            if (fext in ('.html','.htm') and 'writephp' in actions and
+                                                     'sqlupload' in actions):
+                regions = self.get_regions(generator_dict[section],section,
+                                                                global_regions)
+            else:
+                regions = []
+            if regions:
+                ids = [i[0] for i in regions]
+                php = SQLuploadGenerator.PHP_INCL_IDS % (
+                         ','.join('"%s"' % php_escape(i) for i in ids),inc_file)
+            else:
+                ids = [section]
+                php = SQLuploadGenerator.PHP_INCL % (php_escape(section),
+                                                                    inc_file)
             # read file and process
             try:
                 # Insert record into the database if it is not already there
-                if self.first_run and 'sqlupload' in actions:
-                    try:
-                        logdbg(sql_ins_str)
-                        conn.execute(sql_ins_str,(section,))
-                    except Exception as e:
-                        logerr(e)
+                # (Generational uploads insert the records by the upload
+                # statement itself.)
+                if ((self.first_run or was_deferred) and 'sqlupload' in actions
+                                                   and not self.generation):
+                    for id in ids:
+                        try:
+                            logdbg(sql_ins_str)
+                            conn.execute(sql_ins_str,(id,))
+                        except Exception as e:
+                            logerr(e)
                 # Process file according to the content type
                 start_process_file = time.thread_time_ns()
+                inlined = []
                 if fext in ('.html','.htm'):
                     # HTML is divided into a constant and a variable part,
                     # and links are adjusted if configured to do so.
@@ -580,10 +1302,22 @@ class SQLuploadGenerator(weewx.reportengine.ReportGenerator):
                         )
                     else:
                         tag = 'none'
+                    # Small images and style sheets can be embedded into
+                    # the variable part, saving requests to the server.
+                    inline_below = weeutil.weeutil.to_int(generator_dict[
+                        section].get('inline_assets_below',global_inline_below))
+                    if inline_below and tag!='none':
+                        inline_asset = functools.partial(
+                            self.get_inline_asset, target_path, file,
+                                       inline_files, inline_below, inlined)
+                    else:
+                        inline_asset = None
                     if tag!='none' or 'adjustlinks' in actions:
                         # parse the file for the divide tag and links
                         data = self.process_html(full_local_path, php, tag, 
-                                files_list if 'adjustlinks' in actions else [])
+                                files_list if 'adjustlinks' in actions else [],
+                                regions if tag!='none' else None,
+                                inline_asset)
                     else:
                         # upload the file by SQL unchanged
                         data = self.process_other(full_local_path, php,
@@ -619,37 +1353,105 @@ class SQLuploadGenerator(weewx.reportengine.ReportGenerator):
                             generator_dict[section].get('encoding')
                         )
                     )
+                # Minify HTML, JavaScript, CSS, and JSON after the
+                # links were adjusted
+                if (data[2] and weeutil.weeutil.to_bool(
+                        generator_dict[section].get('minify',global_minify))):
+                    if isinstance(data[1],dict):
+                        db_data = {id:minify(val,data[2]) 
+                                               for id, val in data[1].items()}
+                    else:
+                        db_data = minify(data[1],data[2])
+                    data = (data[0],db_data,data[2])
+                # Optimize PNG images before upload
+                if ('sqlupload' in actions and 
+                    data[2] and data[2].startswith('image/png') and 
+                    weeutil.weeutil.to_bool(generator_dict[section].get(
+                                     'optimize_images',global_optimize_images))):
+                    db_data = optimize_png(data[1])
+                    bytes_saved += len(data[1])-len(db_data)
+                    data = (data[0],db_data,data[2])
                 end_process_file = time.thread_time_ns()
                 process_thread_times.append((section,end_process_file-start_process_file))
                 # Abort loop in case of program shutdown
                 if not self.running: break
                 # Transfer data to the server according to configuration
-                uploaded, changed, removed = self.transfer(
+                result = self.transfer(
                         conn,full_local_path,actions,preserveext,sql_upd_str,section,data,sql_last_upload)
+                if result is None:
+                    # The upload failed. Neither the timestamp nor the
+                    # check are recorded, so that the file is processed
+                    # again during the next report cycle.
+                    continue
+                uploaded, changed, removed = result
                 # Statistics
                 ct += uploaded
                 ctc += changed
                 ctr += removed
+                # Commit if the transaction exceeds its budget, so that
+                # locks are not held too long. Generations are invisible
+                # to the PHP scripts until the end of the report cycle,
+                # so their records are committed file by file.
+                if self.transaction_records and (self.generation or
+                    (transaction_max_bytes and 
+                        self.transaction_bytes>=transaction_max_bytes) or
+                    (transaction_max_time and
+                        time.time()-self.transaction_start>=transaction_max_time)):
+                    self.commit(conn)
+                    conn.begin()
                 # processing timestamp
                 # Note: int() always rounds downwards. So add 1 to round upwards.
-                sql_last_upload.add_timestamp(file,int(time.time())+1)
+                timestamp = int(time.time())+1
+                sql_last_upload.add_timestamp(file,timestamp)
+                for target in self.targets:
+                    target.put_timestamp(file,timestamp)
+                sql_last_upload.set_inlined(file,inlined)
+                sql_last_upload.clear_deferred(section)
+                sql_last_upload.add_checked(section,int(time.time()))
+                if closed_period: sql_last_upload.add_closed(file)
+                done.add(section)
                 # update #FTP.last
-                if 'blockftp' in actions and has_pickle:
-                    ftp_last_upload.add(
-                        full_local_path,
-                        weeutil.ftpupload.sha256sum(full_local_path) if has_hashlib else None
-                    )
+                if 'blockftp' in actions and ftp_last_upload.available:
+                    ftp_last_upload.add(full_local_path)
             
             except (LookupError,TypeError,ValueError,OSError,ArithmeticError) as e:
                 if log_failure and not file.endswith('.png'):
                     logerr('%s %s' % (e.__class__.__name__,e))
         
         # commit transaction
-        if ct: conn.commit()
+        if self.transaction_records: self.commit(conn)
+        # make the new generation visible
+        if self.generation and not self.sync and (ct or generation_pending):
+            try:
+                # end the transaction begun after the last commit
+                conn.commit()
+                self.database.flip_generation(conn,tablename,self.generation)
+                logdbg("generation %s visible" % self.generation)
+            except Exception as e:
+                if log_failure:
+                    logerr("could not switch to generation %s: %s %s" % (
+                                  self.generation,e.__class__.__name__,e))
         split_thread_time2 = time.thread_time_ns()
         # close database connection
         conn.close()
+        # wait for the additional targets to finish
+        for target in self.targets:
+            target.finish()
+        for target in self.targets:
+            target.join()
+        if self.sync:
+            self.sync.finish(sql_last_upload)
         
+        # Keep the changes of the sections that failed or were deferred,
+        # and of those that `schedule_sections()` held back because of
+        # their refresh interval or a closed period.
+        if use_inotify:
+            sql_last_upload.set_dirty(self.get_pending_files(generator_dict,
+                    [section for section in generator_dict.sections
+                        if section not in done and weeutil.weeutil.to_bool(
+                                   generator_dict[section].get('enable',True))],
+                    changed_files, sql_last_upload))
+
         # save hashes and timestamps
         sql_last_upload.save()
         ftp_last_upload.save()
@@ -665,6 +1467,20 @@ class SQLuploadGenerator(weewx.reportengine.ReportGenerator):
                 ctr,'' if ctr==1 else 's',
                 end_ts-start_ts,
                 (end_thread_time-start_thread_time)*0.000000001))
+        if bytes_saved and log_success:
+            loginf('Image optimization saved %s bytes' % bytes_saved)
+        if log_success and self.commit_latencies and (
+                                 log_load or len(self.commit_latencies)>1):
+            loginf('Committed %s transaction%s, commit latency average %.3f seconds, maximum %.3f seconds' % (
+                len(self.commit_latencies),
+                '' if len(self.commit_latencies)==1 else 's',
+                sum(self.commit_latencies)/len(self.commit_latencies),
+                max(self.commit_latencies)))
+        if deferred:
+            loginf('Time budget of %.1f seconds used up. Deferred %s section%s to the next cycle: %s' % (
+                cycle_time_budget,
+                len(deferred),'' if len(deferred)==1 else 's',
+                ', '.join(deferred)))
         if log_load:
             loginf('elapsed CPU time: open %.3fs, loop %.3fs, close %.3fs' % (
                 (split_thread_time1-start_thread_time)*0.000000001,
@@ -708,37 +1524,234 @@ class SQLuploadGenerator(weewx.reportengine.ReportGenerator):
                 files_list.append(file)
         return files_list
 
+    def schedule_sections(self, generator_dict, target_path, sql_last_upload,
+                                                            changed_files=None):
+        """ order of the sections to process
+
+            Sections that were deferred in a previous cycle because the
+            time budget was used up come first, the more often deferred
+            the earlier. The other sections follow according to their
+            priority. Within the same priority smaller files are processed
+            first. If all that is equal, the order of the configuration
+            is preserved.
+
+            If `changed_files` is a set of file names, sections whose
+            file is not in it are omitted unless they were deferred or
+            never processed before.
+
+            Sections whose refresh interval has not elapsed since they
+            were checked the last time are omitted, too.
+
+            Sections whose file an additional target did not receive yet
+            are never omitted.
+        """
+        schedule = []
+        now = time.time()
+        for idx, section in enumerate(generator_dict.sections):
+            file = generator_dict[section].get('file',section)
+            refresh_interval = self.get_refresh_interval(generator_dict,section)
+            behind = self.targets_behind(sql_last_upload,file)
+            if (refresh_interval and not self.first_run and not behind and
+                    not sql_last_upload.get_deferred(section) and
+                    now-sql_last_upload.get_checked(section)<refresh_interval):
+                continue
+            # Files of closed periods do not change anymore. Once uploaded
+            # they are checked again after the restart of WeeWX only.
+            if (not self.first_run and sql_last_upload.is_closed(file) and
+                    not behind and not sql_last_upload.get_deferred(section)):
+                continue
+            if (changed_files is not None and not behind and
+                    os.path.normpath(file) not in changed_files and
+                    not any(asset in changed_files for asset in 
+                                      sql_last_upload.get_inlined(file)) and
+                    not sql_last_upload.get_deferred(section) and
+                    sql_last_upload.get_timestamp(file)):
+                continue
+            try:
+                size = os.path.getsize(os.path.join(target_path,file))
+            except OSError:
+                size = 0
+            schedule.append((
+                -sql_last_upload.get_deferred(section),
+                self.get_priority(generator_dict[section],file),
+                size,
+                idx,
+                section
+            ))
+        schedule.sort()
+        return [i[-1] for i in schedule]
+
+    def get_pending_files(self, generator_dict, sections, changed_files,
+                                                              sql_last_upload):
+        """ changed files to be processed by a later report cycle
+
+            These are the files of `sections` and the files embedded into
+            them that are in `changed_files`. If `changed_files` is `None`,
+            that is, the changes are not known, all of them.
+        """
+        pending = set()
+        for section in sections:
+            file = generator_dict[section].get('file',section)
+            for path in [os.path.normpath(file)]+sql_last_upload.get_inlined(file):
+                if changed_files is None or path in changed_files:
+                    pending.add(path)
+        return pending
+
+    def targets_behind(self, sql_last_upload, file):
+        """ Is there an additional target that did not get the file yet? 
+        
+            A target that was not reachable records no timestamp, so the
+            file is processed again during the next report cycle.
+        """
+        timestamp = sql_last_upload.get_timestamp(file)
+        return any(target.sql_last_upload.get_timestamp(file)<timestamp
+                                                  for target in self.targets)
+
+    def get_refresh_interval(self, generator_dict, section):
+        """ minimum time in seconds between two checks of a section
+        
+            `refresh_interval` is looked up in the section and then in
+            the generator section. `stale_age` of a section is used if 
+            `refresh_interval` is not set there.
+        """
+        section_dict = generator_dict[section]
+        if 'refresh_interval' in section_dict:
+            val = section_dict['refresh_interval']
+        elif 'stale_age' in section_dict:
+            val = section_dict['stale_age']
+        else:
+            val = generator_dict.get('refresh_interval')
+        return weeutil.weeutil.to_int(val) if val else 0
+
+    def get_regions(self, section_dict, section, default=None):
+        """ dynamic regions of an HTML page
+        
+            The key `html_dynamic_regions` contains a list of selectors
+            as described in `parse_region_selector()`. Each region gets
+            its own database record. Its ID is the section name and the
+            number of the region.
+            
+            Returns:
+                list: tuples of record ID, parsed selector, and the PHP
+                    code to insert in place of the region
+        """
+        selectors = section_dict.get('html_dynamic_regions',default)
+        if not selectors: return []
+        if isinstance(selectors,str): selectors = [selectors]
+        regions = []
+        for idx, selector in enumerate(selectors):
+            id = '%s#%s' % (section,idx+1)
+            if len(id)>32:
+                # The ID column is CHAR(32).
+                if has_hashlib:
+                    id = hashlib.md5(id.encode('utf-8')).hexdigest()
+                else:
+                    id = '%s~%08x' % (id[:23],
+                                  zlib.crc32(id.encode('utf-8'))&0xffffffff)
+            regions.append((
+                id,
+                parse_region_selector(selector),
+                SQLuploadGenerator.PHP_ECHO_REGION % (php_escape(id),
+                                                      php_escape(id))
+            ))
+        return regions
+
+    def get_priority(self, section_dict, file):
+        """ priority of a section, lower values are processed first
+
+            If the section does not contain the key `priority`, the value
+            is derived from the file name. Home pages come first, then
+            other web pages, then data files, and images last. Files
+            covering a year are put at the end of their group.
+        """
+        if 'priority' in section_dict:
+            return weeutil.weeutil.to_int(section_dict['priority'])
+        name, ext = os.path.splitext(os.path.basename(file))
+        if name=='index':
+            priority = 0
+        elif ext in ('.html','.htm','.php'):
+            priority = 10
+        elif ext in ('.js','.json','.css','.txt','.xml'):
+            priority = 20
+        else:
+            priority = 30
+        if name.startswith('year'):
+            priority += 5
+        return priority
+
+    def commit(self, conn):
+        """ commit the transaction and measure the latency """
+        start_ts = time.time()
+        conn.commit()
+        end_ts = time.time()
+        self.commit_latencies.append(end_ts-start_ts)
+        logdbg("committed %s records of %s bytes in %.3f seconds" % (
+               self.transaction_records,self.transaction_bytes,end_ts-start_ts))
+        self.transaction_start = end_ts
+        self.transaction_bytes = 0
+        self.transaction_records = 0
+
     def transfer(self, conn, file, actions, preserveext, sql_str, id, data, sql_last_upload):
-        """ upload to database and change file """
+        """ upload to database and change file 
+        
+            Returns the numbers of uploaded records, changed files, and
+            removed files, or `None` if uploading a record failed.
+        """
         if 'sqlupload' in actions:
-            # Has data changed?
-            if has_hashlib:
-                filehash = hashlib.sha256(data[1]).hexdigest()
-            else:
-                filehash = None
-            # upload to database
-            if not filehash or filehash!=sql_last_upload.get_hash(id):
-                try:
-                    mtime = os.path.getmtime(file)
-                except OSError:
-                    mtime = time.time()
-                try:
-                    if self.dry_run:
-                        print('SQL execute',sql_str)
-                        print("      `ID`='%s'" % id)
-                        print('-----------------')
-                        print(data[1])
-                        print('-----------------')
-                    else:
-                        logdbg(sql_str)
-                        conn.execute(sql_str,(data[1],data[2],mtime,id))
-                except Exception:
-                    return (0,0,0)
-                uploaded = 1
+            # Several dynamic regions of an HTML page are uploaded to
+            # records of their own, and change detection is done for
+            # each of them separately.
+            if isinstance(data[1],dict):
+                records = data[1]
             else:
-                logdbg("no need to upload id '%s'" % id)
-                uploaded = 0
-            sql_last_upload.add_hash(id,filehash)
+                records = {id:data[1]}
+            uploaded = 0
+            try:
+                mtime = os.path.getmtime(file)
+            except OSError:
+                mtime = time.time()
+            for record_id, db_data in records.items():
+                # Has data changed?
+                if has_hashlib:
+                    filehash = hashlib.sha256(db_data).hexdigest()
+                else:
+                    filehash = None
+                # pass to the additional targets, they check by themselves
+                for target in self.targets:
+                    target.put(record_id,db_data,data[2],mtime,filehash)
+                # upload to database
+                if not filehash or filehash!=sql_last_upload.get_hash(record_id):
+                    try:
+                        if self.dry_run:
+                            print('SQL execute',sql_str)
+                            print("      `ID`='%s'" % record_id)
+                            print('-----------------')
+                            print(db_data)
+                            print('-----------------')
+                        elif self.sync:
+                            # uploaded by the connections of the `sync`
+                            # command, which save the hash on success
+                            self.sync.put(record_id,db_data,data[2],mtime,
+                                filehash,sql_last_upload.get_chunks(record_id)>0)
+                            uploaded += 1
+                            continue
+                        else:
+                            logdbg(sql_str)
+                            sql_last_upload.set_chunks(record_id,upload_record(
+                                conn,self.tablename,sql_str,record_id,db_data,
+                                data[2],mtime,filehash,self.max_record_size,
+                                sql_last_upload.get_chunks(record_id)>0,
+                                self.generation))
+                        self.transaction_bytes += len(db_data)
+                        self.transaction_records += 1
+                    except Exception as e:
+                        logerr("could not upload record '%s' of %s bytes: %s %s" % (
+                               record_id,len(db_data),e.__class__.__name__,e))
+                        return None
+                    uploaded += 1
+                else:
+                    logdbg("no need to upload id '%s'" % record_id)
+                sql_last_upload.add_hash(record_id,filehash)
         else:
             uploaded = 0
             if 'writephp' not in actions and 'adjustlinks' in actions:
@@ -874,7 +1887,8 @@ class SQLuploadGenerator(weewx.reportengine.ReportGenerator):
         )
         return file_data, db_data.encode('utf-8','ignore'), 'text/javascript'
 
-    def process_html(self, file, php, divide_tag, files_list):
+    def process_html(self, file, php, divide_tag, files_list, regions=None,
+                                                            inline_asset=None):
         """ split HTML in constant and variable part 
         
             The file is split at the tag defined by the parameter `divide_tag`.
@@ -884,10 +1898,16 @@ class SQLuploadGenerator(weewx.reportengine.ReportGenerator):
             part from the end tag to the end of the file. The return value
             `db_data` contains the part of the file from the start tag to
             the end tag (excluding the tags).
+            
+            If `regions` is not empty, the file is split into several
+            variable parts instead, and `db_data` is a dict of them by
+            record ID.
+
+            `inline_asset` is passed to `HTMLdivideMixin`, see there.
         """
         try:
             # initialize parser
-            parser = HTMLdivide(
+            parser = get_html_divide_class()(
                 '%s%s%s' % (
                     SQLuploadGenerator.PHP_START,
                     SQLuploadGenerator.PHP_ECHO,
@@ -895,7 +1915,9 @@ class SQLuploadGenerator(weewx.reportengine.ReportGenerator):
                 ),
                 files_list,
                 divide_tag,
-                convert_charrefs=False)
+                convert_charrefs=False,
+                regions=regions,
+                inline_asset=inline_asset)
             # feed file into the parser
             with open(file,'rt',encoding='utf-8') as f:
                 for line in f:
@@ -907,11 +1929,51 @@ class SQLuploadGenerator(weewx.reportengine.ReportGenerator):
                 SQLuploadGenerator.PHP_END,
                 parser.php_data
             )
-            db_data = parser.db_data
+            if regions:
+                for region in parser.regions:
+                    logdbg("region '%s' not found in '%s'" % (region[0],file))
+                db_data = {id:data.encode('utf-8','ignore') 
+                                  for id, data in parser.region_data.items()}
+            else:
+                db_data = parser.db_data.encode('utf-8','ignore')
         except (ValueError,TypeError,LookupError) as e:
             logerr("error parsing HTML file '%s': %s %s" % (file,e.__class__.__name__))
             return None, None, None
-        return file_data, db_data.encode('utf-8','ignore'), 'text/html'
+        return file_data, db_data, 'text/html'
+
+    def get_inline_asset(self, target_path, page, files_list, max_size,
+                                                            inlined, href):
+        """ content type and content of a file to embed into a page
+
+            Only images and style sheets that are smaller than `max_size`
+            bytes and that are uploaded by SQLupload themselves are
+            embedded. Style sheets referring to other files are embedded
+            only if they are in the same directory as the page. The
+            files embedded are appended to `inlined`.
+        """
+        if not href: return None
+        href = href.split('?')[0].split('#')[0]
+        if not href or ':' in href or href.startswith('/'): return None
+        asset = os.path.normpath(os.path.join(os.path.dirname(page),href))
+        if asset not in files_list: return None
+        content_type = SQLuploadGenerator.OTHER_FILES.get(
+                                          os.path.splitext(asset)[1].lower())
+        if not content_type or not (content_type.startswith('image/') or
+                                                   content_type=='text/css'):
+            return None
+        try:
+            full_path = os.path.join(target_path,asset)
+            if os.path.getsize(full_path)>=max_size: return None
+            with open(full_path,'rb') as f:
+                data = f.read()
+        except OSError:
+            return None
+        if content_type=='text/css' and (b'</style' in data.lower() or
+                (b'url(' in data or b'@import' in data) and
+                   os.path.dirname(asset)!=os.path.dirname(os.path.normpath(page))):
+            return None
+        if asset not in inlined: inlined.append(asset)
+        return content_type, data
         
     def create_user(self, conn, databasename, tablename):
         try:
@@ -920,7 +1982,7 @@ class SQLuploadGenerator(weewx.reportengine.ReportGenerator):
         except Exception as e:
             logerr('%s %s' % (e.__class__.__name__,e))
     
-    def merge_skin(self, generator_dict):
+    def merge_skin(self, generator_dict, target_path):
         """ merge skin configuration into the SQLupload confiuration """
         global_divide_tag = generator_dict.get('html_divide_tag','html')
         skin_name = generator_dict['merge_skin']
@@ -940,7 +2002,7 @@ class SQLuploadGenerator(weewx.reportengine.ReportGenerator):
         )
         skin_dict = configobj.ConfigObj(skin_path)
         logdbg('skin_path=%s' % skin_path)
-        if __name__ == '__main__':
+        if testing:
             logdbg('skin_dict=%s' % skin_dict)
         # CheetahGenerator files
         for sec,val in skin_dict.get('CheetahGenerator',configobj.ConfigObj()).get('ToDate',configobj.ConfigObj()).items():
@@ -950,17 +2012,27 @@ class SQLuploadGenerator(weewx.reportengine.ReportGenerator):
             elif weeutil.weeutil.to_bool(val.get('generate_once',False)):
                 logdbg("'%s' generate_once" % sec)
             else:
-                stale_age = weeutil.weeutil.to_int(val.get('stale_age',0))
-                if stale_age<=300:
-                    template = val.get('template')
-                    if template:
-                        # remove .tmpl
-                        template = os.path.splitext(template)[0]
-                        generator_dict[sec] = {
-                            'file':template
-                        }
-                        if 'encoding' in val:
-                            generator_dict[sec]['encoding'] = val['encoding']
+                template = val.get('template')
+                if template:
+                    # remove .tmpl
+                    template = os.path.splitext(template)[0]
+                    generator_dict[sec] = {
+                        'file':template
+                    }
+                    if 'encoding' in val:
+                        generator_dict[sec]['encoding'] = val['encoding']
+                    # The file is not created more often than `stale_age`
+                    # says, so it need not be checked more often.
+                    if 'stale_age' in val:
+                        generator_dict[sec]['stale_age'] = val['stale_age']
+        # CheetahGenerator files by period like NOAA reports
+        for summary in ('SummaryByDay','SummaryByMonth','SummaryByYear'):
+            summary_dict = skin_dict.get('CheetahGenerator',
+                              configobj.ConfigObj()).get(summary,configobj.ConfigObj())
+            for sec in summary_dict.sections:
+                logdbg('merge_skin %s %s' % (summary,sec))
+                self.merge_summary(generator_dict, target_path, sec,
+                                                         summary_dict[sec])
         # ImageGenerator files
         image_dict = skin_dict.get('ImageGenerator',configobj.ConfigObj())
         for sec in image_dict.sections:
@@ -971,6 +2043,9 @@ class SQLuploadGenerator(weewx.reportengine.ReportGenerator):
                     'file':'%s.png' % subsec,
                     'content_type':'image/png',
                 }
+                stale_age = val[subsec].get('stale_age',val.get('stale_age'))
+                if stale_age:
+                    generator_dict['%s-%s' % (sec,subsec)]['stale_age'] = stale_age
         # Belchertown HighCharts files
         if 'user.belchertown.HighchartsJsonGenerator' in skin_dict.get(
                   'Generators',configobj.ConfigObj()).get('generator_list',[]):
@@ -982,7 +2057,7 @@ class SQLuploadGenerator(weewx.reportengine.ReportGenerator):
             )
             graphs_dict = configobj.ConfigObj(graphs_path)
             logdbg('graphs_path=%s' % graphs_path)
-            if __name__ == '__main__':
+            if testing:
                 logdbg('graphs_dict=%s' % graphs_dict)
             for sec in graphs_dict.sections:
                 logdbg('merge_skin %s' % sec)
@@ -996,6 +2071,94 @@ class SQLuploadGenerator(weewx.reportengine.ReportGenerator):
                         'encoding':'utf-8',
                     }
 
+    # placeholders in the template names of `SummaryByDay`, 
+    # `SummaryByMonth`, and `SummaryByYear`
+    SUMMARY_PLACEHOLDERS = {
+        '%Y': r'(?P<year>[0-9]{4})',
+        '%m': r'(?P<month>[0-9]{2})',
+        '%d': r'(?P<day>[0-9]{2})'
+    }
+
+    def merge_summary(self, generator_dict, target_path, sec, val):
+        """ add a section for each existing file of a summary template
+        
+            Files of periods that ended more than a day ago are marked 
+            by `closed_period`.
+        """
+        template = val.get('template')
+        if not template: return
+        # remove .tmpl
+        template = os.path.splitext(template)[0]
+        dirname, basename = os.path.split(template)
+        if '%' in dirname:
+            logdbg("'%s': placeholders in directory names not supported" % sec)
+            return
+        pattern = re.escape(basename)
+        for placeholder, regex in SQLuploadGenerator.SUMMARY_PLACEHOLDERS.items():
+            pattern = pattern.replace(re.escape(placeholder),regex,1)
+        if '%' in pattern:
+            logdbg("'%s': unsupported placeholder in '%s'" % (sec,template))
+            return
+        pattern = re.compile(pattern+'$')
+        try:
+            files = os.listdir(os.path.join(target_path,dirname))
+        except OSError:
+            files = []
+        now = time.time()
+        for fn in sorted(files):
+            match = pattern.match(fn)
+            if not match: continue
+            period = match.groupdict()
+            year = int(period['year'])
+            if 'day' in period:
+                end = (year,int(period['month']),int(period['day'])+1)
+            elif 'month' in period:
+                end = (year,int(period['month'])+1,1)
+            else:
+                end = (year+1,1,1)
+            name = '%s-%s' % (sec,'-'.join(period[i] 
+                         for i in ('year','month','day') if i in period))
+            if name in generator_dict:
+                logdbg("'%s' already in generator_dict" % name)
+                continue
+            generator_dict[name] = {
+                'file':os.path.join(dirname,fn)
+            }
+            if 'encoding' in val:
+                generator_dict[name]['encoding'] = val['encoding']
+            if time.mktime(end+(0,0,0,0,0,-1))<now-86400:
+                generator_dict[name]['closed_period'] = True
+
+    def get_php_cache_ini(self):
+        """ PHP variables that configure the cache in `weewxsqlupload.php`
+
+            `php_cache` is `none`, `apcu`, or `files`. `php_cache_ttl` is 
+            the time in seconds a cached record is delivered without 
+            asking the database, or `archive_interval` to use the archive
+            interval. By default, the cache is validated by each request.
+        """
+        cachetype = self.skin_dict.get('php_cache','none').lower()
+        if cachetype not in ('none','apcu','files'):
+            logerr("unknown PHP cache type '%s'" % cachetype)
+            cachetype = 'none'
+        cachedir = self.skin_dict.get('php_cache_dir')
+        if cachedir:
+            cachedir = '"%s"' % php_escape(cachedir)
+        else:
+            cachedir = 'sys_get_temp_dir() . "/weewxsqlupload-" . $dbname'
+        cachettl = self.skin_dict.get('php_cache_ttl',0)
+        if cachettl=='archive_interval':
+            cachettl = self.config_dict.get('StdArchive',
+                             configobj.ConfigObj()).get('archive_interval',300)
+        persistent = weeutil.weeutil.to_bool(
+                         self.skin_dict.get('php_persistent_connection',True))
+        return SQLuploadGenerator.PHP_CACHE_INI % (
+            'true' if persistent else 'false',
+            cachetype,
+            cachedir,
+            weeutil.weeutil.to_int(cachettl)
+        )
+
     def _get_content_type(self, content_type, encoding):
         """ put content type and encoding together """
         if encoding in ('html_entities','strict_ascii','normalized_ascii',None):
@@ -1004,29 +2167,492 @@ class SQLuploadGenerator(weewx.reportengine.ReportGenerator):
         return '%s; charset=%s' % (content_type,encoding)
 
 
-class SQLlastUpload(object):
-    """ manage state of SQL uploads """
-    
-    def __init__(self, target_path):
-        self.timestamp_file_path = os.path.join(target_path, '#SQLupload.last')
-        self.timestamp_dict, self.hash_dict = self._load()
-    
-    def add_hash(self, id, hash):
-        self.hash_dict[id] = hash
-    
-    def get_hash(self, id):
-        return self.hash_dict.get(id)
-    
-    def add_timestamp(self, file, timestamp):
-        self.timestamp_dict[file] = timestamp
-    
-    def get_timestamp(self, file):
-        return self.timestamp_dict.get(file,0)
-    
-    def _load(self):
-        """ Reads time, members, and hashes of the last upload """
+def get_max_record_size(conn):
+    """ maximum size of data that can be uploaded by one statement
+
+        The server rejects statements larger than `max_allowed_packet`.
+        Escaping can double the size of binary data within the
+        statement. Returns `None` if the limit cannot be determined.
+    """
+    try:
+        max_allowed_packet = int(conn.get_variable('max_allowed_packet')[1])
+        logdbg("max_allowed_packet=%s" % max_allowed_packet)
+        return max((max_allowed_packet-1024)//2,256)
+    except Exception as e:
+        logdbg("could not get max_allowed_packet: %s %s" % (
+                                                       e.__class__.__name__,e))
+        return None
+
+def upload_record(conn, tablename, sql_upd_str, id, data, content_type,
+                  mtime, filehash, max_record_size=None, had_chunks=True,
+                  generation=None):
+    """ upload a record, split it into chunks if it is too large
+
+        The first chunk is saved to the record itself, the others to
+        additional records with IDs `ID~001`, `ID~002` and so on, which
+        the PHP script appends. Chunk records of former uploads are
+        removed if `had_chunks` is `True`. In case of generational
+        uploads the chunk records belong to `generation`. Returns the
+        number of chunk records.
+    """
+    if max_record_size and len(data)>max_record_size:
+        chunks = [data[i:i+max_record_size]
+                           for i in range(0,len(data),max_record_size)]
+        if len(id)>28 or len(chunks)>1000:
+            raise ValueError("record '%s' of %s bytes cannot be split into chunks" % (id,len(data)))
+    else:
+        chunks = [data]
+    if generation is None:
+        sql_chunk_delete = SQLuploadGenerator.SQL_CHUNK_DELETE % tablename
+        sql_chunk_insert = SQLuploadGenerator.SQL_CHUNK_INSERT % tablename
+    else:
+        sql_chunk_delete = SQLbackend.SQL_GEN_CHUNK_DELETE % (tablename,generation)
+        sql_chunk_insert = SQLbackend.SQL_GEN_CHUNK_INSERT % (tablename,generation)
+    conn.execute(sql_upd_str,(chunks[0],content_type,mtime,filehash,id))
+    if had_chunks or len(chunks)>1:
+        conn.execute(sql_chunk_delete,
+                                  (re.sub(r'([\\%_])',r'\\\1',id)+'~%',))
+    for idx, chunk in enumerate(chunks[1:],1):
+        conn.execute(sql_chunk_insert,('%s~%03d' % (id,idx),chunk))
+    return len(chunks)-1
+
+
+class SQLbackend(object):
+    """ database specific parts of the upload, MySQL and MariaDB
+
+        The generator, the additional targets, the `sync` command, and
+        the LOOP upload service use an instance of this class or of one
+        of its subclasses to open connections and to get the SQL
+        statements. Which one is chosen by the `database_type` option,
+        see `get_backend()`.
+    """
+
+    # SQL commands
+    SQL_UPDATE = SQLuploadGenerator.SQL_UPDATE
+    SQL_INSERT = SQLuploadGenerator.SQL_INSERT
+    SQL_CREATE = SQLuploadGenerator.SQL_CREATE
+    SQL_ADD_HASH = SQLuploadGenerator.SQL_ADD_HASH
+    SQL_SELCOL = SQLuploadGenerator.SQL_SELCOL
+    # history table of the LOOP upload service
+    SQL_HISTORY_CREATE = 'CREATE TABLE IF NOT EXISTS %s(`dateTime` INT UNSIGNED PRIMARY KEY, `DATA` MEDIUMTEXT NULL)'
+    SQL_HISTORY_MAX = 'SELECT MAX(`dateTime`) FROM %s'
+    SQL_HISTORY_INSERT = 'INSERT IGNORE INTO %s(`dateTime`,`DATA`) VALUES %s'
+    # several records by one statement, inserted or updated
+    SQL_UPSERT = 'INSERT INTO %s(`ID`,`TEXT`,`CONTENTTYPE`,`MTIME`,`HASH`) VALUES %s ON DUPLICATE KEY UPDATE `TEXT`=VALUES(`TEXT`),`CONTENTTYPE`=VALUES(`CONTENTTYPE`),`MTIME`=VALUES(`MTIME`),`HASH`=VALUES(`HASH`)'
+    SQL_UPSERT_VALUES = '(?,?,?,FROM_UNIXTIME(?),?)'
+    # `ON DUPLICATE KEY` applies to the primary key `(ID,GEN)`, too
+    SQL_GEN_UPSERT = SQL_UPSERT
+    # compact table for the records of the LOOP upload service
+    SQL_LIVE_CREATE = 'CREATE TABLE IF NOT EXISTS %s(`ID` VARCHAR(32) NOT NULL PRIMARY KEY, `MTIME` TIMESTAMP NULL DEFAULT NULL, `CONTENTTYPE` VARCHAR(127) NULL, `HASH` CHAR(64) NULL, `TEXT` VARBINARY(%d) NULL)'
+    # generational uploads, rows are identified by `ID` and `GEN`
+    SQL_GEN_CREATE = 'CREATE TABLE IF NOT EXISTS %s(`ID` CHAR(32) NOT NULL, `GEN` INT UNSIGNED NOT NULL DEFAULT 0, `MTIME` TIMESTAMP NULL DEFAULT NULL, `CONTENTTYPE` VARCHAR(127) NULL, `HASH` CHAR(64) NULL, `TEXT` %s NULL, PRIMARY KEY(`ID`,`GEN`))'
+    SQL_GEN_ADD = 'ALTER TABLE %s ADD COLUMN `GEN` INT UNSIGNED NOT NULL DEFAULT 0 AFTER `ID`, DROP PRIMARY KEY, ADD PRIMARY KEY(`ID`,`GEN`)'
+    SQL_GEN_INSERT = 'INSERT IGNORE INTO %s(`ID`,`GEN`) VALUES (?,%d)'
+    SQL_GEN_UPDATE = 'INSERT INTO %s(`TEXT`,`CONTENTTYPE`,`MTIME`,`HASH`,`ID`,`GEN`) VALUES (?,?,FROM_UNIXTIME(?),?,?,%d) ON DUPLICATE KEY UPDATE `TEXT`=VALUES(`TEXT`),`CONTENTTYPE`=VALUES(`CONTENTTYPE`),`MTIME`=VALUES(`MTIME`),`HASH`=VALUES(`HASH`)'
+    SQL_GEN_CHUNK_INSERT = 'INSERT INTO %s(`ID`,`GEN`,`TEXT`) VALUES (?,%d,?)'
+    SQL_GEN_CHUNK_DELETE = 'DELETE FROM %s WHERE `ID` LIKE ? AND `GEN`=%d'
+    SQL_GEN_PENDING = 'SELECT COUNT(*) FROM %s WHERE `GEN`>?'
+    # the generation pointer, a table of one row
+    SQL_GEN_POINTER_CREATE = 'CREATE TABLE IF NOT EXISTS %s_gen(`ID` TINYINT PRIMARY KEY, `GEN` INT UNSIGNED NOT NULL)'
+    SQL_GEN_POINTER_INIT = 'INSERT IGNORE INTO %s_gen(`ID`,`GEN`) VALUES (0,0)'
+    SQL_GEN_POINTER_GET = 'SELECT `GEN` FROM %s_gen WHERE `ID`=0'
+    SQL_GEN_POINTER_SET = 'UPDATE %s_gen SET `GEN`=? WHERE `ID`=0'
+    # rows superseded by a newer one up to the given generation and
+    # chunk records left without their record
+    SQL_GEN_GC = 'DELETE o FROM %(table)s AS o JOIN %(table)s AS n ON n.`ID`=o.`ID` AND n.`GEN`>o.`GEN` AND n.`GEN`<=? WHERE o.`GEN`<?'
+    SQL_GEN_GC_CHUNKS = "DELETE c FROM %(table)s AS c LEFT JOIN %(table)s AS m ON m.`ID`=LEFT(c.`ID`,CHAR_LENGTH(c.`ID`)-4) AND m.`GEN`=c.`GEN` WHERE c.`ID` REGEXP '~[0-9]{3}$' AND c.`GEN`<? AND m.`ID` IS NULL"
+
+    # columns of a table and the index of the column name
+    SQL_COLUMNS = 'SHOW COLUMNS FROM %s'
+    SQL_COLUMNS_NAME = 0
+
+    # `True` if there is a database server with user accounts
+    has_server = True
+
+    def __init__(self, host=None, port=3306, username=None, password=None,
+                 database_name=None, SQLITE_ROOT=None):
+        self.host = host
+        self.port = weeutil.weeutil.to_int(port)
+        self.username = username
+        self.password = password
+        self.database_name = database_name
+
+    def create(self):
+        """ create the database, raises `weedb.DatabaseExistsError` if
+            it already exists """
+        import weedb.mysql
+        weedb.mysql.create(host=self.host, user=self.username,
+            password=self.password, database_name=self.database_name,
+            port=self.port)
+
+    def connect(self):
+        """ open a connection """
+        import weedb.mysql
+        return weedb.mysql.connect(host=self.host, user=self.username,
+            password=self.password, database_name=self.database_name,
+            port=self.port)
+
+    def get_max_record_size(self, conn):
+        """ maximum size of data that can be uploaded by one statement """
+        return get_max_record_size(conn)
+
+    def insert_history(self, conn, tablename, rows):
+        """ insert rows of `dateTime` and data into the history table """
+        args = []
+        for row in rows:
+            args.extend(row)
+        conn.execute(self.SQL_HISTORY_INSERT % (tablename,
+                                     ','.join(['(?,?)']*len(rows))),tuple(args))
+
+    def upsert_records(self, conn, tablename, rows, generations=False):
+        """ insert or update records of `ID`, data, content type,
+            modification time, and hash by one statement 
+            
+            If the table has the column `GEN`, set `generations`. The
+            records then belong to generation 0, which the PHP scripts
+            read if there is no newer one.
+        """
+        args = []
+        for row in rows:
+            args.extend(row)
+        sql = self.SQL_GEN_UPSERT if generations else self.SQL_UPSERT
+        conn.execute(sql % (tablename,
+                    ','.join([self.SQL_UPSERT_VALUES]*len(rows))),tuple(args))
+
+    def create_live_table(self, conn, tablename, size, engine=None):
+        """ create the table for the LOOP upload service
+
+            The data column is limited to `size` bytes. Unlike `BLOB`
+            columns, that is possible with the `MEMORY` engine, too.
+        """
+        sql = self.SQL_LIVE_CREATE % (tablename,size)
+        if engine:
+            sql += ' ENGINE=%s' % engine
+        conn.execute(sql)
+
+    def has_generations(self, conn, tablename):
+        """ whether the table has the column `GEN` """
+        return 'GEN' in self.get_columns(conn, tablename)
+
+    def get_columns(self, conn, tablename):
+        """ column names of a table, empty if it does not exist """
+        cursor = conn.cursor()
+        try:
+            cursor.execute(self.SQL_COLUMNS % tablename)
+            return [row[self.SQL_COLUMNS_NAME] for row in cursor.fetchall()]
+        except weedb.DatabaseError:
+            return []
+        finally:
+            cursor.close()
+
+    def prepare_generations(self, conn, tablename, blobtype):
+        """ create the table and the pointer for generational uploads
+
+            A table created by an earlier version or without generations
+            gets the column `GEN`. Its rows become generation 0.
+        """
+        conn.execute(self.SQL_GEN_CREATE % (tablename,blobtype))
+        if self.SQL_GEN_ADD:
+            try:
+                conn.execute(self.SQL_GEN_ADD % tablename)
+                loginf("added column `GEN` to table '%s'" % tablename)
+            except Exception as e:
+                # The column already exists.
+                logdbg("column `GEN` not added: %s %s" % (e.__class__.__name__,e))
+        conn.execute(self.SQL_GEN_POINTER_CREATE % tablename)
+        conn.execute(self.SQL_GEN_POINTER_INIT % tablename)
+
+    def get_generation(self, conn, tablename):
+        """ get the generation the PHP scripts currently read
+
+            Returns the generation and whether there are rows of a
+            newer one, uploaded by a cycle that did not finish.
+        """
+        cursor = conn.cursor()
+        try:
+            cursor.execute(self.SQL_GEN_POINTER_GET % tablename)
+            row = cursor.fetchone()
+            generation = int(row[0]) if row and row[0] is not None else 0
+            cursor.execute(self.SQL_GEN_PENDING % tablename,(generation,))
+            row = cursor.fetchone()
+            pending = bool(row and row[0])
+        finally:
+            cursor.close()
+        return generation, pending
+
+    def get_generation_sql(self, tablename, generation):
+        """ `INSERT` and `UPDATE` statements for the given generation """
+        return (self.SQL_GEN_INSERT % (tablename,generation),
+                self.SQL_GEN_UPDATE % (tablename,generation))
+
+    def flip_generation(self, conn, tablename, generation):
+        """ make `generation` visible to the PHP scripts and remove the
+            rows not needed anymore
+
+            PHP scripts that read the pointer before the flip still use
+            the previous generation. So only rows superseded within the
+            previous generation are removed.
+        """
+        previous, _ = self.get_generation(conn, tablename)
+        conn.begin()
+        conn.execute(self.SQL_GEN_POINTER_SET % tablename,(generation,))
+        conn.commit()
+        conn.begin()
+        conn.execute(self.SQL_GEN_GC % {'table':tablename},(previous,previous))
+        conn.execute(self.SQL_GEN_GC_CHUNKS % {'table':tablename},(previous,))
+        conn.commit()
+
+    def get_php_dsn(self, sqlcharset=None):
+        """ data source name for PHP PDO """
+        return 'mysql:host=localhost;dbname=$dbname%s' % (
+                             ';charset=%s' % sqlcharset if sqlcharset else '')
+
+
+class SQLiteBackend(SQLbackend):
+    """ SQLite database file
+
+        This is for web servers running on the same computer as WeeWX.
+        The database is opened in WAL mode, so that the PHP scripts can
+        read while a transaction is in progress. There is no need to
+        split large records into chunks. Records are uploaded by one
+        upsert statement, which is prepared once per connection by the
+        statement cache of the `sqlite3` module.
+    """
+
+    SQL_UPDATE = 'INSERT INTO %s(`TEXT`,`CONTENTTYPE`,`MTIME`,`HASH`,`ID`) VALUES (?,?,CAST(ROUND(?) AS INTEGER),?,?) ON CONFLICT(`ID`) DO UPDATE SET `TEXT`=excluded.`TEXT`,`CONTENTTYPE`=excluded.`CONTENTTYPE`,`MTIME`=excluded.`MTIME`,`HASH`=excluded.`HASH`'
+    SQL_INSERT = 'INSERT OR IGNORE INTO %s(`ID`) VALUES (?)'
+    SQL_CREATE = 'CREATE TABLE IF NOT EXISTS %s(`ID` CHAR(32) PRIMARY KEY, `MTIME` INTEGER NULL, `CONTENTTYPE` VARCHAR(127) NULL, `HASH` CHAR(64) NULL, `TEXT` %s NULL)'
+    SQL_ADD_HASH = None
+    SQL_SELCOL = '`HASH`,`CONTENTTYPE`,`MTIME` AS MTIME_EPOCH'
+    SQL_HISTORY_CREATE = 'CREATE TABLE IF NOT EXISTS %s(`dateTime` INTEGER PRIMARY KEY, `DATA` TEXT NULL)'
+    SQL_HISTORY_INSERT = 'INSERT OR IGNORE INTO %s(`dateTime`,`DATA`) VALUES (?,?)'
+    SQL_UPSERT = 'INSERT INTO %s(`ID`,`TEXT`,`CONTENTTYPE`,`MTIME`,`HASH`) VALUES %s ON CONFLICT(`ID`) DO UPDATE SET `TEXT`=excluded.`TEXT`,`CONTENTTYPE`=excluded.`CONTENTTYPE`,`MTIME`=excluded.`MTIME`,`HASH`=excluded.`HASH`'
+    SQL_UPSERT_VALUES = '(?,?,?,CAST(ROUND(?) AS INTEGER),?)'
+    SQL_GEN_UPSERT = 'INSERT INTO %s(`ID`,`TEXT`,`CONTENTTYPE`,`MTIME`,`HASH`) VALUES %s ON CONFLICT(`ID`,`GEN`) DO UPDATE SET `TEXT`=excluded.`TEXT`,`CONTENTTYPE`=excluded.`CONTENTTYPE`,`MTIME`=excluded.`MTIME`,`HASH`=excluded.`HASH`'
+    SQL_LIVE_CREATE = 'CREATE TABLE IF NOT EXISTS %s(`ID` VARCHAR(32) NOT NULL PRIMARY KEY, `MTIME` INTEGER NULL, `CONTENTTYPE` VARCHAR(127) NULL, `HASH` CHAR(64) NULL, `TEXT` BLOB NULL)'
+    SQL_GEN_CREATE = 'CREATE TABLE IF NOT EXISTS %s(`ID` CHAR(32) NOT NULL, `GEN` INTEGER NOT NULL DEFAULT 0, `MTIME` INTEGER NULL, `CONTENTTYPE` VARCHAR(127) NULL, `HASH` CHAR(64) NULL, `TEXT` %s NULL, PRIMARY KEY(`ID`,`GEN`))'
+    # SQLite cannot change the primary key of an existing table, so a
+    # table without `GEN` is rebuilt.
+    SQL_GEN_ADD = None
+    SQL_COLUMNS = 'PRAGMA table_info(%s)'
+    SQL_COLUMNS_NAME = 1
+    SQL_GEN_REBUILD = [
+        'ALTER TABLE %(table)s RENAME TO %(table)s_old',
+        'CREATE TABLE %(table)s(`ID` CHAR(32) NOT NULL, `GEN` INTEGER NOT NULL DEFAULT 0, `MTIME` INTEGER NULL, `CONTENTTYPE` VARCHAR(127) NULL, `HASH` CHAR(64) NULL, `TEXT` %(blobtype)s NULL, PRIMARY KEY(`ID`,`GEN`))',
+        'INSERT INTO %(table)s(`ID`,`GEN`,`MTIME`,`CONTENTTYPE`,`HASH`,`TEXT`) SELECT `ID`,0,`MTIME`,`CONTENTTYPE`,`HASH`,`TEXT` FROM %(table)s_old',
+        'DROP TABLE %(table)s_old'
+    ]
+    SQL_GEN_INSERT = 'INSERT OR IGNORE INTO %s(`ID`,`GEN`) VALUES (?,%d)'
+    SQL_GEN_UPDATE = 'INSERT INTO %s(`TEXT`,`CONTENTTYPE`,`MTIME`,`HASH`,`ID`,`GEN`) VALUES (?,?,CAST(ROUND(?) AS INTEGER),?,?,%d) ON CONFLICT(`ID`,`GEN`) DO UPDATE SET `TEXT`=excluded.`TEXT`,`CONTENTTYPE`=excluded.`CONTENTTYPE`,`MTIME`=excluded.`MTIME`,`HASH`=excluded.`HASH`'
+    SQL_GEN_POINTER_CREATE = 'CREATE TABLE IF NOT EXISTS %s_gen(`ID` INTEGER PRIMARY KEY, `GEN` INTEGER NOT NULL)'
+    SQL_GEN_POINTER_INIT = 'INSERT OR IGNORE INTO %s_gen(`ID`,`GEN`) VALUES (0,0)'
+    SQL_GEN_GC = 'DELETE FROM %(table)s WHERE `GEN`<? AND EXISTS (SELECT 1 FROM %(table)s AS n WHERE n.`ID`=%(table)s.`ID` AND n.`GEN`>%(table)s.`GEN` AND n.`GEN`<=?)'
+    SQL_GEN_GC_CHUNKS = "DELETE FROM %(table)s WHERE `ID` GLOB '*~[0-9][0-9][0-9]' AND `GEN`<? AND NOT EXISTS (SELECT 1 FROM %(table)s AS m WHERE m.`ID`=substr(%(table)s.`ID`,1,length(%(table)s.`ID`)-4) AND m.`GEN`=%(table)s.`GEN`)"
+    PRAGMAS = {'journal_mode':'WAL','synchronous':'NORMAL'}
+
+    has_server = False
+
+    def __init__(self, database_name=None, SQLITE_ROOT=None, **kwargs):
+        super(SQLiteBackend,self).__init__(database_name=database_name)
+        self.sqlite_root = SQLITE_ROOT or ''
+
+    @property
+    def file_path(self):
+        return os.path.join(self.sqlite_root,self.database_name)
+
+    def create(self):
+        import weedb.sqlite
+        weedb.sqlite.create(database_name=self.database_name,
+                            SQLITE_ROOT=self.sqlite_root)
+
+    def connect(self):
+        import weedb.sqlite
+        return SQLiteConnection(weedb.sqlite.connect(
+            database_name=self.database_name, SQLITE_ROOT=self.sqlite_root,
+            pragmas=SQLiteBackend.PRAGMAS))
+
+    def get_max_record_size(self, conn):
+        return None
+
+    def insert_history(self, conn, tablename, rows):
+        # The number of parameters of a statement is limited in SQLite,
+        # but executing the prepared statement once per row is fast.
+        sql = self.SQL_HISTORY_INSERT % tablename
+        for row in rows:
+            conn.execute(sql,row)
+
+    def create_live_table(self, conn, tablename, size, engine=None):
+        # SQLite has neither storage engines nor a size limit of columns.
+        conn.execute(self.SQL_LIVE_CREATE % tablename)
+
+    def prepare_generations(self, conn, tablename, blobtype):
+        """ create the table and the pointer for generational uploads
+
+            A table created without generations is copied into a new
+            one with the column `GEN` within one transaction. Its rows
+            become generation 0.
+        """
+        columns = self.get_columns(conn, tablename)
+        if columns and 'GEN' not in columns:
+            conn.begin()
+            try:
+                for sql in self.SQL_GEN_REBUILD:
+                    conn.execute(sql % {'table':tablename,'blobtype':blobtype})
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                raise
+            loginf("rebuilt table '%s' with column `GEN`" % tablename)
+        super(SQLiteBackend,self).prepare_generations(conn,tablename,blobtype)
+
+    def get_php_dsn(self, sqlcharset=None):
+        return 'sqlite:%s' % re.sub(r'([\\"$])',r'\\\1',
+                                            os.path.abspath(self.file_path))
+
+
+class SQLiteConnection(object):
+    """ SQLite connection that keeps transactions open
+
+        `execute()` of `weedb.sqlite` commits after each statement.
+        Executing the statements by a cursor instead leaves it to
+        `begin()` and `commit()` to enclose a batch of them into one
+        transaction.
+    """
+
+    def __init__(self, conn):
+        self.conn = conn
+
+    def execute(self, sql, args=()):
+        cursor = self.conn.cursor()
+        try:
+            cursor.execute(sql,args)
+        finally:
+            cursor.close()
+
+    def __getattr__(self, name):
+        return getattr(self.conn,name)
+
+
+SQL_BACKENDS = {
+    'mysql':SQLbackend,
+    'mariadb':SQLbackend,
+    'sqlite':SQLiteBackend
+}
+
+def get_backend(database_type='mysql', **kwargs):
+    """ get the backend for the database type """
+    try:
+        backend_class = SQL_BACKENDS[(database_type or 'mysql').lower()]
+    except KeyError:
+        raise ValueError("unknown database type '%s'" % database_type)
+    return backend_class(**kwargs)
+
+def get_target_path(config_dict, skin_dict):
+    """ absolute path of `HTML_ROOT` """
+    if skin_dict['HTML_ROOT'].startswith('~'):
+        return os.path.expanduser(skin_dict['HTML_ROOT'])
+    return os.path.join(config_dict['WEEWX_ROOT'],skin_dict['HTML_ROOT'])
+
+def get_sqlite_root(config_dict, site_dict):
+    """ directory of SQLite database files
+
+        If not set in `site_dict`, the directory of the WeeWX databases
+        is used.
+    """
+    sqlite_root = site_dict.get('SQLITE_ROOT',
+        config_dict.get('DatabaseTypes',{}).get('SQLite',{}).get(
+                                                       'SQLITE_ROOT','archive'))
+    return os.path.join(config_dict.get('WEEWX_ROOT','.'),
+                                              os.path.expanduser(sqlite_root))
+
+
+class SQLlastUpload(object):
+    """ manage state of SQL uploads 
+    
+        Additional upload targets have state files of their own, named
+        by the target.
+    """
+    
+    def __init__(self, target_path, name=None):
+        self.timestamp_file_path = os.path.join(target_path, 
+                    '#SQLupload-%s.last' % name if name else '#SQLupload.last')
+        (self.timestamp_dict, self.hash_dict, self.deferred_dict, 
+         self.chunks_dict, self.closed_set, self.checked_dict,
+         self.inlined_dict, self.dirty_set) = self._load()
+
+    def add_hash(self, id, hash):
+        self.hash_dict[id] = hash
+    
+    def get_hash(self, id):
+        return self.hash_dict.get(id)
+    
+    def add_timestamp(self, file, timestamp):
+        self.timestamp_dict[file] = timestamp
+    
+    def get_timestamp(self, file):
+        return self.timestamp_dict.get(file,0)
+
+    def add_deferred(self, section):
+        """ count how often a section was deferred in a row """
+        self.deferred_dict[section] = self.deferred_dict.get(section,0)+1
+
+    def get_deferred(self, section):
+        return self.deferred_dict.get(section,0)
+
+    def clear_deferred(self, section):
+        self.deferred_dict.pop(section,None)
+
+    def set_chunks(self, id, chunks):
+        """ number of chunk records of a record uploaded in chunks """
+        if chunks:
+            self.chunks_dict[id] = chunks
+        else:
+            self.chunks_dict.pop(id,None)
+
+    def get_chunks(self, id):
+        return self.chunks_dict.get(id,0)
+
+    def add_closed(self, file):
+        """ file of a closed period that does not change anymore """
+        self.closed_set.add(file)
+
+    def is_closed(self, file):
+        return file in self.closed_set
+
+    def add_checked(self, section, timestamp):
+        """ time when the file of a section was checked the last time """
+        self.checked_dict[section] = timestamp
+
+    def get_checked(self, section):
+        return self.checked_dict.get(section,0)
+
+    def set_inlined(self, file, assets):
+        """ files embedded into a page """
+        if assets:
+            self.inlined_dict[file] = assets
+        else:
+            self.inlined_dict.pop(file,None)
+
+    def get_inlined(self, file):
+        return self.inlined_dict.get(file,[])
+
+    def set_dirty(self, files):
+        """ files reported changed by inotify but not processed yet """
+        self.dirty_set = set(files)
+
+    def get_dirty(self):
+        return set(self.dirty_set)
+
+    def _load(self):
+        """ Reads time, members, and hashes of the last upload """
         hash_dict = dict()
         timestamp_dict = dict()
+        deferred_dict = dict()
+        chunks_dict = dict()
+        closed_set = set()
+        checked_dict = dict()
+        inlined_dict = dict()
+        dirty_set = set()
         hash_fn = self.timestamp_file_path
         try:
             with open(hash_fn,'rt') as f:
@@ -1034,25 +2660,579 @@ class SQLlastUpload(object):
             logdbg("successfully loaded hash file '%s'" % hash_fn)
             hash_dict = reply.get('hash',dict())
             timestamp_dict = reply.get('timestamp',dict())
+            deferred_dict = reply.get('deferred',dict())
+            chunks_dict = reply.get('chunks',dict())
+            closed_set = set(reply.get('closed',[]))
+            checked_dict = reply.get('checked',dict())
+            inlined_dict = reply.get('inlined',dict())
+            dirty_set = set(reply.get('dirty',[]))
         except FileNotFoundError:
             logdbg("hash file '%s' not found (no problem at first run)" % hash_fn)
         except (OSError,ValueError) as e:
             logdbg("error loading hash file '%s': %s %s" % (hash_fn,e.__class__.__name__,e))
-        return timestamp_dict, hash_dict
-    
+        return (timestamp_dict, hash_dict, deferred_dict, chunks_dict, 
+                            closed_set, checked_dict, inlined_dict, dirty_set)
+
     def save(self):
         """ Saves time, members, and hashes of the current upload """
         hash_fn = self.timestamp_file_path
         try:
             with open(hash_fn,'wt') as f:
                 json.dump({'hash':self.hash_dict,
-                                'timestamp':self.timestamp_dict},
+                                'timestamp':self.timestamp_dict,
+                                'deferred':self.deferred_dict,
+                                'chunks':self.chunks_dict,
+                                'closed':sorted(self.closed_set),
+                                'checked':self.checked_dict,
+                                'inlined':self.inlined_dict,
+                                'dirty':sorted(self.dirty_set)},
                                                          f,ensure_ascii=False)
             logdbg("successfully saved hash file '%s'" % hash_fn)
         except (OSError,ValueError) as e:
             logdbg("error saving hash file '%s': %s %s" % (
                                                 hash_fn,e.__class__.__name__))
 
+class SQLspool(object):
+    """ save records to a local file while the database server is down
+    
+        This class can be used instead of a database connection. It 
+        appends the records of the upload statement `sql_upd_str` to the
+        spool file and ignores all the other statements. The spool file is an
+        append-only log. For each record, it contains a line of JSON
+        describing it followed by the content. If the same ID occurs 
+        more than once, the last one is valid.
+        
+        When the database server is reachable again, `replay()` uploads
+        the latest version of each record in batches of several records
+        per transaction.
+    """
+
+    def __init__(self, target_path, max_size=50000000, sql_upd_str=None):
+        self.spool_file_path = os.path.join(target_path, '#SQLupload.spool')
+        self.max_size = max_size
+        self.sql_upd_str = sql_upd_str
+
+    def begin(self):
+        pass
+
+    def commit(self):
+        pass
+
+    def close(self):
+        pass
+
+    def execute(self, sql, args=()):
+        """ spool records to upload, ignore all the other statements """
+        if (sql==self.sql_upd_str if self.sql_upd_str 
+                                          else sql.startswith('UPDATE')):
+            data, content_type, mtime, filehash, id = args
+            self.append(id, data, content_type, mtime, filehash)
+
+    def exists(self):
+        return os.path.exists(self.spool_file_path)
+
+    def append(self, id, data, content_type, mtime, filehash):
+        """ append a record to the spool file
+        
+            If the spool file would exceed its maximum size, it is 
+            compacted first. If that does not help, `OSError` is raised.
+        """
+        if isinstance(data,str): data = data.encode('utf-8')
+        header = json.dumps({
+            'id':id,
+            'content_type':content_type,
+            'mtime':mtime,
+            'hash':filehash,
+            'length':len(data)
+        },ensure_ascii=False).encode('utf-8')+b'\n'
+        size = len(header)+len(data)+1
+        try:
+            current_size = os.path.getsize(self.spool_file_path)
+        except OSError:
+            current_size = 0
+        if self.max_size and current_size+size>self.max_size:
+            records = self.load()
+            records.pop(id,None)
+            self.save(records)
+            current_size = os.path.getsize(self.spool_file_path)
+            if current_size+size>self.max_size:
+                raise OSError("spool file '%s' full" % self.spool_file_path)
+        with open(self.spool_file_path,'ab') as f:
+            f.write(header)
+            f.write(data)
+            f.write(b'\n')
+
+    def load(self):
+        """ read the latest version of each record from the spool file
+        
+            Returns:
+                dict: tuples of content, content type, modification time,
+                    and hash by ID
+        """
+        records = dict()
+        try:
+            with open(self.spool_file_path,'rb') as f:
+                while True:
+                    header = f.readline()
+                    if not header: break
+                    header = json.loads(header.decode('utf-8'))
+                    data = f.read(header['length']+1)
+                    if len(data)<header['length']+1: 
+                        # incomplete record at the end of the file
+                        break
+                    records.pop(header['id'],None)
+                    records[header['id']] = (data[:-1],header['content_type'],
+                                              header['mtime'],header['hash'])
+        except FileNotFoundError:
+            pass
+        except (OSError,ValueError,LookupError) as e:
+            logerr("error reading spool file '%s': %s %s" % (
+                          self.spool_file_path,e.__class__.__name__,e))
+        return records
+
+    def save(self, records):
+        """ rewrite the spool file with the given records only """
+        try:
+            os.unlink(self.spool_file_path)
+        except FileNotFoundError:
+            pass
+        max_size = self.max_size
+        self.max_size = 0
+        try:
+            for id, (data, content_type, mtime, filehash) in records.items():
+                self.append(id, data, content_type, mtime, filehash)
+        finally:
+            self.max_size = max_size
+
+    def replay(self, conn, tablename, sql_ins_str, sql_upd_str, batch_size=50,
+               max_record_size=None, log_success=True, log_failure=True,
+               generation=None):
+        """ upload the spooled records in batches 
+        
+            Records that could not be uploaded remain in the spool file.
+            Returns the number of records uploaded.
+        """
+        start_ts = time.time()
+        records = self.load()
+        ids = list(records)
+        ct = 0
+        batches = 0
+        try:
+            while ct<len(ids):
+                batch = ids[ct:ct+max(batch_size,1)]
+                conn.begin()
+                for id in batch:
+                    data, content_type, mtime, filehash = records[id]
+                    conn.execute(sql_ins_str,(id,))
+                    upload_record(conn,tablename,sql_upd_str,id,data,
+                          content_type,mtime,filehash,max_record_size,True,
+                          generation)
+                conn.commit()
+                ct += len(batch)
+                batches += 1
+        except Exception as e:
+            if log_failure:
+                logerr("error uploading spooled records: %s %s" % (
+                                                       e.__class__.__name__,e))
+            try:
+                conn.rollback()
+            except Exception:
+                pass
+        # keep the records not uploaded
+        self.save({id:records[id] for id in ids[ct:]})
+        if log_success:
+            loginf("Uploaded %s spooled record%s in %s transaction%s in %.2f seconds" % (
+                ct,'' if ct==1 else 's',
+                batches,'' if batches==1 else 's',
+                time.time()-start_ts))
+        return ct
+
+
+class SQLuploadTarget(threading.Thread):
+    """ upload to an additional database server 
+    
+        The generator processes each file once and passes the records
+        to all the targets. Each target uploads them using a connection
+        and a transaction of its own, so that a slow or unreachable 
+        server does not delay the others. Which records changed is 
+        tracked for each target separately.
+        
+        Note: As all the servers get the same PHP scripts, database 
+              name, table name, and account data must be the same on
+              all of them.
+    """
+
+    def __init__(self, name, target_path, first_run, blobtype,
+              host=None, port=3306,
+              username=None, password=None,
+              database_name=None, table_name=None,
+              database_type='mysql', SQLITE_ROOT=None, generations=False,
+              log_success=True, log_failure=True):
+        super(SQLuploadTarget,self).__init__(name='SQLupload-%s' % name)
+        self.daemon = True
+        self.target_name = name
+        self.first_run = first_run
+        self.blobtype = blobtype
+        self.dbhost = host
+        self.dbport = weeutil.weeutil.to_int(port)
+        self.dbuser = username
+        self.dbpassword = password
+        self.dbname = database_name
+        self.dbtable = table_name
+        self.log_success = weeutil.weeutil.to_bool(log_success)
+        self.log_failure = weeutil.weeutil.to_bool(log_failure)
+        self.database = get_backend(database_type, host=host, port=port,
+                             username=username, password=password,
+                             database_name=database_name,
+                             SQLITE_ROOT=SQLITE_ROOT)
+        self.sql_upd_str = self.database.SQL_UPDATE % table_name
+        self.sql_ins_str = self.database.SQL_INSERT % table_name
+        self.generations = weeutil.weeutil.to_bool(generations)
+        self.generation = None
+        self.sql_last_upload = SQLlastUpload(target_path, name)
+        self.queue = queue.Queue()
+        self.uploaded = 0
+        self.failed = False
+
+    def put(self, id, data, content_type, mtime, filehash):
+        """ pass a record to upload """
+        self.queue.put((id, data, content_type, mtime, filehash))
+
+    def put_timestamp(self, file, timestamp):
+        """ all records of a file passed """
+        self.queue.put((file, timestamp))
+
+    def finish(self):
+        """ all records passed, commit the transaction """
+        self.queue.put(None)
+
+    def run(self):
+        start_ts = time.time()
+        conn = None
+        # If there is no state saved for this target, it is new or was
+        # not reachable so far.
+        is_new = self.first_run or not self.sql_last_upload.hash_dict
+        try:
+            if is_new:
+                try:
+                    self.database.create()
+                except weedb.DatabaseExistsError:
+                    pass
+            conn = self.database.connect()
+            if is_new and self.generations:
+                self.database.prepare_generations(conn,self.dbtable,
+                                                                 self.blobtype)
+            elif is_new:
+                conn.execute(self.database.SQL_CREATE % (
+                                                   self.dbtable,self.blobtype))
+                if self.database.SQL_ADD_HASH:
+                    try:
+                        conn.execute(self.database.SQL_ADD_HASH % self.dbtable)
+                    except Exception:
+                        pass
+            max_record_size = self.database.get_max_record_size(conn)
+            if self.generations:
+                generation, generation_pending = self.database.get_generation(
+                                                           conn,self.dbtable)
+                self.generation = generation+1
+                self.sql_ins_str, self.sql_upd_str = (
+                    self.database.get_generation_sql(self.dbtable,
+                                                             self.generation))
+            conn.begin()
+        except Exception as e:
+            self.fail(e)
+        uploaded_hashes = dict()
+        timestamps = dict()
+        while True:
+            item = self.queue.get()
+            if item is None: break
+            # After an error the remaining records are discarded. As 
+            # neither their hashes nor the timestamps of their files are 
+            # saved, the generator processes the files again during the 
+            # next report cycle.
+            if self.failed: continue
+            if len(item)==2:
+                timestamps[item[0]] = item[1]
+                continue
+            id, data, content_type, mtime, filehash = item
+            if filehash and filehash==self.sql_last_upload.get_hash(id):
+                continue
+            try:
+                if self.first_run or not self.sql_last_upload.get_hash(id):
+                    conn.execute(self.sql_ins_str,(id,))
+                chunks = upload_record(conn,self.dbtable,self.sql_upd_str,id,
+                             data,content_type,mtime,filehash,max_record_size,
+                             self.sql_last_upload.get_chunks(id)>0,
+                             self.generation)
+                uploaded_hashes[id] = (filehash,chunks)
+            except Exception as e:
+                self.fail(e)
+        if not self.failed:
+            try:
+                conn.commit()
+                if self.generation and (uploaded_hashes or generation_pending):
+                    self.database.flip_generation(conn,self.dbtable,
+                                                              self.generation)
+                for id, (filehash,chunks) in uploaded_hashes.items():
+                    self.sql_last_upload.add_hash(id,filehash)
+                    self.sql_last_upload.set_chunks(id,chunks)
+                for file, timestamp in timestamps.items():
+                    self.sql_last_upload.add_timestamp(file,timestamp)
+                self.uploaded = len(uploaded_hashes)
+            except Exception as e:
+                self.fail(e)
+        if conn:
+            try:
+                conn.close()
+            except Exception:
+                pass
+        self.sql_last_upload.save()
+        if self.log_success and not self.failed:
+            loginf("Target '%s': uploaded %s record%s in %.2f seconds" % (
+                self.target_name,
+                self.uploaded,'' if self.uploaded==1 else 's',
+                time.time()-start_ts))
+
+    def fail(self, e):
+        if self.log_failure:
+            logerr("Target '%s': upload failed: %s %s" % (
+                                       self.target_name,e.__class__.__name__,e))
+        self.failed = True
+
+
+class SQLsync(object):
+    """ bulk upload of all the files of a report by the `sync` command
+
+        The generator processes the files as usual, but passes the
+        records to this class instead of uploading them by its own
+        connection. They are uploaded by several connections in parallel
+        in transactions of `batch_size` records each. After each
+        transaction the hashes of the records are appended to the
+        checkpoint file `#SQLupload.sync`. If the run is interrupted,
+        the next one skips the records found there.
+    """
+
+    def __init__(self, connections=4, batch_size=50, restart=False):
+        self.connections = max(connections,1)
+        self.batch_size = max(batch_size,1)
+        self.restart = restart
+        self.queue = queue.Queue(self.connections*self.batch_size*2)
+        self.lock = threading.Lock()
+        self.workers = []
+        self.checkpoint_file_path = None
+        self.database = None
+        self.table_name = None
+        self.generation = None
+        self.resumed = 0
+        self.records = 0
+        self.bytes = 0
+        self.failed = 0
+        self.start_ts = None
+        self.end_ts = None
+
+    def start(self, target_path, sql_last_upload, database, table_name,
+              generation=None):
+        """ prepare the state and start the connections
+
+            In case of generational uploads all the records are uploaded
+            to `generation`, which becomes visible by `finish()`. An
+            interrupted run resumes with the same generation.
+        """
+        self.start_ts = time.time()
+        self.database = database
+        self.table_name = table_name
+        self.generation = generation
+        self.checkpoint_file_path = os.path.join(target_path,'#SQLupload.sync')
+        if self.restart and os.path.exists(self.checkpoint_file_path):
+            os.unlink(self.checkpoint_file_path)
+        # The server is considered empty. Only the records uploaded by an
+        # interrupted run of this command are skipped. All the files are
+        # processed irrespective of their modification time.
+        checkpoint = self.load()
+        self.resumed = len(checkpoint)
+        sql_last_upload.hash_dict = {id:val[0] for id,val in checkpoint.items()}
+        sql_last_upload.chunks_dict = {id:val[1] for id,val in checkpoint.items() if val[1]}
+        sql_last_upload.timestamp_dict = dict()
+        sql_last_upload.deferred_dict = dict()
+        sql_last_upload.closed_set = set()
+        sql_last_upload.checked_dict = dict()
+        if self.resumed:
+            loginf("resuming, %s record%s already uploaded" % (
+                                  self.resumed,'' if self.resumed==1 else 's'))
+        if not database.has_server:
+            # SQLite allows one writer at a time only.
+            self.connections = 1
+        for idx in range(self.connections):
+            worker = SQLsyncWorker(self,idx+1,database,table_name,generation)
+            worker.start()
+            self.workers.append(worker)
+
+    def put(self, id, data, content_type, mtime, filehash, had_chunks):
+        """ pass a record to upload """
+        self.queue.put((id,data,content_type,mtime,filehash,had_chunks))
+
+    def checkpoint(self, records, nbytes):
+        """ save the records of a committed transaction """
+        with self.lock:
+            self.records += len(records)
+            self.bytes += nbytes
+            with open(self.checkpoint_file_path,'at') as f:
+                for id, filehash, chunks in records:
+                    f.write(json.dumps([id,filehash,chunks])+'\n')
+
+    def fail(self, records):
+        with self.lock:
+            self.failed += records
+
+    def load(self):
+        """ read the checkpoint file """
+        checkpoint = dict()
+        try:
+            with open(self.checkpoint_file_path,'rt') as f:
+                for line in f:
+                    try:
+                        id, filehash, chunks = json.loads(line)
+                        checkpoint[id] = (filehash,chunks)
+                    except (ValueError,TypeError):
+                        # incomplete last line of an interrupted run
+                        pass
+        except FileNotFoundError:
+            pass
+        return checkpoint
+
+    def finish(self, sql_last_upload):
+        """ wait for the connections and update the state """
+        for worker in self.workers:
+            self.queue.put(None)
+        for worker in self.workers:
+            worker.join()
+        self.end_ts = time.time()
+        for id, (filehash, chunks) in self.load().items():
+            sql_last_upload.add_hash(id,filehash)
+            sql_last_upload.set_chunks(id,chunks)
+        if self.failed:
+            # The files of the records that failed are to be processed
+            # again during the next report cycle.
+            sql_last_upload.timestamp_dict = dict()
+            return
+        if self.generation:
+            try:
+                conn = self.database.connect()
+                try:
+                    self.database.flip_generation(conn,self.table_name,
+                                                             self.generation)
+                finally:
+                    conn.close()
+            except Exception as e:
+                logerr("could not switch to generation %s: %s %s" % (
+                                  self.generation,e.__class__.__name__,e))
+                self.failed = max(self.failed,1)
+                return
+        try:
+            os.unlink(self.checkpoint_file_path)
+        except FileNotFoundError:
+            pass
+
+    def report(self):
+        """ print throughput statistics """
+        elapsed = max((self.end_ts or time.time())-(self.start_ts or time.time()),0.001)
+        print('Uploaded %s records, %.1f MB, in %.2f seconds using %s connection%s' % (
+            self.records,self.bytes/1048576.0,elapsed,
+            self.connections,'' if self.connections==1 else 's'))
+        print('Throughput %.1f records/s, %.2f MB/s' % (
+            self.records/elapsed,self.bytes/1048576.0/elapsed))
+        for worker in self.workers:
+            print('  connection %s: %s records, %s transactions, %.1f MB' % (
+                worker.number,worker.records,worker.transactions,
+                worker.bytes/1048576.0))
+        if self.resumed:
+            print('Skipped %s records uploaded by the interrupted run' % self.resumed)
+        if self.failed:
+            print('Failed %s records. Run the command again to resume.' % self.failed)
+        return 1 if self.failed else 0
+
+
+class SQLsyncWorker(threading.Thread):
+    """ connection of the `sync` command """
+
+    def __init__(self, sync, number, database, table_name, generation=None):
+        super(SQLsyncWorker,self).__init__(name='SQLsync-%s' % number)
+        self.daemon = True
+        self.sync = sync
+        self.number = number
+        self.database = database
+        self.dbtable = table_name
+        self.generation = generation
+        if generation:
+            self.sql_ins_str, self.sql_upd_str = database.get_generation_sql(
+                                                        table_name,generation)
+        else:
+            self.sql_ins_str = database.SQL_INSERT % table_name
+            self.sql_upd_str = database.SQL_UPDATE % table_name
+        self.records = 0
+        self.transactions = 0
+        self.bytes = 0
+
+    def connect(self):
+        try:
+            conn = self.database.connect()
+        except Exception as e:
+            logerr("connection %s: %s %s" % (self.number,e.__class__.__name__,e))
+            return None, None
+        return conn, self.database.get_max_record_size(conn)
+
+    def run(self):
+        conn, max_record_size = self.connect()
+        batch = []
+        while True:
+            item = self.sync.queue.get()
+            if item is not None: batch.append(item)
+            if batch and (item is None or len(batch)>=self.sync.batch_size):
+                # After an error the connection is opened again.
+                if not conn:
+                    conn, max_record_size = self.connect()
+                if conn:
+                    conn = self.upload(conn,batch,max_record_size)
+                else:
+                    self.sync.fail(len(batch))
+                batch = []
+            if item is None: break
+        if conn:
+            try:
+                conn.close()
+            except Exception:
+                pass
+
+    def upload(self, conn, batch, max_record_size):
+        """ upload a batch of records within one transaction """
+        try:
+            conn.begin()
+            done = []
+            nbytes = 0
+            for id, data, content_type, mtime, filehash, had_chunks in batch:
+                conn.execute(self.sql_ins_str,(id,))
+                chunks = upload_record(conn,self.dbtable,self.sql_upd_str,id,
+                             data,content_type,mtime,filehash,max_record_size,
+                             had_chunks,self.generation)
+                done.append((id,filehash,chunks))
+                nbytes += len(data)
+            conn.commit()
+        except Exception as e:
+            logerr("connection %s: upload failed: %s %s" % (
+                                          self.number,e.__class__.__name__,e))
+            self.sync.fail(len(batch))
+            try:
+                conn.close()
+            except Exception:
+                pass
+            return None
+        self.sync.checkpoint(done,nbytes)
+        self.records += len(done)
+        self.transactions += 1
+        self.bytes += nbytes
+        return conn
+
+
 class FTPlastUpload(object):
     """ manage the state file of the FTP upload generator 
     
@@ -1070,10 +3250,26 @@ class FTPlastUpload(object):
     def __init__(self, target_path):
         self.timestamp_file_path = os.path.join(target_path, '#FTP.last')
         self.changed = False
+        try:
+            try:
+                from six.moves import cPickle as pickle
+            except ImportError:
+                import pickle
+            import weeutil.ftpupload
+            self.pickle = pickle
+            self.sha256sum = weeutil.ftpupload.sha256sum if has_hashlib else None
+        except ImportError:
+            self.pickle = None
+            self.sha256sum = None
         self.timestamp, self.fileset, self.hashdict = self._load()
     
-    def add(self, full_local_path, filehash):
+    @property
+    def available(self):
+        return self.pickle is not None
+
+    def add(self, full_local_path):
         """ Add or update item """
+        filehash = self.sha256sum(full_local_path) if self.sha256sum else None
         self.fileset.add(full_local_path)
         self.hashdict[full_local_path] = filehash
         self.changed = True
@@ -1083,7 +3279,8 @@ class FTPlastUpload(object):
         """ Reads the time and members of the last upload from the local root
             Copyright (C) Tom Keffer
         """
-        if not has_pickle: return 0, set(), dict()
+        pickle = self.pickle
+        if not pickle: return 0, set(), dict()
         try:
             with open(self.timestamp_file_path, "rb") as f:
                 timestamp = pickle.load(f)
@@ -1100,7 +3297,8 @@ class FTPlastUpload(object):
         """ Saves the time and members of the last upload in the local root
             Copyright (C) Tom Keffer
         """
-        if self.changed and has_pickle:
+        pickle = self.pickle
+        if self.changed and pickle:
             with open(self.timestamp_file_path, "wb") as f:
                 pickle.dump(self.timestamp, f)
                 pickle.dump(self.fileset, f)
@@ -1112,6 +3310,269 @@ class FTPlastUpload(object):
         """
 
 
+class InotifyWatcher(threading.Thread):
+    """ record the files written below a directory using Linux inotify
+
+        The thread collects the names of the files that were closed after
+        writing or moved into the watched directory tree. The generator
+        takes that set at the beginning of each report cycle and visits
+        only those files instead of checking all of them.
+
+        If the kernel event queue overflowed or a new subdirectory
+        appeared, events may have been lost. `take()` then returns
+        `None` once, so that the caller falls back to checking the
+        modification time of all the files.
+    """
+
+    IN_CLOSE_WRITE = 0x00000008
+    IN_MOVED_TO = 0x00000080
+    IN_CREATE = 0x00000100
+    IN_Q_OVERFLOW = 0x00004000
+    IN_IGNORED = 0x00008000
+    IN_ISDIR = 0x40000000
+    IN_NONBLOCK = 0x00000800
+    IN_CLOEXEC = 0x00080000
+    WATCH_MASK = IN_CLOSE_WRITE|IN_MOVED_TO|IN_CREATE
+
+    def __init__(self, path):
+        super(InotifyWatcher,self).__init__(name='SQLupload-inotify')
+        self.daemon = True
+        self.path = path
+        self.lock = threading.Lock()
+        self.changed = set()
+        # no event history before the first call of `take()`
+        self.valid = False
+        self.running = True
+        self.wd_dict = dict()
+        self.libc = ctypes.CDLL(ctypes_util.find_library('c') or 'libc.so.6',
+                                                                use_errno=True)
+        self.fd = self.libc.inotify_init1(
+                          InotifyWatcher.IN_NONBLOCK|InotifyWatcher.IN_CLOEXEC)
+        if self.fd<0:
+            raise OSError(ctypes.get_errno(),'inotify_init1() failed')
+        self._add_tree(path)
+
+    def _add_tree(self, path):
+        """ add watches for `path` and all of its subdirectories """
+        for dirpath, _, _ in os.walk(path):
+            wd = self.libc.inotify_add_watch(self.fd,
+                         os.fsencode(dirpath),InotifyWatcher.WATCH_MASK)
+            if wd>=0:
+                self.wd_dict[wd] = os.path.relpath(dirpath,self.path)
+
+    def run(self):
+        while self.running:
+            try:
+                rd, _, _ = select.select([self.fd],[],[],1.0)
+            except (OSError,ValueError):
+                break
+            if rd:
+                with self.lock:
+                    self._read()
+        os.close(self.fd)
+
+    def _read(self):
+        """ read and evaluate the pending events, the lock must be held """
+        while True:
+            try:
+                buf = os.read(self.fd,65536)
+            except BlockingIOError:
+                return
+            except OSError:
+                self.valid = False
+                return
+            if not buf: return
+            pos = 0
+            while pos+16<=len(buf):
+                wd, mask, _, length = struct.unpack_from('iIII',buf,pos)
+                name = os.fsdecode(buf[pos+16:pos+16+length].rstrip(b'\0'))
+                pos += 16+length
+                if mask&InotifyWatcher.IN_Q_OVERFLOW:
+                    self.valid = False
+                elif mask&InotifyWatcher.IN_IGNORED:
+                    self.wd_dict.pop(wd,None)
+                elif wd in self.wd_dict:
+                    path = os.path.normpath(os.path.join(self.wd_dict[wd],name))
+                    if mask&InotifyWatcher.IN_ISDIR:
+                        # Files could have been written into the new
+                        # directory before the watch was established.
+                        self._add_tree(os.path.join(self.path,path))
+                        self.valid = False
+                    elif mask&(InotifyWatcher.IN_CLOSE_WRITE|InotifyWatcher.IN_MOVED_TO):
+                        self.changed.add(path)
+
+    def take(self):
+        """ get the set of files written since the last call
+
+            Returns:
+                set: relative paths of the files written or `None` if
+                    that information is not complete
+        """
+        with self.lock:
+            self._read()
+            changed = self.changed if self.valid and self.is_alive() else None
+            self.changed = set()
+            self.valid = True
+        return changed
+
+    def shutDown(self):
+        self.running = False
+
+
+# inotify watchers by directory, they persist over the report cycles
+_inotify_watchers = dict()
+
+def get_inotify_watcher(path):
+    """ get the running inotify watcher for `path` or start one
+
+        Returns `None` if inotify is not available on this system.
+    """
+    if path in _inotify_watchers and _inotify_watchers[path] is None:
+        # already known to be unavailable
+        return None
+    watcher = _inotify_watchers.get(path)
+    if watcher is None or not watcher.is_alive():
+        try:
+            watcher = InotifyWatcher(path)
+            watcher.start()
+        except (OSError,AttributeError) as e:
+            loginf('inotify not available, using modification times: %s %s' % (e.__class__.__name__,e))
+            watcher = None
+        _inotify_watchers[path] = watcher
+    return watcher
+
+
+class SQLprofiler(object):
+    """ profile report cycles or LOOP packets by cProfile on demand
+
+        Profiling starts for the next `count` calls if the flag file is
+        found. The flag file may contain the number of calls to profile
+        instead. It is removed when read. Setting `count` in the
+        configuration profiles the first calls after startup.
+
+        For each profile the raw data is saved as `.pstats` file, which
+        can be examined by the `pstats` module or tools like `snakeviz`,
+        and the `top` functions by cumulative time as `.txt` file. Only
+        the latest `keep` profiles are kept.
+
+        If `aggregate` is `True` all the `count` calls go into one
+        profile, otherwise each call gets a profile of its own. The flag
+        file is checked at most every `check_interval` seconds.
+    """
+
+    def __init__(self, name, flag_file_path, profile_dir, count=0,
+                 default_count=1, aggregate=False, top=25, keep=20,
+                 check_interval=0):
+        self.name = name
+        self.flag_file_path = flag_file_path
+        self.profile_dir = profile_dir
+        self.remaining = weeutil.weeutil.to_int(count)
+        self.default_count = default_count
+        self.aggregate = aggregate
+        self.top = weeutil.weeutil.to_int(top)
+        self.keep = max(weeutil.weeutil.to_int(keep),1)
+        self.check_interval = check_interval
+        self.check_ts = 0
+        self.profile = None
+        self.calls = 0
+
+    def check(self):
+        """ look for the flag file """
+        if not self.flag_file_path: return
+        now = time.time()
+        if now-self.check_ts<self.check_interval: return
+        self.check_ts = now
+        if not os.path.exists(self.flag_file_path): return
+        try:
+            with open(self.flag_file_path,'rt') as f:
+                content = f.read().strip()
+            os.unlink(self.flag_file_path)
+            self.remaining = int(content) if content else self.default_count
+        except (OSError,ValueError) as e:
+            logerr("profiler %s: invalid flag file %s: %s %s" % (
+                 self.name,self.flag_file_path,e.__class__.__name__,e))
+            self.remaining = self.default_count
+        loginf("profiler %s: profiling the next %s call%s" % (
+             self.name,self.remaining,'' if self.remaining==1 else 's'))
+
+    def call(self, func, *args, **kwargs):
+        """ call `func`, profiled if requested """
+        if self.remaining<=0:
+            self.check()
+            if self.remaining<=0:
+                return func(*args, **kwargs)
+        if self.profile is None:
+            self.profile = cProfile.Profile()
+            self.calls = 0
+        try:
+            self.profile.enable()
+        except ValueError as e:
+            # Another profiler is active in this process.
+            logdbg("profiler %s: %s" % (self.name,e))
+            return func(*args, **kwargs)
+        try:
+            return func(*args, **kwargs)
+        finally:
+            self.profile.disable()
+            self.remaining -= 1
+            self.calls += 1
+            if not self.aggregate or self.remaining<=0:
+                self.dump()
+
+    def dump(self):
+        """ save the profile and remove old ones """
+        profile = self.profile
+        self.profile = None
+        prefix = 'sqlupload-%s-' % self.name
+        fn = os.path.join(self.profile_dir,'%s%s' % (
+                    prefix,time.strftime('%Y%m%d-%H%M%S',time.localtime())))
+        try:
+            os.makedirs(self.profile_dir,exist_ok=True)
+            profile.dump_stats(fn+'.pstats')
+            with open(fn+'.txt','wt') as f:
+                f.write('%s call%s\n' % (self.calls,'' if self.calls==1 else 's'))
+                stats = pstats.Stats(profile,stream=f)
+                stats.sort_stats('cumulative').print_stats(self.top)
+            loginf("profiler %s: saved %s.pstats" % (self.name,fn))
+            # rotate
+            files = sorted(i for i in os.listdir(self.profile_dir)
+                             if i.startswith(prefix) and i.endswith('.pstats'))
+            for file in files[:-self.keep]:
+                for ext in ('.pstats','.txt'):
+                    try:
+                        os.unlink(os.path.join(self.profile_dir,
+                                                         file[:-7]+ext))
+                    except FileNotFoundError:
+                        pass
+        except OSError as e:
+            logerr("profiler %s: could not save profile: %s %s" % (
+                                         self.name,e.__class__.__name__,e))
+
+
+# profilers of the reports by HTML_ROOT
+_profilers = dict()
+
+def get_profiler(config_dict, skin_dict):
+    """ get the profiler of the report or create it at first run """
+    target_path = get_target_path(config_dict, skin_dict)
+    profiler = _profilers.get(target_path)
+    if profiler is None:
+        generator_dict = skin_dict.get('SQLuploadGenerator',{})
+        profiler = SQLprofiler('report',
+            os.path.join(target_path,'#SQLupload.profile'),
+            get_profile_dir(config_dict,generator_dict),
+            count=generator_dict.get('profile',0),
+            top=generator_dict.get('profile_top',25),
+            keep=generator_dict.get('profile_keep',20))
+        _profilers[target_path] = profiler
+    return profiler
+
+def get_profile_dir(config_dict, site_dict):
+    """ directory to save profiles to """
+    return os.path.join(config_dict.get('WEEWX_ROOT','.'),
+        os.path.expanduser(site_dict.get('profile_dir','sqlupload_profile')))
+
+
 ##############################################################################
 #    Service to upload the LOOP packets to the database for live display     #
 ##############################################################################
@@ -1130,13 +3591,20 @@ class SQLRESTful(weewx.restx.StdRESTful):
             site_dict['manager_dict'] = weewx.manager.get_manager_dict_from_config(config_dict, 'wx_binding')
         except weewx.UnknownBinding:
             pass
+        site_dict['SQLITE_ROOT'] = get_sqlite_root(config_dict, site_dict)
+        site_dict['profile_dir'] = get_profile_dir(config_dict, site_dict)
+        report_dict = config_dict.get('StdReport',{})
+        if 'HTML_ROOT' in report_dict:
+            site_dict['profile_flag_file'] = os.path.join(
+                get_target_path(config_dict, report_dict),
+                '#SQLupload-loop.profile')
         binding = site_dict.pop('binding')
         if not isinstance(binding,list): binding = [binding]
         binding = [i.upper() for i in binding]
         self.loop_queue = queue.Queue(5)
         self.loop_thread = SQLloopThread(self.loop_queue, **site_dict)
         self.loop_thread.start()
-        if __name__ != '__main__':
+        if not testing:
             if 'LOOP' in binding:
                 self.bind(weewx.NEW_LOOP_PACKET, self.new_loop_packet)
             if 'ARCHIVE' in binding:
@@ -1159,18 +3627,307 @@ class SQLRESTful(weewx.restx.StdRESTful):
             logerr('Queue is full. Thread died?')
 
 
+class SQLreconnector(threading.Thread):
+    """ check the database server in the background while the circuit
+        breaker of the LOOP upload service is open
+
+        The connection is opened and closed again only. If that succeeds,
+        `available` is set, and the LOOP thread opens a connection of
+        its own. So each connection is used by one thread only. The
+        time between attempts doubles up to `max_backoff` seconds and is
+        varied at random by 25%, so that several clients do not retry
+        at the same time.
+    """
+
+    def __init__(self, database, backoff=5, max_backoff=300):
+        super(SQLreconnector,self).__init__(name='SQLupload-reconnect')
+        self.daemon = True
+        self.database = database
+        self.backoff = max(backoff,0.1)
+        self.max_backoff = max(max_backoff,self.backoff)
+        self.random = random.Random()
+        self.available = threading.Event()
+        self.stopped = threading.Event()
+        self.attempts = 0
+
+    def run(self):
+        while not self.stopped.wait(
+                           self.backoff*self.random.uniform(0.75,1.25)):
+            self.attempts += 1
+            try:
+                conn = self.database.connect()
+                try:
+                    conn.close()
+                except Exception:
+                    pass
+            except Exception as e:
+                self.backoff = min(self.backoff*2,self.max_backoff)
+                logdbg("database server check %s failed: %s %s, next in %.0f seconds" % (
+                      self.attempts,e.__class__.__name__,e,self.backoff))
+                continue
+            logdbg("database server check %s succeeded" % self.attempts)
+            self.available.set()
+            break
+
+    def stop(self):
+        self.stopped.set()
+
+
+class RainAccumulator(object):
+    """ keep the archive records of the last 24 hours for rain sums
+
+        `RESTThread.get_record()` queries the archive database three
+        times for each LOOP packet to calculate `hourRain`, `rain24`,
+        and `dayRain`. This class provides the same values out of
+        memory. It reads the records from the database at startup and
+        if a gap is detected only. Otherwise it is updated by the
+        ARCHIVE records passed to the thread.
+    """
+
+    # time in seconds after the end of an archive interval to look for
+    # its archive record, which WeeWX saves after the end of the interval
+    ARCHIVE_DELAY = 10
+
+    def __init__(self):
+        # (dateTime, rain, usUnits) of the archive records, ascending
+        self.records = collections.deque()
+        self.last_ts = None
+        self.interval = 300
+        # timestamp of the packet the database was read at last
+        self.sync_ts = None
+
+    def sync(self, dbmanager, time_ts):
+        """ read the archive records of the relevant period """
+        start_ts = min(time_ts-86400,weeutil.weeutil.startOfDay(time_ts))
+        self.records = collections.deque(dbmanager.genSql(
+            "SELECT dateTime, rain, usUnits FROM %s "
+            "WHERE dateTime>=? AND dateTime<=? ORDER BY dateTime"
+            % dbmanager.table_name, (start_ts, time_ts)))
+        self.sync_ts = time_ts
+        if self.records:
+            self.last_ts = self.records[-1][0]
+            if len(self.records)>1:
+                self.interval = self.records[-1][0]-self.records[-2][0]
+        else:
+            self.last_ts = None
+        logdbg("rain accumulator: read %s archive records" % len(self.records))
+
+    def add(self, dbmanager, record):
+        """ update by an ARCHIVE record, re-read if there is a gap """
+        time_ts = record['dateTime']
+        if 'interval' in record:
+            self.interval = record['interval']*60
+        if self.last_ts is not None and time_ts<=self.last_ts:
+            # already included
+            return
+        if (self.last_ts is None or self.sync_ts is None or
+                              time_ts-self.last_ts>self.interval*1.5):
+            self.sync(dbmanager, time_ts)
+        else:
+            self.records.append((time_ts,record.get('rain'),record['usUnits']))
+            self.last_ts = time_ts
+
+    def check(self, dbmanager, time_ts):
+        """ re-read if archive records are missing
+
+            If ARCHIVE records are not bound to this service, new archive
+            records are detected by time. If the archive record is not
+            there, the database is read once per archive interval until
+            it is, not for every LOOP packet.
+        """
+        if self.sync_ts is None:
+            self.sync(dbmanager, time_ts)
+            return
+        if self.last_ts is None:
+            due_ts = self.sync_ts+self.interval
+        else:
+            due_ts = self.last_ts+self.interval+self.ARCHIVE_DELAY
+        if time_ts<due_ts: return
+        if self.sync_ts<due_ts or time_ts>=self.sync_ts+self.interval:
+            self.sync(dbmanager, time_ts)
+
+    def augment(self, record):
+        """ add `hourRain`, `rain24`, and `dayRain` like `get_record()` """
+        time_ts = record['dateTime']
+        sod_ts = weeutil.weeutil.startOfDay(time_ts)
+        # remove records not needed anymore
+        while (self.records and self.records[0][0]<=time_ts-86400 and
+                                                   self.records[0][0]<sod_ts):
+            self.records.popleft()
+        datadict = dict(record)
+        for obs_type, start_ts, incl in (('hourRain',time_ts-3600,False),
+                                         ('rain24',time_ts-86400,False),
+                                         ('dayRain',sod_ts,True)):
+            if obs_type in datadict: continue
+            total = None
+            units = set()
+            for ts, rain, usunits in self.records:
+                if ts>time_ts: break
+                if ts>start_ts or (incl and ts==start_ts):
+                    units.add(usunits)
+                    if rain is not None:
+                        total = rain if total is None else total+rain
+            if total is not None and units!={record['usUnits']}:
+                raise ValueError(
+                    "Inconsistent units (%s vs %s) when calculating %s" % (
+                            sorted(units),record['usUnits'],obs_type))
+            datadict[obs_type] = total
+        return datadict
+
+
+class RollingWindow(object):
+    """ minimum, maximum, sum, and count of one observation type over
+        the last `length` seconds
+
+        The values are kept in a deque together with running sums.
+        Monotonic deques hold the candidates for minimum and maximum.
+        So adding a value and removing expired ones takes constant time
+        on average.
+    """
+
+    def __init__(self, length):
+        self.length = length
+        self.values = collections.deque()
+        self.mins = collections.deque()
+        self.maxs = collections.deque()
+        self.sum = 0.0
+        self.count = 0
+
+    def add(self, time_ts, value):
+        if value is None: return
+        self.values.append((time_ts,value))
+        self.sum += value
+        self.count += 1
+        while self.mins and self.mins[-1][1]>=value:
+            self.mins.pop()
+        self.mins.append((time_ts,value))
+        while self.maxs and self.maxs[-1][1]<=value:
+            self.maxs.pop()
+        self.maxs.append((time_ts,value))
+
+    def expire(self, time_ts):
+        """ remove the values not within the window ending at `time_ts` """
+        cutoff_ts = time_ts-self.length
+        while self.values and self.values[0][0]<=cutoff_ts:
+            self.sum -= self.values.popleft()[1]
+            self.count -= 1
+        while self.mins and self.mins[0][0]<=cutoff_ts:
+            self.mins.popleft()
+        while self.maxs and self.maxs[0][0]<=cutoff_ts:
+            self.maxs.popleft()
+        if not self.count:
+            # avoid rounding errors adding up
+            self.sum = 0.0
+
+    def get(self):
+        if not self.count: return None
+        return {
+            'min':self.mins[0][1],
+            'mintime':self.mins[0][0],
+            'max':self.maxs[0][1],
+            'maxtime':self.maxs[0][0],
+            'sum':self.sum,
+            'avg':self.sum/self.count,
+            'count':self.count
+        }
+
+
+class RollingAggregates(object):
+    """ rolling aggregates of the archive records over several windows
+
+        The records are converted to the unit system of the upload when
+        added. At the first ARCHIVE record, and if a gap is detected,
+        the records of the longest window are read from the archive
+        database by one query.
+    """
+
+    def __init__(self, obs_types, windows, unit_system):
+        self.obs_types = obs_types
+        self.windows = sorted(set(windows))
+        self.unit_system = unit_system
+        self.reset()
+
+    def reset(self):
+        self.aggregates = {length:{obs_type:RollingWindow(length)
+                                   for obs_type in self.obs_types}
+                                           for length in self.windows}
+        self.last_ts = None
+
+    def seed(self, dbmanager, time_ts):
+        """ read the archive records of the longest window """
+        self.reset()
+        obs_types = [obs_type for obs_type in self.obs_types 
+                                            if obs_type in dbmanager.sqlkeys]
+        if not obs_types: return
+        ct = 0
+        for row in dbmanager.genSql(
+            "SELECT dateTime, usUnits, %s FROM %s "
+            "WHERE dateTime>? AND dateTime<=? ORDER BY dateTime" % (
+                ','.join(obs_types),dbmanager.table_name),
+                (time_ts-self.windows[-1],time_ts)):
+            record = dict(zip(['dateTime','usUnits']+obs_types,row))
+            self.add(record)
+            ct += 1
+        logdbg("rolling aggregates: read %s archive records" % ct)
+
+    def add(self, record):
+        time_ts = record['dateTime']
+        if self.last_ts is not None and time_ts<=self.last_ts:
+            # already included
+            return
+        self.last_ts = time_ts
+        _record = weewx.units.to_std_system(record, self.unit_system)
+        for windows in self.aggregates.values():
+            for obs_type, window in windows.items():
+                window.add(time_ts,_record.get(obs_type))
+
+    def update(self, dbmanager, record):
+        """ add an ARCHIVE record, re-read the database if there is
+            a gap """
+        time_ts = record['dateTime']
+        if dbmanager is not None and (self.last_ts is None or
+              time_ts-self.last_ts>record.get('interval',5)*60*1.5):
+            try:
+                self.seed(dbmanager, time_ts)
+            except weedb.DatabaseError as e:
+                logdbg("rolling aggregates: %s %s" % (e.__class__.__name__,e))
+        self.add(record)
+
+    def get_record(self, time_ts):
+        """ the aggregates for upload """
+        record = {'dateTime':time_ts,'usUnits':self.unit_system}
+        for length, windows in self.aggregates.items():
+            record[str(length)] = result = dict()
+            for obs_type, window in windows.items():
+                window.expire(time_ts)
+                result[obs_type] = window.get()
+        return record
+
+
 class SQLloopThread(weewx.restx.RESTThread):
     """ thread to upload the LOOP packet using SQL 
     
         Note: Shutdown handling is included in the base class.
     """
 
+    # history table
+    HISTORY_MAX_PENDING = 10000
+
     def __init__(self, q, 
               host=None, port=3306,
               username=None, password=None,
               database_name=None, table_name=None,
+              database_type='mysql', SQLITE_ROOT=None,
               unit_system='US',
               dry_run=False,
+              history_table=None, history_batch_size=500,
+              history_max_age=2592000,
+              profile=0, profile_dir=None, profile_flag_file=None,
+              profile_top=25, profile_keep=20,
+              breaker_threshold=3, breaker_backoff=5, breaker_max_backoff=300,
+              aggregate_types=None, aggregate_windows=86400,
+              aggregate_id='AGG', topics=None, topics_only=False,
+              live_table=None, live_data_size=8192, live_engine=None,
               skip_upload=False, manager_dict=None,
               log_success=True,log_failure=True):
         super(SQLloopThread, self).__init__(q,
@@ -1188,24 +3945,100 @@ class SQLloopThread(weewx.restx.RESTThread):
         self.dbuser = username
         self.dbpassword = password
         self.dbname = database_name
-        self.dbtable = table_name
+        # The records go to a table of their own if `live_table` is set.
+        # Otherwise they share the table of the skin upload.
+        self.dbtable = live_table or table_name
+        self.live_table = live_table
+        self.live_data_size = weeutil.weeutil.to_int(live_data_size)
+        if live_engine and not re.match(r'^\w+$',live_engine):
+            raise ValueError("invalid storage engine '%s'" % live_engine)
+        self.live_engine = live_engine
+        self.live_oversized = set()
+        # whether the table has the column `GEN`, see `create_live_table()`
+        self.generations = False
+        self.database = get_backend(database_type, host=host, port=port,
+                             username=username, password=password,
+                             database_name=database_name,
+                             SQLITE_ROOT=SQLITE_ROOT)
         # unit system to use for output
         self.unit_system = weewx.units.unit_constants.get(unit_system,weewx.METRIC)
-        # prepare SQL statements
-        self.sql_ins_str = SQLuploadGenerator.SQL_INSERT % self.dbtable
-        self.sql_upd_str = SQLuploadGenerator.SQL_UPDATE % self.dbtable
         # logging
         loginf("%s version %s" % (self.__class__.__name__,VERSION))
         loginf("SQL loop packet upload using unit system %s" % weewx.units.unit_nicknames.get(self.unit_system))
         # database connection
         self.conn = None
+        # records not uploaded yet by ID
+        self.pending = dict()
+        # rain sums of the archive records
+        self.rain_accumulator = RainAccumulator()
+        # table of all the archive records, one row per `dateTime`
+        self.history_table = history_table
+        self.history_batch_size = max(weeutil.weeutil.to_int(history_batch_size),1)
+        # Catching up goes back that many seconds at most, 0 for the
+        # whole archive.
+        self.history_max_age = weeutil.weeutil.to_int(history_max_age or 0)
+        # `dateTime` of the last record in the history table, `None` if 
+        # not known, that is after startup or reconnect
+        self.history_ts = None
+        # more records to upload from the archive database
+        self.history_behind = bool(history_table)
+        # archive records to upload if there is no archive database
+        self.history_pending = []
+        # Circuit breaker: After `breaker_threshold` consecutive failures
+        # the connection is not tried for each packet anymore. Instead a
+        # background thread checks the server with increasing backoff.
+        self.breaker_threshold = max(weeutil.weeutil.to_int(breaker_threshold),1)
+        self.breaker_backoff = weeutil.weeutil.to_float(breaker_backoff)
+        self.breaker_max_backoff = weeutil.weeutil.to_float(breaker_max_backoff)
+        self.failures = 0
+        self.reconnector = None
+        self.breaker_open_ts = None
+        self.skipped = 0
+        # rolling aggregates of the archive records
+        if aggregate_types:
+            if isinstance(aggregate_types,str):
+                aggregate_types = [aggregate_types]
+            if not isinstance(aggregate_windows,list):
+                aggregate_windows = [aggregate_windows]
+            self.aggregates = RollingAggregates(aggregate_types,
+                [weeutil.weeutil.to_int(i) for i in aggregate_windows],
+                self.unit_system)
+        else:
+            self.aggregates = None
+        self.aggregate_id = aggregate_id
+        # LOOP packets split into topics, each uploaded as a record of
+        # its own if its values changed. The observation types not
+        # mentioned go into the topic `other`.
+        self.topics = collections.OrderedDict()
+        if topics:
+            for topic, obs_types in topics.items():
+                if isinstance(obs_types,str): obs_types = [obs_types]
+                self.topics[topic] = obs_types
+            self.topics.setdefault('other',None)
+            loginf("LOOP topics: %s" % ', '.join(self.topics))
+        self.topic_obs_types = set(
+            obs_type for obs_types in self.topics.values() if obs_types
+                                                for obs_type in obs_types)
+        self.topic_values = dict()
+        # Without `topics_only` the whole LOOP packet is uploaded as record
+        # `LOOP`, too, in the same transaction as the topics.
+        self.topics_only = weeutil.weeutil.to_bool(topics_only)
+        # All the packets of one profiling run go into one profile.
+        self.profiler = SQLprofiler('loop', profile_flag_file,
+                profile_dir or 'sqlupload_profile', count=profile,
+                default_count=100, aggregate=True, top=profile_top,
+                keep=profile_keep, check_interval=10)
 
     def process_record(self, record, dbmanager):
+        """ Process loop packet, profiled if requested """
+        self.profiler.call(self.process_packet, record, dbmanager)
+
+    def process_packet(self, record, dbmanager):
         """ Process loop packet
         
             This one differs from the base one by not using urllib functions
         """
-        # Get the full record by querying the database ...
+        # Get the full record by augmenting from memory ...
         _full_record = self.get_record(record, dbmanager)
         # ... check it ...
         self.check_this_record(_full_record)
@@ -1220,13 +4053,103 @@ class SQLloopThread(weewx.restx.RESTThread):
         if _payload:
             data = _payload[0]
             _request['Content-Type'] = _payload[1]
+            if has_hashlib:
+                _request['hash'] = hashlib.sha256(data.encode('utf-8')).hexdigest()
         else:
             data = None
         # ... check to see if this is just a drill...
         if self.skip_upload:
             raise weewx.restx.AbortedPost("Skip post")
-        # ... then, finally, post it
-        self.post_with_retries(_request, data)
+        # ... update the rolling aggregates, which are uploaded within
+        # the same transaction as the ARCHIVE record...
+        if self.aggregates and eventtype=='ARCHIVE':
+            self.aggregates.update(dbmanager, _full_record)
+            self.add_pending(self.aggregate_id,json.dumps(
+                self.aggregates.get_record(_full_record['dateTime']),
+                ensure_ascii=False),'application/json; charset=utf-8',
+                _request['mtime'])
+        # ... then, finally, post it, split into topics if configured
+        if self.topics and eventtype=='LOOP':
+            records = self.get_topic_records(_full_record)
+            for topic_id, topic_data in records:
+                self.add_pending(topic_id,topic_data,
+                    'application/json; charset=utf-8',_request['mtime'])
+            if not self.topics_only:
+                self.post_with_retries(_request, data)
+            elif records:
+                self.upload_pending()
+        else:
+            self.post_with_retries(_request, data)
+        # ... and add archive records to the history table.
+        if self.history_table and (eventtype=='ARCHIVE' or self.history_behind):
+            self.upload_history(_full_record, dbmanager, eventtype=='ARCHIVE')
+
+    def upload_history(self, record, dbmanager, is_archive):
+        """ add the archive records to the history table
+        
+            The records missing on the server are read from the archive
+            database in batches. One batch is uploaded per call, so that
+            the LOOP packets are not delayed too much while catching up
+            after an outage. Records older than `history_max_age` are
+            not uploaded, so that an empty table does not get the whole
+            archive.
+        """
+        if dbmanager is None and is_archive:
+            # Without archive database the records are kept in memory
+            # until they could be uploaded.
+            self.history_pending.append(record)
+            del self.history_pending[:-SQLloopThread.HISTORY_MAX_PENDING]
+        if not self.conn or self.dry_run: return
+        try:
+            if self.history_ts is None:
+                self.conn.execute(self.database.SQL_HISTORY_CREATE % self.history_table)
+                cursor = self.conn.cursor()
+                try:
+                    cursor.execute(self.database.SQL_HISTORY_MAX % self.history_table)
+                    row = cursor.fetchone()
+                finally:
+                    cursor.close()
+                self.history_ts = row[0] if row and row[0] else 0
+                logdbg("history table '%s' up to %s" % (
+                                         self.history_table,self.history_ts))
+            if (self.history_max_age and
+                 self.history_ts<record['dateTime']-self.history_max_age):
+                self.history_ts = record['dateTime']-self.history_max_age
+                if self.log_success:
+                    loginf("history table: catching up from %s only" %
+                     weeutil.weeutil.timestamp_to_string(self.history_ts))
+            if dbmanager is not None:
+                records = list(itertools.islice(dbmanager.genBatchRecords(
+                         self.history_ts,record['dateTime']),
+                         self.history_batch_size))
+            else:
+                records = [rec for rec in self.history_pending
+                             if rec['dateTime']>self.history_ts][:self.history_batch_size]
+            if records:
+                self.conn.begin()
+                self.database.insert_history(self.conn,self.history_table,
+                    [(rec['dateTime'],self.get_post_body(rec)[0])
+                                                         for rec in records])
+                self.conn.commit()
+                self.history_ts = records[-1]['dateTime']
+                if dbmanager is None:
+                    self.history_pending = [rec for rec in self.history_pending
+                                         if rec['dateTime']>self.history_ts]
+            self.history_behind = len(records)>=self.history_batch_size
+            if self.history_behind and self.log_success:
+                loginf("history table: catching up, uploaded %s records up to %s" % (
+                    len(records),
+                    weeutil.weeutil.timestamp_to_string(self.history_ts)))
+        except Exception as e:
+            if self.log_failure:
+                logerr("error uploading to the history table: %s %s" % (
+                                                       e.__class__.__name__,e))
+            try:
+                self.conn.close()
+            except Exception:
+                pass
+            self.conn = None
+            self.history_ts = None
     
     def post_with_retries(self, request, data):
         """ upload data 
@@ -1235,45 +4158,197 @@ class SQLloopThread(weewx.restx.RESTThread):
             uploading LOOP packets by SQL here it is no use to re-try
             as the packets arrive quite frequent.
         """
-        # record id to upload to
-        id = request['id']
-        # modification time of the record
-        mtime = request['mtime']
+        # Records that could not be uploaded before are uploaded together
+        # with this one. Only the latest version of each ID is kept.
+        self.pending[request['id']] = (data,request['Content-Type'],
+                                       request['mtime'],request.get('hash'))
+        self.upload_pending()
+
+    def add_pending(self, id, data, content_type, mtime):
+        """ add a record to upload by the next transaction """
+        self.pending[id] = (data,content_type,mtime,
+            hashlib.sha256(data.encode('utf-8')).hexdigest() 
+                                                   if has_hashlib else None)
+
+    def upload_pending(self):
+        """ upload all the pending records by one statement """
+        if self.live_table:
+            # Records that do not fit into the data column of the live
+            # table would make the whole transaction fail.
+            for id, (data, _, _, _) in list(self.pending.items()):
+                if len(data.encode('utf-8'))>self.live_data_size:
+                    del self.pending[id]
+                    if id not in self.live_oversized:
+                        self.live_oversized.add(id)
+                        logerr("record '%s' exceeds live_data_size of %s bytes, not uploaded" % (id,self.live_data_size))
+            if not self.pending: return
         # check database connection and open it if closed
         if self.conn:
-            is_newly_opened = False
+            pass
         elif self.dry_run:
             self.conn = ConnTest()
-            is_newly_opened = True
+            self.create_live_table()
+        elif self.reconnector and not self.reconnector.available.is_set():
+            # The server is still not reachable. Only the latest version
+            # of each record is kept in `self.pending`.
+            self.skipped += 1
+            return
         else:
             # connect to the database
-            self.conn = weedb.mysql.connect(
-                host=self.dbhost,
-                user=self.dbuser,
-                password=self.dbpassword,
-                database_name=self.dbname,
-                port=self.dbport
-            )
+            try:
+                if not self.database.has_server:
+                    self.create_database()
+                self.conn = self.database.connect()
+                self.create_live_table()
+            except (weedb.DatabaseError,ImportError) as e:
+                self.breaker_failure("error opening database connection: %s %s" % (e.__class__.__name__,e))
+                if self.conn:
+                    try:
+                        self.conn.close()
+                    except Exception:
+                        pass
+                self.conn = None
             if not self.conn:
-                if self.log_failure:
-                    logerr("error opening database connection")
                 return
-            is_newly_opened = True
+            # The last record of the history table is to be read again,
+            # and missing records are uploaded.
+            self.history_ts = None
+            self.history_behind = bool(self.history_table)
         # execute SQL statements and upload data
         try:
             self.conn.begin()
-            if is_newly_opened:
-                self.conn.execute(self.sql_ins_str,(id,))
-            self.conn.execute(self.sql_upd_str,(data,request['Content-Type'],mtime,id))
+            self.database.upsert_records(self.conn,self.dbtable,
+                [(pid,pdata,pcontenttype,pmtime,phash) for pid, 
+                  (pdata,pcontenttype,pmtime,phash) in self.pending.items()],
+                self.generations)
             self.conn.commit()
+            self.pending.clear()
+            self.breaker_success()
         except Exception as e:
-            if self.log_failure:
-                logerr("error uploading data: %s %s" % (e.__class__.__name__,e))
+            self.breaker_failure("error uploading data: %s %s" % (e.__class__.__name__,e))
             # in case of errors close the database connection in order to have
             # it re-opened later on
-            self.conn.close()
+            try:
+                self.conn.close()
+            except Exception:
+                pass
             self.conn = None
     
+    def create_database(self):
+        """ create the SQLite database file if it does not exist
+
+            Otherwise the file is created by the first report cycle,
+            which may run after the first LOOP packets.
+        """
+        try:
+            self.database.create()
+        except weedb.DatabaseExistsError:
+            return
+        loginf("created database '%s'" % self.dbname)
+
+    def create_live_table(self):
+        """ create the live table if configured """
+        if self.live_table:
+            self.database.create_live_table(self.conn,self.live_table,
+                                         self.live_data_size,self.live_engine)
+        elif not self.database.has_server:
+            # The table of the skin upload may not exist yet.
+            self.conn.execute(self.database.SQL_CREATE % (self.dbtable,'BLOB'))
+        # The table of the skin upload has the column `GEN` if the skin
+        # upload uses generations. It is checked again after reconnect,
+        # as it is added by the first report cycle.
+        self.generations = (not self.live_table and not self.dry_run and
+                  self.database.has_generations(self.conn,self.dbtable))
+
+    def breaker_failure(self, msg):
+        """ count a failure and open the circuit breaker if necessary
+
+            Errors are logged until the breaker opens. While it is open
+            they are logged as debug messages only.
+        """
+        self.failures += 1
+        backoff = self.breaker_backoff
+        if self.reconnector:
+            # The server answered the background check, but connecting
+            # or uploading failed anyway. Go on checking.
+            logdbg(msg)
+            self.reconnector.stop()
+            backoff = self.reconnector.backoff
+        elif self.failures>=self.breaker_threshold:
+            if self.log_failure:
+                logerr(msg)
+                logerr("circuit breaker open after %s failures, checking the database server in the background" % self.failures)
+            self.breaker_open_ts = time.time()
+            self.skipped = 0
+        else:
+            if self.log_failure:
+                logerr(msg)
+            return
+        self.reconnector = SQLreconnector(self.database,
+                                 backoff,self.breaker_max_backoff)
+        self.reconnector.start()
+
+    def breaker_success(self):
+        """ close the circuit breaker after a successful upload """
+        if self.reconnector:
+            self.reconnector.stop()
+            self.reconnector = None
+            if self.log_success or self.log_failure:
+                loginf("circuit breaker closed, database server reachable again after %.0f seconds, %s packet%s skipped" % (
+                    time.time()-self.breaker_open_ts,
+                    self.skipped,'' if self.skipped==1 else 's'))
+        self.failures = 0
+
+    def get_record(self, record, dbmanager):
+        """ augment the record by rain sums
+
+            The values are the same as those of the base class, but the
+            database is read only at startup and if a gap is detected.
+            If that fails, the base class is used.
+        """
+        if dbmanager is None:
+            return record
+        try:
+            if record.get('#TYPE')=='ARCHIVE':
+                self.rain_accumulator.add(dbmanager, record)
+            else:
+                self.rain_accumulator.check(dbmanager, record['dateTime'])
+        except weedb.DatabaseError as e:
+            logdbg("rain accumulator: %s %s" % (e.__class__.__name__,e))
+            self.rain_accumulator.sync_ts = None
+            return super(SQLloopThread,self).get_record(record, dbmanager)
+        return self.rain_accumulator.augment(record)
+
+    def get_topic_records(self, record):
+        """ split a LOOP packet into the records of the topics that
+            changed
+
+            Values missing in the packet are taken from the previous
+            ones, so that drivers sending partial packets are supported.
+        """
+        _record = weewx.units.to_std_system(record, self.unit_system)
+        records = []
+        for topic, obs_types in self.topics.items():
+            if obs_types is None:
+                new_values = {key:val for key, val in _record.items()
+                    if key not in self.topic_obs_types and 
+                                           key not in ('dateTime','usUnits')}
+            else:
+                new_values = {key:_record[key] for key in obs_types 
+                                                          if key in _record}
+            values = self.topic_values.setdefault(topic,dict())
+            if all(key in values and values[key]==val 
+                                         for key, val in new_values.items()):
+                # no change
+                continue
+            values.update(new_values)
+            topic_record = {'dateTime':_record['dateTime'],
+                            'usUnits':_record['usUnits']}
+            topic_record.update(values)
+            records.append(('LOOP.%s' % topic,
+                            json.dumps(topic_record,ensure_ascii=False)))
+        return records
+
     def get_post_body(self, record):
         """ convert record as required for upload
         """
@@ -1286,12 +4361,62 @@ class SQLloopThread(weewx.restx.RESTThread):
         return None
 
 
-# log version info at startup
-loginf("%s version %s" % ("SQLupload",VERSION))
-logdbg("has_hashlib=%s, has_pickle=%s" % (has_hashlib,has_pickle))
 
 
-if __name__ == '__main__':
+def verify(config_dict, skin_dict):
+    """ compare the hashes saved on the server with the local state """
+    target_path = get_target_path(config_dict, skin_dict)
+    generator_dict = skin_dict.get('SQLuploadGenerator',configobj.ConfigObj())
+    tablename = generator_dict.get('table_name',skin_dict.get('table_name'))
+    sql_last_upload = SQLlastUpload(target_path)
+    database = get_backend(skin_dict.get('database_type','mysql'),
+                    host=skin_dict.get('host'),
+                    port=skin_dict.get('port',3306),
+                    username=skin_dict.get('username'),
+                    password=skin_dict.get('password'),
+                    database_name=skin_dict.get('database_name'),
+                    SQLITE_ROOT=get_sqlite_root(config_dict,skin_dict))
+    conn = database.connect()
+    try:
+        server = dict()
+        if weeutil.weeutil.to_bool(generator_dict.get('generations',False)):
+            # the latest version of each record the PHP scripts read
+            generation, _ = database.get_generation(conn,tablename)
+            sql = 'SELECT `ID`,`HASH` FROM %s WHERE `GEN`<=%d ORDER BY `GEN`' % (
+                                                        tablename,generation)
+        else:
+            sql = 'SELECT `ID`,`HASH` FROM %s' % tablename
+        cursor = conn.cursor()
+        try:
+            cursor.execute(sql)
+            for id, filehash in cursor.fetchall():
+                server[id] = filehash
+        finally:
+            cursor.close()
+    finally:
+        conn.close()
+    local = sql_last_upload.hash_dict
+    missing = sorted(id for id in local if id not in server)
+    different = sorted(id for id in local if id in server and 
+                                               server[id]!=local[id])
+    # chunk records have no hash
+    chunks = {'%s~%03d' % (id,idx) for id,ct in sql_last_upload.chunks_dict.items()
+                                                for idx in range(1,ct+1)}
+    missing.extend(sorted(id for id in chunks if id not in server))
+    unknown = sorted(id for id in server if id not in local and id not in chunks)
+    for id in missing:
+        print('missing on server: %s' % id)
+    for id in different:
+        print('different hash:    %s' % id)
+    for id in unknown:
+        print('unknown locally:   %s' % id)
+    print('%s records checked, %s missing, %s different, %s unknown' % (
+                      len(local),len(missing),len(different),len(unknown)))
+    return 1 if missing or different else 0
+
+
+def test_setup():
+    """ the developer's test setup """
 
     config_dict = configobj.ConfigObj({
         'log_success':True,
@@ -1346,3 +4471,115 @@ if __name__ == '__main__':
         gen.new_loop_packet(Event())
         time.sleep(2)
         gen.shutDown()
+
+def main():
+    """ command line tool
+
+        `sync` uploads all the files of a report to the database server
+        at once, for example to set up a new web server. `sync --verify`
+        compares the hashes saved on the server with the local state.
+        `loadtest` measures how many packets the LOOP upload service can
+        process using a stand-in database server.
+
+        Usage:
+            PYTHONPATH=/etc/weewx/bin:/usr/share/weewx \\
+            python3 -m user.sqlupload sync --config /etc/weewx/weewx.conf
+    """
+    global testing, cli_debug
+    import argparse
+    parser = argparse.ArgumentParser(prog='python3 -m user.sqlupload',
+                               description='SQLupload version %s' % VERSION)
+    subparsers = parser.add_subparsers(dest='command')
+    sync_parser = subparsers.add_parser('sync',
+                           help='upload all the files of a report at once')
+    sync_parser.add_argument('--config',default=None,
+                             help='WeeWX configuration file')
+    sync_parser.add_argument('--report',default='SQLupload',
+               help='report section in [StdReport], default SQLupload')
+    sync_parser.add_argument('--connections',type=int,default=4,
+               help='number of database connections, default 4')
+    sync_parser.add_argument('--batch-size',type=int,default=50,
+               help='records per transaction, default 50')
+    sync_parser.add_argument('--restart',action='store_true',
+               help='do not resume an interrupted run but start anew')
+    sync_parser.add_argument('--verify',action='store_true',
+               help='compare the hashes on the server with the local state')
+    sync_parser.add_argument('--debug',action='store_true',
+               help='print debug messages')
+    load_parser = subparsers.add_parser('loadtest',
+                 help='feed synthetic packets into the LOOP upload service')
+    load_parser.add_argument('--rate',type=float,default=2.0,
+               help='LOOP packets per second, default 2')
+    load_parser.add_argument('--duration',type=float,default=30.0,
+               help='seconds to send packets, default 30')
+    load_parser.add_argument('--archive-interval',type=float,default=60.0,
+               help='seconds between ARCHIVE records, 0 for none, default 60')
+    load_parser.add_argument('--latency',type=float,default=5.0,
+               help='milliseconds per SQL statement, default 5')
+    load_parser.add_argument('--jitter',type=float,default=0.0,
+               help='additional random milliseconds per statement, default 0')
+    load_parser.add_argument('--failure-rate',type=float,default=0.0,
+               help='probability of a commit to fail, default 0')
+    load_parser.add_argument('--history',action='store_true',
+               help='upload the ARCHIVE records to a history table, too')
+    load_parser.add_argument('--max-age-p95',type=float,default=None,
+               help='fail if the 95th percentile of the packet age in seconds is above')
+    load_parser.add_argument('--max-drop-rate',type=float,default=None,
+               help='fail if the fraction of packets not delivered is above')
+    load_parser.add_argument('--max-blocked',type=float,default=None,
+               help='fail if a callback of the engine blocked longer (seconds)')
+    load_parser.add_argument('--debug',action='store_true',
+               help='print debug messages')
+    subparsers.add_parser('test',help="run the developer's test setup")
+    args = parser.parse_args()
+
+    if args.command=='test':
+        testing = True
+        test_setup()
+        return 0
+    if args.command=='loadtest':
+        # The test harness is a module of its own, as it is not needed
+        # for operation.
+        import user.sqlupload_loadtest
+        cli_debug = args.debug
+        result = user.sqlupload_loadtest.load_test(args.rate,args.duration,
+                      args.archive_interval,args.latency/1000.0,
+                      args.jitter/1000.0,args.failure_rate,args.history,
+                      args.debug)
+        return user.sqlupload_loadtest.load_test_report(result,
+                      args.max_age_p95,args.max_drop_rate,args.max_blocked)
+    if args.command!='sync':
+        parser.print_help()
+        return 2
+
+    cli_debug = args.debug
+    try:
+        try:
+            import weecfg
+            config_path, config_dict = weecfg.read_config(args.config)
+        except ImportError:
+            config_path = args.config
+            config_dict = configobj.ConfigObj(config_path,file_error=True)
+    except (OSError,SyntaxError) as e:
+        print('could not read the configuration: %s' % e)
+        return 2
+    if args.report not in config_dict.get('StdReport',configobj.ConfigObj()):
+        print("report '%s' not found in %s" % (args.report,config_path))
+        return 2
+    skin_dict = weewx.reportengine.build_skin_dict(config_dict,args.report)
+
+    if args.verify:
+        return verify(config_dict,skin_dict)
+
+    gen = SQLuploadGenerator(config_dict,skin_dict,time.time(),True,None)
+    gen.sync = SQLsync(args.connections,args.batch_size,args.restart)
+    try:
+        gen.run()
+    except KeyboardInterrupt:
+        print('Interrupted. Run the command again to resume.')
+        return 1
+    return gen.sync.report()
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,249 @@
+# load test of the SQLupload LOOP upload service
+# Copyright (C) 2024 Johanna Roedenbeck
+
+"""
+
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+"""
+
+"""
+    Synthetic LOOP packets and ARCHIVE records are fed into the LOOP
+    upload service of SQLupload the same way the WeeWX engine does, and
+    uploaded to a stand-in database server. This module is used by the
+    `loadtest` command of `user.sqlupload`:
+    
+    PYTHONPATH=/etc/weewx/bin:/usr/share/weewx python3 -m user.sqlupload loadtest
+"""
+
+import json
+import threading
+import time
+
+import configobj
+
+import weewx
+import weedb
+
+from user.sqlupload import SQLbackend, SQLRESTful
+
+
+class LoadTestBackend(SQLbackend):
+    """ stand-in database server of the `loadtest` command
+
+        Each statement takes `latency` seconds plus up to `jitter`
+        seconds at random, and a commit fails with the probability
+        `failure_rate`. The time each synthetic packet is committed
+        is recorded by its sequence number.
+    """
+
+    def __init__(self, latency=0.005, jitter=0.0, failure_rate=0.0):
+        import random
+        super(LoadTestBackend,self).__init__(database_name='loadtest')
+        self.latency = latency
+        self.jitter = jitter
+        self.failure_rate = failure_rate
+        self.random = random.Random()
+        self.lock = threading.Lock()
+        self.delivered = dict()
+        self.connects = 0
+        self.commits = 0
+        self.failures = 0
+
+    def create(self):
+        raise weedb.DatabaseExistsError('stand-in database')
+
+    def connect(self):
+        self.connects += 1
+        self.delay()
+        return LoadTestConn(self)
+
+    def get_max_record_size(self, conn):
+        return None
+
+    def delay(self):
+        time.sleep(self.latency+self.random.uniform(0,self.jitter))
+
+    def commit(self, records):
+        """ record the time the packets arrived """
+        self.delay()
+        with self.lock:
+            if self.random.random()<self.failure_rate:
+                self.failures += 1
+                raise weedb.OperationalError('injected failure')
+            self.commits += 1
+            now = time.time()
+            for data in records:
+                try:
+                    seq = json.loads(data).get('loadtest_seq')
+                except (ValueError,TypeError,AttributeError):
+                    continue
+                if seq is not None:
+                    self.delivered.setdefault(seq,now)
+
+
+class LoadTestConn(object):
+    """ connection to the stand-in database server """
+
+    def __init__(self, backend):
+        self.backend = backend
+        self.records = []
+
+    def begin(self):
+        self.records = []
+
+    def execute(self, sql, args=()):
+        self.backend.delay()
+        if sql.startswith('UPDATE'):
+            self.records.append(args[0])
+        elif sql.startswith('INSERT INTO'):
+            # records of `ID`, data, content type, time, and hash
+            self.records.extend(args[1::5])
+        elif sql.startswith('INSERT IGNORE') and len(args)>1:
+            # history table
+            self.records.extend(args[1::2])
+
+    def commit(self):
+        records = self.records
+        self.records = []
+        self.backend.commit(records)
+
+    def rollback(self):
+        self.records = []
+
+    def cursor(self):
+        return LoadTestCursor()
+
+    def close(self):
+        pass
+
+
+class LoadTestCursor(object):
+    """ cursor of the stand-in database server, the tables are empty """
+
+    def execute(self, sql, args=()):
+        pass
+
+    def fetchone(self):
+        return (None,)
+
+    def fetchall(self):
+        return []
+
+    def close(self):
+        pass
+
+
+def percentile(values, p):
+    """ `p`-th percentile of a sorted list """
+    if not values: return None
+    return values[min(int(round(p/100.0*(len(values)-1))),len(values)-1)]
+
+def load_test(rate=2.0, duration=30.0, archive_interval=60.0, latency=0.005,
+              jitter=0.0, failure_rate=0.0, history=False, log_failure=False):
+    """ feed synthetic LOOP packets and ARCHIVE records into the service
+
+        The packets are passed to `SQLRESTful.new_loop_packet()` and
+        `new_archive_record()` as the WeeWX engine does, and uploaded
+        to a `LoadTestBackend`. Returns a dict of the results.
+    """
+    config_dict = configobj.ConfigObj({'StdRESTful':{'SQLupload':{
+        'binding':['LOOP','ARCHIVE'],
+        'database_name':'loadtest',
+        'table_name':'loadtest',
+        'log_success':False,
+        'log_failure':log_failure,
+    }}})
+    if history:
+        config_dict['StdRESTful']['SQLupload']['history_table'] = 'loadtest_history'
+    class Engine(object):
+        def bind(self, event_type, callback):
+            pass
+    service = SQLRESTful(Engine(),config_dict)
+    # The thread connects when the first packet arrives.
+    backend = LoadTestBackend(latency,jitter,failure_rate)
+    service.loop_thread.database = backend
+    sent = dict()
+    blocked = []
+    seq = 0
+    start_ts = time.time()
+    next_ts = start_ts
+    next_archive_ts = start_ts+archive_interval if archive_interval else None
+    try:
+        while next_ts<start_ts+duration:
+            wait = next_ts-time.time()
+            if wait>0: time.sleep(wait)
+            now = time.time()
+            seq += 1
+            if next_archive_ts and now>=next_archive_ts:
+                next_archive_ts += archive_interval
+                event = weewx.Event(weewx.NEW_ARCHIVE_RECORD,record={
+                    'dateTime':int(now),'usUnits':weewx.US,'interval':5,
+                    'outTemp':50.0+seq%10,'rain':0.0,'loadtest_seq':seq})
+                callback = service.new_archive_record
+            else:
+                event = weewx.Event(weewx.NEW_LOOP_PACKET,packet={
+                    'dateTime':int(now),'usUnits':weewx.US,
+                    'outTemp':50.0+seq%10,'rain':0.0,'loadtest_seq':seq})
+                callback = service.new_loop_packet
+            sent[seq] = now
+            callback(event)
+            blocked.append(time.time()-now)
+            next_ts += 1.0/rate
+    finally:
+        # Wait for the thread to upload what is in the queue.
+        service.shutDown()
+    end_ts = time.time()
+    ages = sorted(backend.delivered[i]-sent[i] for i in backend.delivered
+                                                                 if i in sent)
+    blocked.sort()
+    return {
+        'sent':len(sent),
+        'delivered':len(ages),
+        'dropped':len(sent)-len(ages),
+        'elapsed':end_ts-start_ts,
+        'throughput':len(ages)/max(end_ts-start_ts,0.001),
+        'age':{p:percentile(ages,p) for p in (50,95,99,100)},
+        'blocked':{p:percentile(blocked,p) for p in (50,95,99,100)},
+        'connects':backend.connects,
+        'commits':backend.commits,
+        'failures':backend.failures,
+    }
+
+def load_test_report(result, max_age_p95=None, max_drop_rate=None,
+                     max_blocked=None):
+    """ print the results of `load_test()` and check the limits """
+    def ms(x):
+        return '-' if x is None else '%.1f ms' % (x*1000.0)
+    print('Sent %s packets in %.1f seconds, delivered %s, dropped %s' % (
+        result['sent'],result['elapsed'],result['delivered'],result['dropped']))
+    print('Throughput %.1f packets/s, %s connections, %s commits, %s injected failures' % (
+        result['throughput'],result['connects'],result['commits'],
+        result['failures']))
+    for key, title in (('age','Packet age'),('blocked','Callback blocking')):
+        print('%-18s p50 %s, p95 %s, p99 %s, max %s' % (title,
+            ms(result[key][50]),ms(result[key][95]),ms(result[key][99]),
+            ms(result[key][100])))
+    failed = []
+    if max_age_p95 is not None and (result['age'][95] is None or
+                                    result['age'][95]>max_age_p95):
+        failed.append('packet age p95 above %s s' % max_age_p95)
+    if max_drop_rate is not None and (result['dropped']>
+                                    max_drop_rate*max(result['sent'],1)):
+        failed.append('drop rate above %s' % max_drop_rate)
+    if max_blocked is not None and (result['blocked'][100] or 0)>max_blocked:
+        failed.append('callback blocked longer than %s s' % max_blocked)
+    for msg in failed:
+        print('FAILED: %s' % msg)
+    return 1 if failed else 0
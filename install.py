@@ -47,7 +47,8 @@ class SQLuploadInstaller(ExtensionInstaller):
                 }
             },
             files=[
-                ('bin/user', ['bin/user/sqlupload.py']),
+                ('bin/user', ['bin/user/sqlupload.py',
+                              'bin/user/sqlupload_loadtest.py']),
                 ('skins/SQLupload', ['skins/SQLupload/skin.conf']),
             ]
         )
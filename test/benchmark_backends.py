@@ -0,0 +1,108 @@
+#!/usr/bin/env python3
+""" cycle time of the skin upload by database backend
+
+    Runs report cycles of SQLuploadGenerator over generated HTML pages.
+    Before each cycle every page is changed, so that all the records
+    are uploaded. SQLite is measured always, MySQL or MariaDB if a
+    database server is given by `--mysql-host`.
+
+    python3 benchmark_backends.py --cycles 20 --pages 100 --size 20000
+    python3 benchmark_backends.py --mysql-host localhost --username weewx --password weewx --database weewxbench
+"""
+
+import argparse
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+import configobj
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(
+                                          os.path.abspath(__file__))),'bin'))
+
+import user.sqlupload as sqlupload
+
+
+def write_pages(html_root, pages, size, cycle):
+    """ write the pages, their content differs from cycle to cycle """
+    # few tags, so that parsing does not outweigh the upload
+    line = 'cycle %s line %%s of page %%s\n' % cycle
+    lines = max(size//len(line % (0,0)),1)
+    for page in range(pages):
+        body = ''.join(line % (i,page) for i in range(lines))
+        with open(os.path.join(html_root,'page%03d.html' % page),'wt') as f:
+            f.write('<!DOCTYPE html>\n<html>\n<head><title>page %s</title></head>\n<body>\n<pre>\n%s</pre>\n</body>\n</html>\n' % (page,body))
+        # The generator compares the modification time in seconds.
+        ts = time.time()+cycle+1
+        os.utime(os.path.join(html_root,'page%03d.html' % page),(ts,ts))
+
+
+def benchmark(database_options, pages, size, cycles):
+    """ cycle times in seconds """
+    times = []
+    with tempfile.TemporaryDirectory() as tmp:
+        html_root = os.path.join(tmp,'HTML_ROOT')
+        os.mkdir(html_root)
+        skin_dict = configobj.ConfigObj({
+            'HTML_ROOT':html_root,
+            'SQLITE_ROOT':tmp,
+            'log_success':False,
+            'SQLuploadGenerator':{
+                'page%03d' % page:{'file':'page%03d.html' % page,
+                                   'html_divide_tag':'body'}
+                                                 for page in range(pages)}
+        })
+        skin_dict.merge(configobj.ConfigObj(database_options))
+        config_dict = configobj.ConfigObj({'WEEWX_ROOT':'/'})
+        for cycle in range(cycles+1):
+            write_pages(html_root,pages,size,cycle)
+            gen = sqlupload.SQLuploadGenerator(config_dict,skin_dict,
+                                              time.time(),cycle==0,{})
+            start_ts = time.perf_counter()
+            gen.run()
+            # The first cycle creates the database and the table.
+            if cycle: times.append(time.perf_counter()-start_ts)
+    return times
+
+
+def main():
+    parser = argparse.ArgumentParser(
+                       description='cycle time of the skin upload by backend')
+    parser.add_argument('--cycles',type=int,default=10,
+                        help='number of report cycles, default 10')
+    parser.add_argument('--pages',type=int,default=100,
+                        help='number of pages, default 100')
+    parser.add_argument('--size',type=int,default=20000,
+                        help='size of a page in bytes, default 20000')
+    parser.add_argument('--mysql-host',help='MySQL or MariaDB server')
+    parser.add_argument('--mysql-port',type=int,default=3306)
+    parser.add_argument('--username')
+    parser.add_argument('--password')
+    parser.add_argument('--database',default='weewxbench',
+                        help='database to create the table in')
+    args = parser.parse_args()
+
+    backends = [('sqlite',{'database_type':'sqlite',
+                           'database_name':'bench.sdb',
+                           'table_name':'bench'})]
+    if args.mysql_host:
+        backends.append(('mysql',{'database_type':'mysql',
+                                  'host':args.mysql_host,
+                                  'port':args.mysql_port,
+                                  'username':args.username,
+                                  'password':args.password,
+                                  'database_name':args.database,
+                                  'table_name':'bench'}))
+    print('%s pages of %s bytes, %s cycles' % (args.pages,args.size,args.cycles))
+    for name, options in backends:
+        times = benchmark(options,args.pages,args.size,args.cycles)
+        print('%-6s cycle time median %.3f s, mean %.3f s, %.0f records/s' % (
+              name,statistics.median(times),statistics.mean(times),
+              args.pages/statistics.median(times)))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
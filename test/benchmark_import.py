@@ -0,0 +1,118 @@
+#!/usr/bin/env python3
+""" import time and memory of the module by the way it is used
+
+    Each path is measured in fresh interpreters:
+
+    generator  WeeWX report engine, then the module, and dividing an
+               HTML file
+    loop       WeeWX engine, then the module and the LOOP upload service
+    cli        `python3 -m user.sqlupload` printing its help
+
+    For the generator and the LOOP path the time to import the module is
+    measured inside the interpreter, after WeeWX is loaded. The memory
+    is the peak resident set size of the interpreter, reported by the
+    operating system, less that of an interpreter that loads WeeWX only.
+    For the command line the time is the run time of the process.
+
+    python3 benchmark_import.py --runs 25
+    python3 benchmark_import.py --bin ../bin --bin /tmp/old/bin
+"""
+
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+HTML_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                         'test_files','index.html')
+
+# WeeWX modules loaded before the module, and the code to measure
+PATHS = {
+    'generator':('import weewx.reportengine',
+                 'import user.sqlupload\n'
+                 'user.sqlupload.SQLuploadGenerator.process_html(None,%r,"",'
+                 '"body",[])' % HTML_FILE),
+    'loop':('import weewx.engine\nimport weewx.restx',
+            'import user.sqlupload\n'
+            'user.sqlupload.SQLRESTful\n'
+            'user.sqlupload.SQLloopThread'),
+}
+
+CHILD = """
+import time
+%s
+start_ts = time.perf_counter()
+%s
+print(time.perf_counter()-start_ts)
+"""
+
+
+def run(args, bin_dir):
+    """ run a Python interpreter and return its output and peak RSS in KiB """
+    env = dict(os.environ)
+    env['PYTHONPATH'] = os.pathsep.join([bin_dir]+[x for x in
+                                   [env.get('PYTHONPATH')] if x])
+    start_ts = time.perf_counter()
+    proc = subprocess.Popen([sys.executable]+args,env=env,
+                            stdout=subprocess.PIPE,stderr=subprocess.DEVNULL)
+    out = proc.stdout.read()
+    _, _, rusage = os.wait4(proc.pid,0)
+    proc.returncode = 0
+    duration = time.perf_counter()-start_ts
+    # ru_maxrss is in KiB on Linux, but in bytes on macOS
+    rss = rusage.ru_maxrss/1024 if sys.platform=='darwin' else rusage.ru_maxrss
+    return out, duration, rss
+
+
+def measure(path, bin_dir, runs):
+    """ median import time in ms and additional peak RSS in KiB """
+    times = []
+    rss = []
+    base_rss = []
+    if path=='cli':
+        for _ in range(runs):
+            _, duration, maxrss = run(['-m','user.sqlupload'],bin_dir)
+            times.append(duration*1000.0)
+            rss.append(maxrss)
+            _, _, maxrss = run(['-c','import weewx'],bin_dir)
+            base_rss.append(maxrss)
+    else:
+        setup, code = PATHS[path]
+        for _ in range(runs):
+            out, _, maxrss = run(['-c',CHILD % (setup,code)],bin_dir)
+            times.append(float(out)*1000.0)
+            rss.append(maxrss)
+            _, _, maxrss = run(['-c',setup],bin_dir)
+            base_rss.append(maxrss)
+    return (statistics.median(times),
+            statistics.median(rss)-statistics.median(base_rss))
+
+
+def main():
+    parser = argparse.ArgumentParser(
+                       description='import time and memory by usage path')
+    parser.add_argument('--runs',type=int,default=15,
+                        help='number of interpreters per path, default 15')
+    parser.add_argument('--bin',action='append',default=None,
+                        help='directory containing user/sqlupload.py, can be '
+                             'given several times to compare versions')
+    parser.add_argument('--path',action='append',choices=['generator','loop','cli'],
+                        default=None,help='path to measure, default all')
+    args = parser.parse_args()
+    bin_dirs = args.bin or [os.path.join(os.path.dirname(os.path.dirname(
+                                        os.path.abspath(__file__))),'bin')]
+    paths = args.path or ['generator','loop','cli']
+
+    print('median of %s runs' % args.runs)
+    print('%-10s %-30s %10s %10s' % ('path','bin','time ms','RSS KiB'))
+    for path in paths:
+        for bin_dir in bin_dirs:
+            duration, rss = measure(path,bin_dir,args.runs)
+            print('%-10s %-30s %10.1f %10.0f' % (path,bin_dir[-30:],duration,rss))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
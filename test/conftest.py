@@ -0,0 +1,66 @@
+# Shared fixtures of the SQLupload tests
+#
+# The tests use SQLite databases in temporary directories, so that no
+# database server is required.
+
+import os
+import sys
+import shutil
+import time
+
+import pytest
+import configobj
+
+TEST_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(os.path.dirname(TEST_DIR), 'bin'))
+
+import user.sqlupload as sqlupload
+
+
+@pytest.fixture
+def html_root(tmp_path):
+    """ copy of the test files as the HTML_ROOT of a skin """
+    root = tmp_path / 'HTML_ROOT'
+    shutil.copytree(os.path.join(TEST_DIR, 'test_files'), str(root))
+    return str(root)
+
+
+@pytest.fixture
+def sqlite_root(tmp_path):
+    """ directory for the SQLite database files """
+    root = tmp_path / 'SQLITE_ROOT'
+    root.mkdir()
+    return str(root)
+
+
+@pytest.fixture
+def run_generator(html_root, sqlite_root):
+    """ run one report cycle of SQLuploadGenerator against SQLite
+
+        Returns a function taking the `[SQLuploadGenerator]` section,
+        `first_run`, the `SQLsync` instance of the `sync` command, and
+        additional skin options.
+    """
+    def run(generator_dict=None, first_run=True, sync=None, **skin_options):
+        skin_dict = configobj.ConfigObj({
+            'HTML_ROOT': html_root,
+            'database_type': 'sqlite',
+            'SQLITE_ROOT': sqlite_root,
+            'database_name': 'weewx-web.sdb',
+            'table_name': 'web',
+            'username': 'phpuser',
+            'password': 'phppassword',
+            'SQLuploadGenerator': generator_dict if generator_dict is not None else {
+                'file1': {'file': 'index.html'},
+                'file2': {'file': 'test.html', 'html_divide_tag': 'body'},
+                'pngfile': {'file': 'partly-cloudy-day.png'},
+            },
+        })
+        skin_dict.merge(configobj.ConfigObj(skin_options))
+        config_dict = configobj.ConfigObj({'WEEWX_ROOT': '/'})
+        gen = sqlupload.SQLuploadGenerator(config_dict, skin_dict,
+                                           time.time(), first_run, {})
+        gen.sync = sync
+        gen.run()
+        return gen
+    return run
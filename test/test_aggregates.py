@@ -0,0 +1,95 @@
+# Rolling aggregates compared with a brute-force computation
+
+import random
+
+import pytest
+
+import weewx
+import weewx.manager
+import weewx.schemas.wview_extended
+import weewx.units
+
+import user.sqlupload as sqlupload
+
+
+def brute_force(samples, time_ts, length):
+    """ aggregates of the values within the window ending at `time_ts`
+
+        Of equal extremes the latest one counts.
+    """
+    values = [(ts,val) for ts, val in samples
+                   if time_ts-length<ts<=time_ts and val is not None]
+    if not values: return None
+    vmin = min(val for _, val in values)
+    vmax = max(val for _, val in values)
+    total = sum(val for _, val in values)
+    return {
+        'min':vmin,
+        'mintime':max(ts for ts, val in values if val==vmin),
+        'max':vmax,
+        'maxtime':max(ts for ts, val in values if val==vmax),
+        'sum':pytest.approx(total),
+        'avg':pytest.approx(total/len(values)),
+        'count':len(values)
+    }
+
+
+def test_rolling_window():
+    rng = random.Random(3)
+    window = sqlupload.RollingWindow(600)
+    samples = []
+    ts = 1700000000
+    for _ in range(2000):
+        # sometimes long pauses, so that all the values expire
+        ts += rng.choice([1,10,60,60,300,700])
+        value = rng.choice([None,rng.randint(-20,20)/4.0])
+        samples.append((ts,value))
+        window.add(ts,value)
+        window.expire(ts)
+        assert window.get()==brute_force(samples,ts,600)
+        # later, without new values
+        ts += rng.randint(0,700)
+        window.expire(ts)
+        assert window.get()==brute_force(samples,ts,600)
+
+
+@pytest.fixture
+def dbmanager(tmp_path):
+    manager = weewx.manager.Manager.open_with_create(
+        {'driver':'weedb.sqlite','database_name':str(tmp_path / 'weewx.sdb')},
+        table_name='archive',schema=weewx.schemas.wview_extended.schema)
+    yield manager
+    manager.close()
+
+
+def test_rolling_aggregates(dbmanager):
+    rng = random.Random(4)
+    windows = [3600,86400]
+    obs_types = ['outTemp','windSpeed']
+    records = []
+    start_ts = 1700000100
+    def new_record(ts):
+        return {'dateTime':ts,'usUnits':weewx.US,'interval':5,
+                'outTemp':rng.choice([None,rng.randint(0,400)/4.0]),
+                'windSpeed':rng.randint(0,40)/2.0}
+    # archive of two days before the service starts
+    for ts in range(start_ts-2*86400,start_ts,300):
+        records.append(new_record(ts))
+        dbmanager.addRecord(records[-1])
+    aggregates = sqlupload.RollingAggregates(obs_types,windows,weewx.METRIC)
+    for ts in list(range(start_ts,start_ts+86400,300))+list(
+                          range(start_ts+90000,start_ts+2*86400,300)):
+        # The archive is read at startup and after the gap.
+        records.append(new_record(ts))
+        dbmanager.addRecord(records[-1])
+        aggregates.update(dbmanager,records[-1])
+        if ts%3600>=300: continue
+        result = aggregates.get_record(ts)
+        assert result['usUnits']==weewx.METRIC
+        metric = [weewx.units.to_std_system(rec,weewx.METRIC)
+                                                        for rec in records]
+        for length in windows:
+            for obs_type in obs_types:
+                expected = brute_force([(rec['dateTime'],rec[obs_type])
+                                         for rec in metric],ts,length)
+                assert result[str(length)][obs_type]==expected
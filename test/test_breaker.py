@@ -0,0 +1,96 @@
+# Circuit breaker of the LOOP upload service
+
+import queue
+import sqlite3
+import threading
+import time
+
+import weedb
+
+import user.sqlupload as sqlupload
+
+
+class Server(object):
+    """ SQLite database that can be switched off """
+    def __init__(self, database):
+        self.up = True
+        # names of the threads that connected
+        self.connects = []
+        self.connect = database.connect
+        database.connect = self.connect_if_up
+    def connect_if_up(self):
+        self.connects.append(threading.current_thread().name)
+        if not self.up:
+            raise weedb.CannotConnectError('server down')
+        return self.connect()
+
+
+def post(thread, id, value):
+    thread.post_with_retries({'id':id,'Content-Type':'application/json',
+                              'mtime':time.time(),'hash':None},
+                             '{"outTemp":%s}' % value)
+
+
+def wait_available(thread):
+    for _ in range(100):
+        if thread.reconnector.available.is_set(): return True
+        time.sleep(0.05)
+    return False
+
+
+def test_breaker(tmp_path):
+    thread = sqlupload.SQLloopThread(queue.Queue(),
+                        database_name='weewx-web.sdb', table_name='web',
+                        database_type='sqlite',
+                        SQLITE_ROOT=str(tmp_path / 'SQLITE_ROOT'),
+                        breaker_threshold=2, breaker_backoff=0.1,
+                        breaker_max_backoff=0.2, log_failure=False)
+    server = Server(thread.database)
+    post(thread,'LOOP',1)
+    assert thread.failures==0
+    # The server goes down. The breaker opens after 2 failures.
+    thread.conn.close()
+    thread.conn = None
+    server.up = False
+    post(thread,'LOOP',2)
+    assert thread.failures==1
+    assert thread.reconnector is None
+    post(thread,'LOOP',3)
+    assert thread.failures==2
+    assert thread.reconnector is not None
+    # While open, there are no connection attempts by the packets, and
+    # only the latest packet of each ID is kept.
+    del server.connects[:]
+    for value in range(4,9):
+        post(thread,'LOOP',value)
+        post(thread,'ARCHIVE',value)
+    assert thread.skipped==10
+    assert sorted(thread.pending)==['ARCHIVE','LOOP']
+    assert thread.pending['LOOP'][0]=='{"outTemp":8}'
+    time.sleep(0.3)
+    assert not thread.reconnector.available.is_set()
+    assert thread.reconnector.attempts>=1
+    assert set(server.connects)=={'SQLupload-reconnect'}
+    # The background check succeeds, but the server fails again when
+    # the next packet is uploaded (half-open). The breaker stays open.
+    server.up = True
+    assert wait_available(thread)
+    reconnector = thread.reconnector
+    server.up = False
+    post(thread,'LOOP',9)
+    assert thread.reconnector is not None
+    assert thread.reconnector is not reconnector
+    assert reconnector.stopped.is_set()
+    # The server is up again. The next packet closes the breaker and
+    # uploads the pending records together with it.
+    server.up = True
+    assert wait_available(thread)
+    post(thread,'LOOP',10)
+    assert thread.reconnector is None
+    assert thread.failures==0
+    assert not thread.pending
+    thread.conn.close()
+    fn = str(tmp_path / 'SQLITE_ROOT' / 'weewx-web.sdb')
+    with sqlite3.connect(fn) as conn:
+        rows = dict(conn.execute('SELECT `ID`,`TEXT` FROM web').fetchall())
+    assert rows=={'LOOP':'{"outTemp":10}','ARCHIVE':'{"outTemp":8}'}
@@ -0,0 +1,92 @@
+# Records larger than the server accepts, uploaded in chunks
+
+import json
+import os
+import sqlite3
+import time
+
+import user.sqlupload as sqlupload
+
+
+class VariableConnection(object):
+    """ connection answering `get_variable()` """
+    def __init__(self, value):
+        self.value = value
+    def get_variable(self, name):
+        if self.value is None:
+            raise KeyError(name)
+        return (name,self.value)
+
+
+class RecordingConnection(object):
+    """ statements executed instead of a database connection """
+    def __init__(self):
+        self.statements = []
+    def execute(self, sql, args=()):
+        self.statements.append((sql,args))
+
+
+def write_big_page(html_root, lines):
+    page = os.path.join(html_root,'big.html')
+    with open(page,'wt') as f:
+        f.write('<!DOCTYPE html>\n<html>\n<head><title>big</title></head>\n<body>\n')
+        for i in range(lines):
+            f.write('<p>line %04d of the big page</p>\n' % i)
+        f.write('</body>\n</html>\n')
+    ts = time.time()+lines
+    os.utime(page,(ts,ts))
+
+
+def chunk_rows(sqlite_root):
+    with sqlite3.connect(os.path.join(sqlite_root,'weewx-web.sdb')) as conn:
+        return conn.execute("SELECT `ID`,`TEXT` FROM web WHERE `ID` LIKE 'big%' ORDER BY `ID`").fetchall()
+
+
+def test_get_max_record_size():
+    # escaping may double the size, 1024 bytes for the statement itself
+    assert sqlupload.get_max_record_size(VariableConnection('1048576'))==523776
+    assert sqlupload.get_max_record_size(VariableConnection('1024'))==256
+    assert sqlupload.get_max_record_size(VariableConnection(None)) is None
+
+
+def test_upload_record_chunks():
+    conn = RecordingConnection()
+    data = bytes(range(256))*3
+    assert sqlupload.upload_record(conn,'web','UPDATE','page',data,
+                                   'text/html',1700000000,'hash',300)==2
+    assert conn.statements==[
+        ('UPDATE',(data[:300],'text/html',1700000000,'hash','page')),
+        ('DELETE FROM web WHERE `ID` LIKE ?',('page~%',)),
+        ('INSERT INTO web(`ID`,`TEXT`) VALUES (?,?)',('page~001',data[300:600])),
+        ('INSERT INTO web(`ID`,`TEXT`) VALUES (?,?)',('page~002',data[600:])),
+    ]
+    # small enough, no former chunks
+    conn = RecordingConnection()
+    assert sqlupload.upload_record(conn,'web','UPDATE','page',data[:300],
+                       'text/html',1700000000,'hash',300,had_chunks=False)==0
+    assert len(conn.statements)==1
+
+
+def test_chunks_shrink(run_generator, html_root, sqlite_root, monkeypatch):
+    monkeypatch.setattr(sqlupload.SQLiteBackend,'get_max_record_size',
+                        lambda self, conn: 256)
+    sections = {'big':{'file':'big.html','html_divide_tag':'body'}}
+    write_big_page(html_root,30)
+    run_generator(sections,first_run=True)
+    rows = chunk_rows(sqlite_root)
+    ids = [id for id, _ in rows]
+    assert ids[0]=='big'
+    assert ids[1:]==['big~%03d' % i for i in range(1,len(ids))]
+    assert len(ids)>2
+    assert all(len(text)<=256 for _, text in rows)
+    assert b'line 0029' in b''.join(text for _, text in rows)
+    with open(os.path.join(html_root,'#SQLupload.last')) as f:
+        assert json.load(f)['chunks']=={'big':len(ids)-1}
+    # The page shrinks, the chunk records are removed.
+    write_big_page(html_root,2)
+    run_generator(sections,first_run=False)
+    rows = chunk_rows(sqlite_root)
+    assert [id for id, _ in rows]==['big']
+    assert b'line 0001' in rows[0][1]
+    with open(os.path.join(html_root,'#SQLupload.last')) as f:
+        assert json.load(f)['chunks']=={}
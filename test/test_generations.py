@@ -0,0 +1,38 @@
+# Generational uploads to SQLite
+
+import os
+import sqlite3
+import time
+
+
+def test_existing_table_gets_generations(run_generator, html_root, sqlite_root):
+    # table created without generations
+    run_generator(first_run=True)
+    fn = os.path.join(sqlite_root,'weewx-web.sdb')
+    with sqlite3.connect(fn) as conn:
+        before = conn.execute('SELECT `ID`,`HASH`,`TEXT` FROM web').fetchall()
+    assert before
+    # WeeWX restarted with generations switched on
+    page = os.path.join(html_root,'test.html')
+    with open(page,'rt') as f:
+        text = f.read()
+    with open(page,'wt') as f:
+        f.write(text.replace('</body>','<p>changed</p></body>'))
+    os.utime(page,(time.time()+5,time.time()+5))
+    run_generator(first_run=True,SQLuploadGenerator={'generations':'true'})
+    with sqlite3.connect(fn) as conn:
+        columns = [row[1] for row in conn.execute('PRAGMA table_info(web)')]
+        pk = [row[1] for row in conn.execute('PRAGMA table_info(web)') if row[5]]
+        rows = conn.execute('SELECT `ID`,`GEN`,`HASH` FROM web ORDER BY `ID`,`GEN`').fetchall()
+        pointer = conn.execute('SELECT `GEN` FROM web_gen').fetchone()[0]
+        tables = [row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type='table'")]
+    assert 'GEN' in columns
+    assert pk==['ID','GEN']
+    assert 'web_old' not in tables
+    assert pointer==1
+    # The unchanged records stay in generation 0, the changed one is
+    # uploaded as generation 1.
+    hashes = {id:hash for id, hash, _ in before}
+    assert [(id,gen) for id, gen, _ in rows if id!='file2']==[('file1',0),('pngfile',0)]
+    assert [row for row in rows if row[0]=='file2'][-1][1]==1
+    assert [row for row in rows if row[0]=='file2'][-1][2]!=hashes['file2']
@@ -0,0 +1,72 @@
+# History table of the LOOP upload service catching up from the archive
+
+import os
+import queue
+import sqlite3
+import time
+
+import pytest
+
+import weewx
+import weewx.manager
+import weewx.schemas.wview_extended
+
+import user.sqlupload as sqlupload
+
+INTERVAL = 3600
+
+
+@pytest.fixture
+def dbmanager(tmp_path):
+    manager = weewx.manager.Manager.open_with_create(
+        {'driver':'weedb.sqlite','database_name':str(tmp_path / 'weewx.sdb')},
+        table_name='archive',schema=weewx.schemas.wview_extended.schema)
+    yield manager
+    manager.close()
+
+
+def history(tmp_path, dbmanager, days, **kwargs):
+    """ start the service with `days` of archive records and upload the
+        next ones until it caught up
+    """
+    end_ts = (int(time.time())//INTERVAL)*INTERVAL
+    for ts in range(end_ts-days*86400,end_ts,INTERVAL):
+        dbmanager.addRecord({'dateTime':ts,'usUnits':weewx.METRIC,
+                             'interval':INTERVAL//60,'outTemp':20.0})
+    thread = sqlupload.SQLloopThread(queue.Queue(),
+                        database_name='weewx-web.sdb', table_name='web',
+                        database_type='sqlite',unit_system='METRIC',
+                        SQLITE_ROOT=str(tmp_path / 'SQLITE_ROOT'),
+                        history_table='history',history_batch_size=100,
+                        **kwargs)
+    calls = 0
+    ts = end_ts
+    while calls==0 or thread.history_behind:
+        record = {'dateTime':ts,'usUnits':weewx.METRIC,
+                  'interval':INTERVAL//60,'outTemp':21.0}
+        dbmanager.addRecord(record)
+        record['#TYPE'] = 'ARCHIVE'
+        thread.process_packet(record,dbmanager)
+        calls += 1
+        ts += INTERVAL
+    thread.conn.close()
+    fn = str(tmp_path / 'SQLITE_ROOT' / 'weewx-web.sdb')
+    with sqlite3.connect(fn) as conn:
+        rows = [row[0] for row in conn.execute(
+                          'SELECT `dateTime` FROM history ORDER BY `dateTime`')]
+    return end_ts, ts, rows, calls
+
+
+def test_catch_up_limited(tmp_path, dbmanager):
+    end_ts, last_ts, rows, calls = history(tmp_path,dbmanager,60)
+    # 30 days by default, no gap
+    assert rows[0]==end_ts-30*86400+INTERVAL
+    assert rows==list(range(rows[0],last_ts,INTERVAL))
+    assert calls==8
+
+
+def test_catch_up_whole_archive(tmp_path, dbmanager):
+    end_ts, last_ts, rows, calls = history(tmp_path,dbmanager,10,
+                                           history_max_age='0')
+    assert rows==list(range(end_ts-10*86400,last_ts,INTERVAL))
+    assert calls==3
@@ -0,0 +1,85 @@
+# Small images and style sheets embedded into the pages
+
+import json
+import os
+import shutil
+import sqlite3
+import time
+
+SECTIONS = {
+    'page':{'file':'inline.html','html_divide_tag':'body'},
+    'css':{'file':'style.css'},
+    'png':{'file':'partly-cloudy-day.png'},
+    'bigpng':{'file':'big.png'},
+}
+
+PAGE = """<!DOCTYPE html>
+<html>
+  <head><title>inline</title></head>
+  <body>
+    <link rel="stylesheet" href="style.css" />
+    <img src="partly-cloudy-day.png" />
+    <img src="big.png" />
+    <img src="https://www.example.com/external.png" />
+  </body>
+</html>
+"""
+
+
+def write(html_root, fn, data):
+    path = os.path.join(html_root,fn)
+    with open(path,'wb') as f:
+        f.write(data)
+    ts = time.time()+5
+    os.utime(path,(ts,ts))
+
+
+def page_text(sqlite_root):
+    with sqlite3.connect(os.path.join(sqlite_root,'weewx-web.sdb')) as conn:
+        return conn.execute("SELECT `TEXT` FROM web WHERE `ID`='page'").fetchone()[0].decode('utf-8')
+
+
+def inlined(html_root):
+    with open(os.path.join(html_root,'#SQLupload.last')) as f:
+        return json.load(f)['inlined']
+
+
+def test_inline(run_generator, html_root, sqlite_root):
+    write(html_root,'inline.html',PAGE.encode('utf-8'))
+    write(html_root,'style.css',b'p { color: red; }\n')
+    with open(os.path.join(html_root,'partly-cloudy-day.png'),'rb') as f:
+        png = f.read()
+    # too large to embed
+    write(html_root,'big.png',png+b'\0'*1000)
+    options = {'inline_assets_below':'2500'}
+    run_generator(dict(SECTIONS,**options))
+    text = page_text(sqlite_root)
+    assert '<style>p { color: red; }\n</style>' in text
+    assert 'data:image/png;base64,' in text
+    assert 'big.png.php' in text
+    assert 'https://www.example.com/external.png' in text
+    assert sorted(inlined(html_root)['inline.html'])==[
+                                         'partly-cloudy-day.png','style.css']
+    # The style sheet changes, the page is uploaded again.
+    write(html_root,'style.css',b'p { color: blue; }\n')
+    run_generator(dict(SECTIONS,**options),first_run=False)
+    assert '<style>p { color: blue; }\n</style>' in page_text(sqlite_root)
+    # The style sheet grows beyond the limit, it is not embedded anymore.
+    write(html_root,'style.css',b'p { color: green; }\n'+b'/* padding */\n'*200)
+    run_generator(dict(SECTIONS,**options),first_run=False)
+    text = page_text(sqlite_root)
+    assert '<style>' not in text
+    assert 'color: green' not in text
+    assert inlined(html_root)['inline.html']==['partly-cloudy-day.png']
+
+
+def test_inline_off(run_generator, html_root, sqlite_root):
+    write(html_root,'inline.html',PAGE.encode('utf-8'))
+    write(html_root,'style.css',b'p { color: red; }\n')
+    shutil.copy(os.path.join(html_root,'partly-cloudy-day.png'),
+                os.path.join(html_root,'big.png'))
+    run_generator(dict(SECTIONS))
+    text = page_text(sqlite_root)
+    assert '<style>' not in text
+    assert 'data:' not in text
+    assert 'partly-cloudy-day.png.php' in text
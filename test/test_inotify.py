@@ -0,0 +1,96 @@
+# Changes reported by inotify that could not be uploaded at once
+
+import os
+import sqlite3
+import sys
+import time
+
+import pytest
+
+import user.sqlupload as sqlupload
+
+pytestmark = pytest.mark.skipif(not sys.platform.startswith('linux'),
+                                reason='inotify is Linux only')
+
+
+@pytest.fixture
+def watched(html_root):
+    """ shut the inotify watcher down after the test """
+    yield html_root
+    watcher = sqlupload._inotify_watchers.pop(html_root,None)
+    if watcher:
+        watcher.shutDown()
+        watcher.join()
+
+
+def change_page(html_root, text):
+    fn = os.path.join(html_root,'test.html')
+    with open(fn,'rt') as f:
+        page = f.read()
+    with open(fn,'wt') as f:
+        f.write(page.replace('</body>','<p>%s</p></body>' % text))
+    # The generator compares the modification time in seconds.
+    os.utime(fn,(time.time()+5,time.time()+5))
+
+
+def uploaded_text(sqlite_root, id):
+    with sqlite3.connect(os.path.join(sqlite_root,'weewx-web.sdb')) as conn:
+        return conn.execute("SELECT `TEXT` FROM web WHERE `ID`=?",(id,)).fetchone()[0]
+
+
+def generator_dict(**options):
+    generator_dict = {
+        'use_inotify':'true',
+        'file1':{'file':'index.html'},
+        'file2':{'file':'test.html','html_divide_tag':'body'},
+    }
+    generator_dict.update(options)
+    return generator_dict
+
+
+def test_failed_upload_retried(run_generator, watched, sqlite_root,
+                                                                 monkeypatch):
+    # The watcher starts with the first cycle, which checks all files.
+    run_generator(generator_dict(),first_run=True)
+    change_page(watched,'changed')
+    # the upload of the changed page fails
+    upload_record = sqlupload.upload_record
+    def failing_upload_record(conn, tablename, sql_upd_str, id, *args, **kwargs):
+        if id=='file2':
+            raise ValueError('upload failed')
+        return upload_record(conn,tablename,sql_upd_str,id,*args,**kwargs)
+    monkeypatch.setattr(sqlupload,'upload_record',failing_upload_record)
+    run_generator(generator_dict(),first_run=False)
+    assert b'changed' not in uploaded_text(sqlite_root,'file2')
+    assert sqlupload.SQLlastUpload(watched).get_dirty()=={'test.html'}
+    # The inotify event was consumed, but the change is kept.
+    monkeypatch.setattr(sqlupload,'upload_record',upload_record)
+    run_generator(generator_dict(),first_run=False)
+    assert b'changed' in uploaded_text(sqlite_root,'file2')
+    assert sqlupload.SQLlastUpload(watched).get_dirty()==set()
+
+
+def test_unchanged_files_omitted(run_generator, watched):
+    run_generator(generator_dict(),first_run=True)
+    change_page(watched,'changed')
+    gen = run_generator(generator_dict(),first_run=False)
+    last = sqlupload.SQLlastUpload(watched)
+    assert last.get_dirty()==set()
+    assert gen.schedule_sections(gen.skin_dict['SQLuploadGenerator'],watched,
+                                 last,set())==[]
+
+
+def test_refresh_interval(run_generator, watched, sqlite_root):
+    options = generator_dict()
+    options['file2']['refresh_interval'] = '1'
+    run_generator(options,first_run=True)
+    change_page(watched,'changed')
+    # held back by the refresh interval
+    run_generator(options,first_run=False)
+    assert b'changed' not in uploaded_text(sqlite_root,'file2')
+    assert sqlupload.SQLlastUpload(watched).get_dirty()=={'test.html'}
+    # uploaded after the interval elapsed, although there is no new event
+    time.sleep(1.1)
+    run_generator(options,first_run=False)
+    assert b'changed' in uploaded_text(sqlite_root,'file2')
+    assert sqlupload.SQLlastUpload(watched).get_dirty()==set()
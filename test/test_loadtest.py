@@ -0,0 +1,20 @@
+# Load test harness of the LOOP upload service
+
+import user.sqlupload_loadtest as loadtest
+
+
+def test_percentile():
+    assert loadtest.percentile([],50) is None
+    assert loadtest.percentile([1,2,3,4,5],50)==3
+    assert loadtest.percentile([1,2,3,4,5],100)==5
+
+
+def test_load_test(capsys):
+    result = loadtest.load_test(rate=50,duration=1,archive_interval=0.5,
+                                latency=0.001,history=True)
+    assert result['sent']>0
+    assert result['delivered']+result['dropped']==result['sent']
+    assert result['failures']==0
+    assert loadtest.load_test_report(result,max_drop_rate=1.0)==0
+    assert loadtest.load_test_report(result,max_blocked=-1)==1
+    assert 'FAILED' in capsys.readouterr().out
@@ -0,0 +1,83 @@
+# LOOP upload service writing to SQLite
+
+import os
+import queue
+import sqlite3
+import time
+
+import user.sqlupload as sqlupload
+
+
+def upload(tmp_path, **kwargs):
+    thread = sqlupload.SQLloopThread(queue.Queue(),
+                        database_name='weewx-web.sdb', table_name='web',
+                        database_type='sqlite',
+                        SQLITE_ROOT=str(tmp_path / 'SQLITE_ROOT'),
+                        **kwargs)
+    thread.pending['LOOP'] = ('{"outTemp":"20.0"}','application/json',
+                                                          time.time(),'hash')
+    thread.upload_pending()
+    assert not thread.pending
+    assert thread.failures==0
+    thread.conn.close()
+    fn = str(tmp_path / 'SQLITE_ROOT' / 'weewx-web.sdb')
+    with sqlite3.connect(fn) as conn:
+        return conn.execute('SELECT `ID`,`TEXT` FROM %s' % (
+                       kwargs.get('live_table') or 'web')).fetchall()
+
+
+def test_database_created(tmp_path):
+    # The first report cycle did not run yet.
+    assert upload(tmp_path)==[('LOOP','{"outTemp":"20.0"}')]
+
+
+def test_database_created_live_table(tmp_path):
+    assert upload(tmp_path,live_table='live')==[('LOOP','{"outTemp":"20.0"}')]
+
+
+def test_table_with_generations(run_generator, sqlite_root):
+    # The skin upload created the table with the column `GEN`.
+    run_generator(first_run=True,SQLuploadGenerator={'generations':'true'})
+    thread = sqlupload.SQLloopThread(queue.Queue(),
+                        database_name='weewx-web.sdb', table_name='web',
+                        database_type='sqlite', SQLITE_ROOT=sqlite_root)
+    for temp in ('20.0','20.5'):
+        thread.pending['LOOP'] = ('{"outTemp":"%s"}' % temp,
+                                  'application/json',time.time(),temp)
+        thread.upload_pending()
+        assert not thread.pending
+        assert thread.failures==0
+    thread.conn.close()
+    fn = os.path.join(sqlite_root,'weewx-web.sdb')
+    with sqlite3.connect(fn) as conn:
+        rows = conn.execute("SELECT `ID`,`GEN`,`TEXT` FROM web WHERE `ID`='LOOP'").fetchall()
+    assert rows==[('LOOP',0,'{"outTemp":"20.5"}')]
+
+
+def upload_topics(tmp_path, **kwargs):
+    thread = sqlupload.SQLloopThread(queue.Queue(),
+                        database_name='weewx-web.sdb', table_name='web',
+                        database_type='sqlite', unit_system='METRIC',
+                        SQLITE_ROOT=str(tmp_path / 'SQLITE_ROOT'),
+                        topics={'wind':['windSpeed','windDir']},**kwargs)
+    for ts, wind in ((1700000000,2.0),(1700000002,3.0)):
+        thread.process_packet({'dateTime':ts,'usUnits':16,'#TYPE':'LOOP',
+                               'outTemp':20.0,'windSpeed':wind,'windDir':90.0},
+                              None)
+    assert thread.failures==0
+    thread.conn.close()
+    fn = str(tmp_path / 'SQLITE_ROOT' / 'weewx-web.sdb')
+    with sqlite3.connect(fn) as conn:
+        return dict(conn.execute('SELECT `ID`,`TEXT` FROM web').fetchall())
+
+
+def test_topics_with_loop(tmp_path):
+    rows = upload_topics(tmp_path)
+    assert sorted(rows)==['LOOP','LOOP.other','LOOP.wind']
+    assert '"windSpeed": 3.0' in rows['LOOP']
+    assert '"windSpeed": 3.0' in rows['LOOP.wind']
+
+
+def test_topics_only(tmp_path):
+    rows = upload_topics(tmp_path,topics_only='true')
+    assert sorted(rows)==['LOOP.other','LOOP.wind']
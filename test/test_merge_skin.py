@@ -0,0 +1,93 @@
+# Sections taken over from the configuration of another skin
+
+import os
+import time
+
+import configobj
+
+import user.sqlupload as sqlupload
+
+SKIN_CONF = """
+[CheetahGenerator]
+    [[SummaryByMonth]]
+        [[[NOAA_month]]]
+            encoding = normalized_ascii
+            template = NOAA/NOAA-%Y-%m.txt.tmpl
+    [[SummaryByYear]]
+        [[[NOAA_year]]]
+            template = NOAA/NOAA-%Y.txt.tmpl
+        [[[bad]]]
+            template = %Y/year.txt.tmpl
+    [[ToDate]]
+        [[[index]]]
+            template = index.html.tmpl
+        [[[statistics]]]
+            template = statistics.html.tmpl
+            stale_age = 3600
+        [[[telemetry]]]
+            template = telemetry.html.tmpl
+            generate_once = true
+[ImageGenerator]
+    [[day_images]]
+        stale_age = 300
+        [[[daybarometer]]]
+        [[[dayrain]]]
+            stale_age = 900
+"""
+
+
+def new_generator(tmp_path, html_root):
+    skin_dir = tmp_path / 'skins' / 'Seasons'
+    skin_dir.mkdir(parents=True)
+    (skin_dir / 'skin.conf').write_text(SKIN_CONF)
+    config_dict = configobj.ConfigObj({
+        'WEEWX_ROOT':str(tmp_path),
+        'StdReport':{'SKIN_ROOT':'skins','SeasonsReport':{'skin':'Seasons'}}})
+    skin_dict = configobj.ConfigObj({'HTML_ROOT':html_root})
+    return sqlupload.SQLuploadGenerator(config_dict,skin_dict,time.time(),
+                                        True,{})
+
+
+def test_merge_skin(tmp_path, html_root):
+    noaa = os.path.join(html_root,'NOAA')
+    os.mkdir(noaa)
+    year, month = time.localtime()[:2]
+    for fn in ('NOAA-2020-01.txt','NOAA-2020-12.txt','NOAA-2020.txt',
+               'NOAA-%04d-%02d.txt' % (year,month),'NOAA-%04d.txt' % year,
+               'NOAA-2020-1.txt','other.txt'):
+        with open(os.path.join(noaa,fn),'wt') as f:
+            f.write(fn)
+    generator_dict = configobj.ConfigObj({
+        'merge_skin':'SeasonsReport',
+        # sections already there are kept
+        'index':{'file':'index.html','priority':'1'},
+        'NOAA_year-2020':{'file':'NOAA/NOAA-2020.txt','enable':'false'},
+    })
+    new_generator(tmp_path,html_root).merge_skin(generator_dict,html_root)
+    assert generator_dict['index']=={'file':'index.html','priority':'1'}
+    assert generator_dict['statistics']=={'file':'statistics.html',
+                                          'stale_age':'3600'}
+    assert 'telemetry' not in generator_dict
+    # one section per existing file of the summaries, past periods closed
+    assert generator_dict['NOAA_month-2020-01']=={
+        'file':'NOAA/NOAA-2020-01.txt','encoding':'normalized_ascii',
+        'closed_period':True}
+    assert generator_dict['NOAA_month-2020-12']['closed_period']
+    assert generator_dict['NOAA_month-%04d-%02d' % (year,month)]=={
+        'file':'NOAA/NOAA-%04d-%02d.txt' % (year,month),
+        'encoding':'normalized_ascii'}
+    assert generator_dict['NOAA_year-2020']=={'file':'NOAA/NOAA-2020.txt',
+                                              'enable':'false'}
+    assert generator_dict['NOAA_year-%04d' % year]=={
+        'file':'NOAA/NOAA-%04d.txt' % year}
+    summaries = sorted(sec for sec in generator_dict.sections
+                                                 if sec.startswith('NOAA'))
+    assert summaries==sorted(['NOAA_month-2020-01','NOAA_month-2020-12',
+        'NOAA_month-%04d-%02d' % (year,month),'NOAA_year-2020',
+        'NOAA_year-%04d' % year])
+    assert not any(sec.startswith('bad') for sec in generator_dict.sections)
+    # images, `stale_age` of the subsection before the section
+    assert generator_dict['day_images-daybarometer']=={
+        'file':'daybarometer.png','content_type':'image/png',
+        'stale_age':'300'}
+    assert generator_dict['day_images-dayrain']['stale_age']=='900'
@@ -0,0 +1,165 @@
+# Minification of HTML, JavaScript, CSS, and JSON
+
+import html.parser
+import json
+import os
+import re
+
+import user.sqlupload as sqlupload
+
+TEST_FILES = os.path.join(os.path.dirname(os.path.abspath(__file__)),'test_files')
+
+
+class Rendering(html.parser.HTMLParser):
+    """ what a browser makes out of a page, as far as minification can
+        change it
+
+        Runs of whitespace in text are equivalent to a single space
+        except within `<pre>` and `<textarea>`. Attribute values, 
+        comments, and the content of `<script>` and `<style>` must be
+        identical.
+    """
+
+    def __init__(self, text):
+        super(Rendering,self).__init__(convert_charrefs=True)
+        self.events = []
+        self.preformatted = 0
+        self.rawtext = False
+        self.feed(text)
+        self.close()
+
+    def handle_starttag(self, tag, attrs):
+        if tag in ('pre','textarea'): self.preformatted += 1
+        self.rawtext = tag in ('script','style')
+        self.events.append(('start',tag,attrs))
+
+    def handle_endtag(self, tag):
+        if tag in ('pre','textarea'): self.preformatted -= 1
+        self.rawtext = False
+        self.events.append(('end',tag))
+
+    def handle_startendtag(self, tag, attrs):
+        self.events.append(('start',tag,attrs))
+
+    def handle_data(self, data):
+        if not self.preformatted and not self.rawtext:
+            data = re.sub(r'\s+',' ',data)
+            if data==' ': return
+        if self.events and self.events[-1][0]=='data':
+            data = self.events.pop()[1]+data
+        self.events.append(('data',data))
+
+    def handle_comment(self, data):
+        self.events.append(('comment',data))
+
+
+def minify(text, content_type):
+    return sqlupload.minify(text.encode('utf-8'),content_type).decode('utf-8')
+
+
+PAGE = '''<!DOCTYPE html>
+<html>
+  <head>
+    <title>Test</title>
+    <meta name="description"
+          content="first line
+                   second line">
+    <style>
+      body  {
+        color: red;
+      }
+    </style>
+  </head>
+  <body>
+    <!-- comment
+         over two lines -->
+    <p title="a tooltip
+       with a line break" data-x='1 >   2'>
+      Some   text
+      over lines
+    </p>
+    <pre>
+  preformatted
+      text
+    </pre>
+    <textarea name="t">
+  line 1
+
+  line 3
+    </textarea>
+    <script>
+      var s = "a\\
+        b";
+      if (1 <  2) { console.log(s); }
+    </script>
+  </body>
+</html>
+'''
+
+
+def test_html_renders_the_same():
+    result = minify(PAGE,'text/html; charset=utf-8')
+    assert len(result)<len(PAGE)
+    assert Rendering(result).events==Rendering(PAGE).events
+
+
+def test_html_preserved_parts():
+    result = minify(PAGE,'text/html')
+    assert 'content="first line\n                   second line"' in result
+    assert 'title="a tooltip\n       with a line break"' in result
+    assert "data-x='1 >   2'" in result
+    assert '<pre>\n  preformatted\n      text\n    </pre>' in result
+    assert '<textarea name="t">\n  line 1\n\n  line 3\n    </textarea>' in result
+    assert '      var s = "a\\\n        b";' in result
+    assert '<!-- comment\n         over two lines -->' in result
+    assert '\n  <body>' not in result
+
+
+def test_html_test_files():
+    for name in ('index.html','test.html','skintestfile.html'):
+        with open(os.path.join(TEST_FILES,name),'rt',encoding='utf-8') as f:
+            text = f.read()
+        assert Rendering(minify(text,'text/html')).events==Rendering(text).events
+
+
+def test_css():
+    css = '''/* comment */
+body  {
+    font-family: "Open   Sans", sans-serif;
+    margin : 0 auto;
+}
+/*! license */
+a:hover   > span { content: 'x  y'; }
+'''
+    assert minify(css,'text/css')==(
+        'body{font-family: "Open   Sans",sans-serif;margin : 0 auto;}'
+        "/*! license */ a:hover > span{content: 'x  y';}")
+
+
+def test_js():
+    js = '''
+    function f(a) {
+        return a + 1
+    }
+
+    var re = /  x  /;
+'''
+    assert minify(js,'application/javascript')==(
+        'function f(a) {\nreturn a + 1\n}\nvar re = /  x  /;')
+    # template literals are left alone
+    js = 'var s = `a\n    b`;\n'
+    assert minify(js,'text/javascript')==js
+
+
+def test_json():
+    data = {'a':[1,2.5,None],'b':'x  y','c':{'ä':True}}
+    text = json.dumps(data,indent=4)
+    result = minify(text,'application/json')
+    assert json.loads(result)==data
+    assert result=='{"a":[1,2.5,null],"b":"x  y","c":{"ä":true}}'
+
+
+def test_invalid_data_unchanged():
+    assert sqlupload.minify(b'{"a":',"application/json")==b'{"a":'
+    assert sqlupload.minify(b'\xff\xfe','text/html')==b'\xff\xfe'
+    assert sqlupload.minify(b'abc  ','image/png')==b'abc  '
@@ -0,0 +1,80 @@
+# Lossless recompression of PNG images
+
+import io
+import os
+import struct
+import zlib
+
+import pytest
+
+import user.sqlupload as sqlupload
+
+TEST_PNG = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                        'test_files','partly-cloudy-day.png')
+
+
+def chunk(type, data):
+    return (struct.pack('>I',len(data))+type+data+
+            struct.pack('>I',zlib.crc32(type+data)&0xffffffff))
+
+
+def chunks(data):
+    result = []
+    pos = 8
+    while pos<len(data):
+        length, type = struct.unpack_from('>I4s',data,pos)
+        result.append((type,data[pos+8:pos+8+length]))
+        pos += length+12
+    return result
+
+
+def make_png(extra_chunks=()):
+    """ 16x16 RGB image, stored with low compression """
+    raw = b''.join(b'\x00'+bytes(value for x in range(16)
+                                  for value in (x*16,y*16,(x+y)*8))
+                   for y in range(16))
+    return (b'\x89PNG\r\n\x1a\n'+
+            chunk(b'IHDR',struct.pack('>IIBBBBB',16,16,8,2,0,0,0))+
+            b''.join(chunk(type,data) for type, data in extra_chunks)+
+            chunk(b'IDAT',zlib.compress(raw,0))+
+            chunk(b'IEND',b''))
+
+
+def test_pixels_unchanged():
+    Image = pytest.importorskip('PIL.Image')
+    with open(TEST_PNG,'rb') as f:
+        data = f.read()
+    result = sqlupload.optimize_png(data)
+    assert len(result)<=len(data)
+    before = Image.open(io.BytesIO(data))
+    after = Image.open(io.BytesIO(result))
+    assert after.mode==before.mode
+    assert after.size==before.size
+    assert after.tobytes()==before.tobytes()
+
+
+def test_chunks():
+    data = make_png([(b'pHYs',struct.pack('>IIB',3780,3780,1)),
+                     (b'tEXt',b'Comment\x00' + b'x'*200)])
+    result = sqlupload.optimize_png(data)
+    assert len(result)<len(data)
+    assert [type for type, _ in chunks(result)]==[b'IHDR',b'pHYs',b'IDAT',b'IEND']
+    assert chunks(result)[1]==chunks(data)[1]
+    # same image data
+    assert (zlib.decompress(chunks(result)[2][1])==
+            zlib.decompress(chunks(data)[3][1]))
+
+
+def test_animated_png_unchanged():
+    Image = pytest.importorskip('PIL.Image')
+    frames = [Image.new('RGB',(8,8),color) for color in ('red','blue')]
+    buf = io.BytesIO()
+    frames[0].save(buf,format='PNG',save_all=True,append_images=frames[1:],
+                   compress_level=0)
+    data = buf.getvalue()
+    assert b'acTL' in data
+    assert sqlupload.optimize_png(data)==data
+
+
+def test_not_png():
+    assert sqlupload.optimize_png(b'GIF89a...')==b'GIF89a...'
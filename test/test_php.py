@@ -0,0 +1,111 @@
+# Conditional requests answered by the generated PHP scripts
+#
+# The scripts are served by the built-in web server of PHP, reading
+# the records from a SQLite database. The tests are skipped if `php`
+# or its SQLite PDO driver is not available.
+
+import os
+import re
+import shutil
+import socket
+import subprocess
+import time
+import urllib.request
+import urllib.error
+
+import pytest
+
+import user.sqlupload as sqlupload
+
+PHP = shutil.which('php')
+
+
+def php_has_pdo_sqlite():
+    if not PHP: return False
+    reply = subprocess.run([PHP,'-m'],capture_output=True,text=True)
+    return 'pdo_sqlite' in reply.stdout
+
+pytestmark = pytest.mark.skipif(not php_has_pdo_sqlite(),
+                                reason='php with pdo_sqlite not found')
+
+
+@pytest.fixture
+def php_server(html_root):
+    """ PHP built-in web server serving HTML_ROOT """
+    with socket.socket() as s:
+        s.bind(('127.0.0.1',0))
+        port = s.getsockname()[1]
+    proc = subprocess.Popen([PHP,'-S','127.0.0.1:%d' % port,'-t',html_root],
+                            stdout=subprocess.DEVNULL,stderr=subprocess.DEVNULL)
+    try:
+        for _ in range(50):
+            try:
+                socket.create_connection(('127.0.0.1',port),0.1).close()
+                break
+            except OSError:
+                time.sleep(0.1)
+        yield 'http://127.0.0.1:%d/' % port
+    finally:
+        proc.terminate()
+        proc.wait()
+
+
+def get(url, headers=None):
+    """ status, headers, and body of a GET request """
+    request = urllib.request.Request(url,headers=headers or {})
+    try:
+        with urllib.request.urlopen(request,timeout=10) as reply:
+            return reply.status, reply.headers, reply.read()
+    except urllib.error.HTTPError as e:
+        return e.code, e.headers, e.read()
+
+
+def test_etag_and_304(run_generator, php_server):
+    run_generator()
+    status, headers, body = get(php_server+'test.php')
+    assert status==200
+    assert b'<body' in body
+    etag = headers['ETag']
+    assert etag and etag.startswith('"')
+    assert headers['Last-Modified']
+    # the browser already has the current version
+    status, _, body = get(php_server+'test.php',{'If-None-Match':etag})
+    assert status==304
+    assert body==b''
+    status, _, _ = get(php_server+'test.php',
+                       {'If-Modified-Since':headers['Last-Modified']})
+    assert status==304
+    # another version
+    status, _, _ = get(php_server+'test.php',{'If-None-Match':'"other"'})
+    assert status==200
+
+
+def test_changed_record_invalidates_etag(run_generator, php_server, html_root):
+    run_generator()
+    _, headers, _ = get(php_server+'test.php')
+    etag = headers['ETag']
+    time.sleep(1.1)
+    fn = os.path.join(html_root,'test.html')
+    with open(fn,'rt') as f:
+        page = f.read()
+    with open(fn,'wt') as f:
+        f.write(page.replace('</body>','<p>changed</p></body>'))
+    run_generator(first_run=False)
+    status, headers, body = get(php_server+'test.php',{'If-None-Match':etag})
+    assert status==200
+    assert b'changed' in body
+    assert headers['ETag']!=etag
+
+
+def test_chunks_reassembled(run_generator, php_server, html_root, monkeypatch):
+    # records of 256 bytes at most
+    monkeypatch.setattr(sqlupload.SQLiteBackend,'get_max_record_size',
+                        lambda self, conn: 256)
+    lines = ['<p>line %04d of the big page</p>\n' % i for i in range(30)]
+    with open(os.path.join(html_root,'big.html'),'wt') as f:
+        f.write('<!DOCTYPE html>\n<html>\n<head><title>big</title></head>\n'
+                '<body>\n%s</body>\n</html>\n' % ''.join(lines))
+    run_generator({'big':{'file':'big.html','html_divide_tag':'body'}})
+    status, _, body = get(php_server+'big.php')
+    assert status==200
+    assert re.findall(rb'line (\d{4})',body)==[b'%04d' % i for i in range(30)]
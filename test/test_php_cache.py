@@ -0,0 +1,52 @@
+# File cache of the generated PHP scripts
+
+import os
+import shutil
+import subprocess
+
+import pytest
+
+PHP = shutil.which('php')
+
+
+def php_has_pdo_sqlite():
+    if not PHP: return False
+    reply = subprocess.run([PHP,'-m'],capture_output=True,text=True)
+    return 'pdo_sqlite' in reply.stdout
+
+
+def php_source(html_root):
+    with open(os.path.join(html_root,'weewxsqlupload.php'),'rt') as f:
+        return f.read()
+
+
+def test_cache_dir_escaped(run_generator, html_root):
+    run_generator(php_cache='files',php_cache_dir='/tmp/we"ird$dir',
+                  password='pass"$word')
+    source = php_source(html_root)
+    assert '$cachedir = "/tmp/we\\"ird\\$dir";' in source
+    assert '"pass\\"\\$word"' in source
+    # no objects from cache files
+    assert '"allowed_classes"=>false' in source
+    if PHP:
+        reply = subprocess.run([PHP,'-l',os.path.join(html_root,'weewxsqlupload.php')],
+                               capture_output=True,text=True)
+        assert reply.returncode==0, reply.stdout
+
+
+@pytest.mark.skipif(not php_has_pdo_sqlite(),
+                    reason='php with pdo_sqlite not found')
+def test_foreign_cache_dir_not_used(run_generator, html_root, tmp_path):
+    cachedir = tmp_path / 'cache'
+    cachedir.mkdir()
+    # writable by others
+    os.chmod(str(cachedir),0o777)
+    run_generator(php_cache='files',php_cache_dir=str(cachedir),
+                  php_cache_ttl='3600')
+    # request the page by the PHP command line interpreter
+    request = [PHP,'-d','display_errors=stderr','test.php']
+    subprocess.run(request,cwd=html_root,capture_output=True)
+    assert os.listdir(str(cachedir))==[]
+    os.chmod(str(cachedir),0o700)
+    subprocess.run(request,cwd=html_root,capture_output=True)
+    assert os.listdir(str(cachedir))
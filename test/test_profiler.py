@@ -0,0 +1,76 @@
+# Profiling of report cycles and LOOP packets on demand
+
+import os
+import pstats
+
+import user.sqlupload as sqlupload
+
+
+class NoProfile(object):
+    """ stands in for cProfile, which must not be used """
+    def Profile(self):
+        raise AssertionError('profiler created')
+
+
+def profiles(profile_dir, ext='.pstats'):
+    try:
+        return sorted(fn for fn in os.listdir(profile_dir) if fn.endswith(ext))
+    except FileNotFoundError:
+        return []
+
+
+def test_profile_by_flag_file(run_generator, html_root, tmp_path):
+    profile_dir = str(tmp_path / 'profiles')
+    options = {'SQLuploadGenerator':{'profile_dir':profile_dir}}
+    run_generator(**options)
+    assert profiles(profile_dir)==[]
+    with open(os.path.join(html_root,'#SQLupload.profile'),'wt') as f:
+        f.write('1')
+    run_generator(first_run=False,**options)
+    assert not os.path.exists(os.path.join(html_root,'#SQLupload.profile'))
+    files = profiles(profile_dir)
+    assert len(files)==1
+    assert files[0].startswith('sqlupload-report-')
+    stats = pstats.Stats(os.path.join(profile_dir,files[0]))
+    assert any(func[2]=='run_cycle' for func in stats.stats)
+    with open(os.path.join(profile_dir,files[0][:-7]+'.txt'),'rt') as f:
+        summary = f.read()
+    assert summary.startswith('1 call\n')
+    assert 'run_cycle' in summary
+
+
+def test_profile_at_startup(run_generator, tmp_path):
+    profile_dir = str(tmp_path / 'profiles')
+    run_generator(SQLuploadGenerator={'profile_dir':profile_dir,'profile':'1'})
+    assert len(profiles(profile_dir))==1
+    # once only
+    run_generator(first_run=False,
+                  SQLuploadGenerator={'profile_dir':profile_dir,'profile':'1'})
+    assert len(profiles(profile_dir))==1
+
+
+def test_disabled(run_generator, tmp_path, monkeypatch):
+    monkeypatch.setattr(sqlupload,'cProfile',NoProfile())
+    profile_dir = str(tmp_path / 'profiles')
+    run_generator(SQLuploadGenerator={'profile_dir':profile_dir})
+    assert not os.path.exists(profile_dir)
+    profiler = sqlupload.SQLprofiler('test',None,profile_dir)
+    assert profiler.call(lambda x, y=0: x+y,1,y=2)==3
+    assert profiler.profile is None
+
+
+def test_aggregate(tmp_path):
+    profile_dir = str(tmp_path / 'profiles')
+    flag_file = str(tmp_path / 'flag')
+    profiler = sqlupload.SQLprofiler('loop',flag_file,profile_dir,
+                                     default_count=3,aggregate=True)
+    with open(flag_file,'wt') as f:
+        f.write('')
+    for i in range(3):
+        assert profiler.call(sum,[i,1])==i+1
+        assert len(profiles(profile_dir))==(1 if i==2 else 0)
+    with open(os.path.join(profile_dir,profiles(profile_dir,'.txt')[0])) as f:
+        assert f.readline()=='3 calls\n'
+    # back to plain calls
+    profiler.call(sum,[1])
+    assert profiler.profile is None
@@ -0,0 +1,95 @@
+# rain sums of the LOOP upload service out of memory
+
+import queue
+import random
+import time
+
+import pytest
+
+import weewx
+import weewx.manager
+import weewx.restx
+import weewx.schemas.wview_extended
+import weeutil.weeutil
+
+import user.sqlupload as sqlupload
+
+INTERVAL = 300
+
+
+@pytest.fixture
+def dbmanager(tmp_path):
+    manager = weewx.manager.Manager.open_with_create(
+        {'driver':'weedb.sqlite','database_name':str(tmp_path / 'weewx.sdb')},
+        table_name='archive',schema=weewx.schemas.wview_extended.schema)
+    yield manager
+    manager.close()
+
+
+def archive_record(ts, rng):
+    # binary fractions, so that the sums do not depend on the order
+    return {'dateTime':ts,'usUnits':weewx.METRIC,'interval':INTERVAL//60,
+            'rain':rng.choice([None,0.0,0.0,0.25,0.5,1.125])}
+
+
+def compare(thread, dbmanager, record):
+    expected = weewx.restx.RESTThread.get_record(thread,record,dbmanager)
+    assert thread.get_record(record,dbmanager)==expected
+    return expected
+
+
+def new_thread():
+    return sqlupload.SQLloopThread(queue.Queue(),database_name='weewx-web.sdb',
+                                   table_name='web',dry_run=True)
+
+
+@pytest.mark.parametrize('bound',[True,False])
+def test_same_as_get_record(dbmanager, bound):
+    rng = random.Random(1)
+    # 26 hours across midnight
+    start_ts = weeutil.weeutil.startOfDay(time.time())-22*3600
+    for ts in range(start_ts-4*3600,start_ts+1,INTERVAL):
+        dbmanager.addRecord(archive_record(ts,rng))
+    thread = new_thread()
+    nonzero = 0
+    for ts in range(start_ts,start_ts+26*3600,INTERVAL):
+        # LOOP packets of the archive interval ending at `ts+INTERVAL`
+        for packet_ts in range(ts+15 if bound else ts+20,ts+INTERVAL+1,35):
+            packet = {'dateTime':packet_ts,'usUnits':weewx.METRIC,
+                      'rain':rng.choice([None,0.0,0.125])}
+            result = compare(thread,dbmanager,packet)
+            if result['rain24']: nonzero += 1
+        record = archive_record(ts+INTERVAL,rng)
+        dbmanager.addRecord(record)
+        if bound:
+            record['#TYPE'] = 'ARCHIVE'
+            compare(thread,dbmanager,record)
+    assert nonzero
+
+
+def test_resync_once_per_interval(dbmanager):
+    rng = random.Random(2)
+    start_ts = (int(time.time())//INTERVAL)*INTERVAL-10*INTERVAL
+    for ts in range(start_ts-12*INTERVAL,start_ts+INTERVAL,INTERVAL):
+        dbmanager.addRecord(archive_record(ts,rng))
+    thread = new_thread()
+    accumulator = thread.rain_accumulator
+    syncs = []
+    sync = accumulator.sync
+    def counting_sync(dbmanager, time_ts):
+        syncs.append(time_ts)
+        sync(dbmanager,time_ts)
+    accumulator.sync = counting_sync
+    # no archive records for 3 intervals, LOOP packets every 5 seconds
+    for packet_ts in range(start_ts+5,start_ts+4*INTERVAL,5):
+        compare(thread,dbmanager,{'dateTime':packet_ts,
+                                  'usUnits':weewx.METRIC,'rain':0.0})
+    assert len(syncs)==4
+    # the archive records are saved after the outage
+    for ts in range(start_ts+INTERVAL,start_ts+5*INTERVAL,INTERVAL):
+        dbmanager.addRecord(archive_record(ts,rng))
+    for packet_ts in range(start_ts+4*INTERVAL+10,start_ts+5*INTERVAL,5):
+        compare(thread,dbmanager,{'dateTime':packet_ts,
+                                  'usUnits':weewx.METRIC,'rain':0.0})
+    assert len(syncs)==5
+    assert accumulator.last_ts==start_ts+4*INTERVAL
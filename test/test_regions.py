@@ -0,0 +1,44 @@
+# Dynamic regions of HTML pages
+
+import os
+import shutil
+import sqlite3
+import subprocess
+
+import pytest
+
+import user.sqlupload as sqlupload
+
+
+def test_php_escape():
+    assert sqlupload.php_escape('file1#2') == 'file1#2'
+    assert sqlupload.php_escape('a"b$c\\d') == 'a\\"b\\$c\\\\d'
+
+
+def test_region_ids_escaped(run_generator, html_root, sqlite_root):
+    section = 'we"ird$page'
+    run_generator({section: {'file': 'test.html',
+                             'html_dynamic_regions': ['div', 'a']}})
+    with open(os.path.join(html_root, 'test.php'), 'rt') as f:
+        php = f.read()
+    assert '$ids=array("we\\"ird\\$page#1","we\\"ird\\$page#2")' in php
+    assert '$texts["we\\"ird\\$page#1"]' in php
+    db = sqlite3.connect(os.path.join(sqlite_root, 'weewx-web.sdb'))
+    ids = sorted(row[0] for row in db.execute('SELECT `ID` FROM web'))
+    assert ids == ['we"ird$page#1', 'we"ird$page#2']
+    php_cmd = shutil.which('php')
+    if php_cmd:
+        reply = subprocess.run([php_cmd, '-l', os.path.join(html_root, 'test.php')],
+                               capture_output=True, text=True)
+        assert reply.returncode == 0, reply.stdout
+
+
+@pytest.mark.parametrize('hashlib_available', [True, False])
+def test_long_region_ids(monkeypatch, hashlib_available):
+    monkeypatch.setattr(sqlupload, 'has_hashlib', hashlib_available)
+    section = 'a_very_long_section_name_of_a_page'
+    regions = sqlupload.SQLuploadGenerator.get_regions(
+        None, {'html_dynamic_regions': ['div', 'a']}, section)
+    ids = [region[0] for region in regions]
+    assert all(len(id) <= 32 for id in ids)
+    assert len(set(ids)) == 2
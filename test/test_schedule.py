@@ -0,0 +1,65 @@
+# Order of the sections and the time budget of a report cycle
+
+import json
+import os
+import sqlite3
+
+import configobj
+
+import user.sqlupload as sqlupload
+
+
+def records(sqlite_root):
+    with sqlite3.connect(os.path.join(sqlite_root,'weewx-web.sdb')) as conn:
+        return set(row[0] for row in conn.execute('SELECT `ID` FROM web'))
+
+
+def deferred(html_root):
+    with open(os.path.join(html_root,'#SQLupload.last')) as f:
+        return json.load(f)['deferred']
+
+
+def test_priority_order(run_generator, html_root):
+    gen = run_generator()
+    generator_dict = configobj.ConfigObj({
+        'pngfile':{'file':'partly-cloudy-day.png'},
+        'file2':{'file':'test.html'},
+        'file1':{'file':'index.html'},
+        'skin':{'file':'skintestfile.html','priority':'5'},
+    })
+    last = sqlupload.SQLlastUpload(html_root)
+    # home page, explicit priority, other pages, images
+    assert gen.schedule_sections(generator_dict,html_root,last)==[
+                                         'file1','skin','file2','pngfile']
+    # deferred sections first, the more often deferred the earlier
+    last.add_deferred('pngfile')
+    last.add_deferred('pngfile')
+    last.add_deferred('file2')
+    assert gen.schedule_sections(generator_dict,html_root,last)==[
+                                         'pngfile','file2','file1','skin']
+
+
+def test_time_budget(run_generator, html_root, sqlite_root):
+    # The budget is used up by the first section, but one section is
+    # processed each cycle.
+    options = {'SQLuploadGenerator':{'cycle_time_budget':'0.000001'}}
+    run_generator(first_run=True,**options)
+    assert records(sqlite_root)=={'file1'}
+    assert deferred(html_root)=={'file2':1,'pngfile':1}
+    # The deferred sections are processed by the next cycles, although
+    # it is not the first run and their files did not change.
+    run_generator(first_run=False,**options)
+    assert records(sqlite_root)=={'file1','file2'}
+    assert deferred(html_root)=={'pngfile':2}
+    run_generator(first_run=False,**options)
+    assert records(sqlite_root)=={'file1','file2','pngfile'}
+    assert deferred(html_root)=={}
+    # nothing to do
+    run_generator(first_run=False,**options)
+    assert deferred(html_root)=={}
+
+
+def test_no_time_budget(run_generator, html_root, sqlite_root):
+    run_generator(first_run=True)
+    assert records(sqlite_root)=={'file1','file2','pngfile'}
+    assert deferred(html_root)=={}
@@ -0,0 +1,91 @@
+# Spool file for records while the database server is down
+
+import os
+import sqlite3
+import time
+
+import weedb
+
+import user.sqlupload as sqlupload
+
+
+def server_down(monkeypatch):
+    def connect(self):
+        raise weedb.CannotConnectError('server down')
+    monkeypatch.setattr(sqlupload.SQLiteBackend,'connect',connect)
+
+
+def change_page(html_root, text):
+    page = os.path.join(html_root,'test.html')
+    with open(page,'rt') as f:
+        html = f.read()
+    with open(page,'wt') as f:
+        f.write(html.replace('</body>','<p>%s</p></body>' % text))
+    os.utime(page,(time.time()+5,time.time()+5))
+
+
+class RecordingConnection(object):
+    """ statements executed instead of a database connection """
+    def __init__(self, fail_at_commit=None):
+        self.statements = []
+        self.commits = 0
+        self.fail_at_commit = fail_at_commit
+    def begin(self):
+        pass
+    def execute(self, sql, args=()):
+        self.statements.append((sql,args))
+    def commit(self):
+        self.commits += 1
+        if self.commits==self.fail_at_commit:
+            raise weedb.DisconnectError('server gone')
+    def rollback(self):
+        pass
+
+
+def test_spool_while_down(run_generator, html_root, sqlite_root, monkeypatch):
+    with monkeypatch.context() as m:
+        server_down(m)
+        run_generator(first_run=True)
+        change_page(html_root,'first change')
+        run_generator(first_run=False)
+        change_page(html_root,'second change')
+        run_generator(first_run=False)
+    spool = sqlupload.SQLspool(html_root)
+    with open(spool.spool_file_path,'rb') as f:
+        assert f.read().count(b'"id": "file2"')==3
+    # superseded versions are dropped
+    records = spool.load()
+    assert sorted(records)==['file1','file2','pngfile']
+    assert b'second change' in records['file2'][0]
+    # the server is up again
+    run_generator(first_run=False)
+    assert not spool.exists()
+    with sqlite3.connect(os.path.join(sqlite_root,'weewx-web.sdb')) as conn:
+        rows = dict(conn.execute('SELECT `ID`,`TEXT` FROM web').fetchall())
+    assert sorted(rows)==['file1','file2','pngfile']
+    assert rows['file2']==records['file2'][0]
+
+
+def test_replay_order(tmp_path):
+    spool = sqlupload.SQLspool(str(tmp_path))
+    for id, data in (('a','a1'),('b','b1'),('c','c1'),('a','a2')):
+        spool.append(id,data,'text/plain',1700000000,None)
+    conn = RecordingConnection()
+    assert spool.replay(conn,'web','INSERT','UPDATE',batch_size=2,
+                        log_success=False)==3
+    # in the order of the latest version, each ID once
+    updates = [args for sql, args in conn.statements if sql=='UPDATE']
+    assert [(args[4],args[0]) for args in updates]==[
+                                        ('b',b'b1'),('c',b'c1'),('a',b'a2')]
+    assert conn.commits==2
+    assert not spool.exists()
+
+
+def test_replay_failure_keeps_rest(tmp_path):
+    spool = sqlupload.SQLspool(str(tmp_path))
+    for id in ('a','b','c'):
+        spool.append(id,id,'text/plain',1700000000,None)
+    conn = RecordingConnection(fail_at_commit=2)
+    assert spool.replay(conn,'web','INSERT','UPDATE',batch_size=2,
+                        log_success=False,log_failure=False)==2
+    assert list(spool.load())==['c']
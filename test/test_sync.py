@@ -0,0 +1,68 @@
+# `sync` command and its verification against SQLite
+
+import os
+import sqlite3
+
+import user.sqlupload as sqlupload
+
+
+def server_records(sqlite_root):
+    with sqlite3.connect(os.path.join(sqlite_root,'weewx-web.sdb')) as conn:
+        return dict(conn.execute('SELECT `ID`,`HASH` FROM web').fetchall())
+
+
+def test_sync_resumes(run_generator, html_root, sqlite_root, monkeypatch):
+    checkpoint_file = os.path.join(html_root,'#SQLupload.sync')
+    # The upload of the image fails, so the run is to be resumed.
+    upload = sqlupload.SQLsyncWorker.upload
+    def failing_upload(self, conn, batch, max_record_size):
+        if any(item[0]=='pngfile' for item in batch):
+            self.sync.fail(len(batch))
+            return conn
+        return upload(self,conn,batch,max_record_size)
+    with monkeypatch.context() as m:
+        m.setattr(sqlupload.SQLsyncWorker,'upload',failing_upload)
+        sync = sqlupload.SQLsync(connections=2,batch_size=1)
+        run_generator(sync=sync)
+    assert sync.report()==1
+    # SQLite allows one writer only
+    assert sync.connections==1
+    assert sync.records==2
+    assert sorted(server_records(sqlite_root))==['file1','file2']
+    assert sorted(sync.load())==['file1','file2']
+    # the next run skips the records uploaded before
+    sync = sqlupload.SQLsync(connections=2,batch_size=1)
+    run_generator(first_run=False,sync=sync)
+    assert sync.report()==0
+    assert sync.resumed==2
+    assert sync.records==1
+    assert not os.path.exists(checkpoint_file)
+    last = sqlupload.SQLlastUpload(html_root)
+    assert server_records(sqlite_root)==last.hash_dict
+
+
+def test_sync_restart(run_generator, html_root, sqlite_root):
+    run_generator(sync=sqlupload.SQLsync(batch_size=2))
+    sync = sqlupload.SQLsync(batch_size=2,restart=True)
+    # a checkpoint file left over
+    with open(os.path.join(html_root,'#SQLupload.sync'),'wt') as f:
+        f.write('["file1", "hash", 0]\n')
+    run_generator(first_run=False,sync=sync)
+    assert sync.resumed==0
+    assert sync.records==3
+
+
+def test_verify(run_generator, sqlite_root, capsys):
+    gen = run_generator()
+    assert sqlupload.verify(gen.config_dict,gen.skin_dict)==0
+    assert '3 records checked, 0 missing, 0 different, 0 unknown' in capsys.readouterr().out
+    with sqlite3.connect(os.path.join(sqlite_root,'weewx-web.sdb')) as conn:
+        conn.execute("UPDATE web SET `HASH`='other' WHERE `ID`='file1'")
+        conn.execute("DELETE FROM web WHERE `ID`='pngfile'")
+        conn.execute("INSERT INTO web(`ID`,`HASH`) VALUES ('stray','x')")
+    assert sqlupload.verify(gen.config_dict,gen.skin_dict)==1
+    out = capsys.readouterr().out
+    assert 'missing on server: pngfile' in out
+    assert 'different hash:    file1' in out
+    assert 'unknown locally:   stray' in out
+    assert '3 records checked, 1 missing, 1 different, 1 unknown' in out
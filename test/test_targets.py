@@ -0,0 +1,62 @@
+# Additional upload targets
+#
+# The servers are stood in for by SQLite database files. A server is
+# unreachable as long as a file blocks the directory of its database.
+
+import json
+import os
+import sqlite3
+
+import user.sqlupload as sqlupload
+
+
+def records(sqlite_root):
+    with sqlite3.connect(os.path.join(sqlite_root,'weewx-web.sdb')) as conn:
+        return dict(conn.execute('SELECT `ID`,`HASH` FROM web').fetchall())
+
+
+def state(html_root, name):
+    with open(os.path.join(html_root,'#SQLupload-%s.last' % name)) as f:
+        return json.load(f)
+
+
+def test_mirror_recovers(run_generator, html_root, sqlite_root, tmp_path):
+    mirror_root = str(tmp_path / 'MIRROR')
+    targets = {'SQLuploadTargets':{'mirror':{'SQLITE_ROOT':mirror_root}}}
+    # the mirror is down
+    with open(mirror_root,'wt') as f:
+        f.write('blocked')
+    run_generator(first_run=True,**targets)
+    primary = records(sqlite_root)
+    assert set(primary)=={'file1','file2','pngfile'}
+    assert state(html_root,'mirror')['timestamp']=={}
+    # Nothing changed, but the files are processed again for the mirror.
+    gen = run_generator(first_run=False,**targets)
+    assert gen.targets[0].failed
+    assert state(html_root,'mirror')['timestamp']=={}
+    # the mirror is up again
+    os.unlink(mirror_root)
+    os.mkdir(mirror_root)
+    gen = run_generator(first_run=False,**targets)
+    assert not gen.targets[0].failed
+    assert gen.targets[0].uploaded==3
+    assert records(mirror_root)==primary
+    mirror_timestamps = state(html_root,'mirror')['timestamp']
+    assert set(mirror_timestamps)=={'index.html','test.html',
+                                             'partly-cloudy-day.png'}
+    # the mirror is up to date
+    gen = run_generator(first_run=False,**targets)
+    assert gen.targets[0].uploaded==0
+    assert state(html_root,'mirror')['timestamp']==mirror_timestamps
+
+
+def test_targets_behind(run_generator, html_root, tmp_path):
+    mirror_root = str(tmp_path / 'MIRROR')
+    os.mkdir(mirror_root)
+    gen = run_generator(first_run=True,
+                SQLuploadTargets={'mirror':{'SQLITE_ROOT':mirror_root}})
+    last = sqlupload.SQLlastUpload(html_root)
+    assert not gen.targets_behind(last,'index.html')
+    gen.targets[0].sql_last_upload.timestamp_dict.pop('index.html')
+    assert gen.targets_behind(last,'index.html')
+    assert not gen.targets_behind(last,'test.html')
@@ -0,0 +1,40 @@
+# State saved after uploading a file
+
+import json
+import os
+import sqlite3
+
+import user.sqlupload as sqlupload
+
+
+def load_state(html_root):
+    with open(os.path.join(html_root,'#SQLupload.last')) as f:
+        return json.load(f)
+
+
+def test_failed_upload_not_recorded(run_generator, html_root, sqlite_root,
+                                                               monkeypatch):
+    upload_record = sqlupload.upload_record
+    def failing_upload_record(conn, tablename, sql_upd_str, id, *args, **kwargs):
+        if id=='file2':
+            raise ValueError("record '%s' cannot be split into chunks" % id)
+        return upload_record(conn,tablename,sql_upd_str,id,*args,**kwargs)
+    monkeypatch.setattr(sqlupload,'upload_record',failing_upload_record)
+    options = {'SQLuploadGenerator':{'refresh_interval':'3600'}}
+    run_generator(first_run=True,**options)
+    state = load_state(html_root)
+    assert 'index.html' in state['timestamp']
+    assert 'test.html' not in state['timestamp']
+    assert 'file1' in state['checked']
+    assert 'file2' not in state['checked']
+    assert 'file2' not in state['hash']
+    # the next report cycle uploads the file, although it did not change
+    # and its refresh interval did not elapse
+    monkeypatch.setattr(sqlupload,'upload_record',upload_record)
+    run_generator(first_run=False,**options)
+    state = load_state(html_root)
+    assert 'test.html' in state['timestamp']
+    assert 'file2' in state['hash']
+    with sqlite3.connect(os.path.join(sqlite_root,'weewx-web.sdb')) as conn:
+        text = conn.execute("SELECT `TEXT` FROM web WHERE `ID`='file2'").fetchone()[0]
+    assert text